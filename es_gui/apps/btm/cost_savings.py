@@ -599,6 +599,7 @@ class CostSavingsWizardExecute(Screen):
         # Send requests to handler.
         handler = btm_home.handler
         handler.solver_name = App.get_running_app().config.get('optimization', 'solver')
+        handler.n_workers = App.get_running_app().config.getint('optimization', 'n_workers')
         self.solved_ops, handler_status = handler.process_requests(op_handler_requests)
 
         # If no optimizations were solved successfully, bail out.
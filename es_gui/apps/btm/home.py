@@ -24,11 +24,24 @@ class BehindTheMeterHomeScreen(Screen):
             max_memory=App.get_running_app().config.getint('btm', 'btm_dms_size')*1000,
             save_data=bool(App.get_running_app().config.getint('btm', 'btm_dms_save')),
             save_name='btm_dms.p',
+            mmap_dir='btm_dms_mmap' if App.get_running_app().config.getint('btm', 'btm_dms_mmap') else None,
             home_path='data',
             )
-        self.handler = BtmOptimizerHandler(App.get_running_app().config.get('optimization', 'solver'))
+        self.handler = BtmOptimizerHandler(App.get_running_app().config.get('optimization', 'solver'),
+                                           n_workers=App.get_running_app().config.getint('optimization', 'n_workers'))
         self.handler.dms = self.dms
 
+        App.get_running_app().settings.bind(on_config_change=self._on_config_change)
+
+    def _on_config_change(self, settings, config, section, key, value):
+        """Shows the data cache statistics."""
+        if section == 'btm' and key == 'btm_dms_stats':
+            popup = WarningPopup()
+            popup.title = 'Data cache statistics'
+            popup.popup_text.text = self.dms.stats_summary()
+            popup.dismiss_button.text = 'Close'
+            popup.open()
+
     def on_enter(self):
         ab = self.manager.nav_bar
         ab.reset_nav_bar()
@@ -3,22 +3,34 @@ from __future__ import absolute_import
 import logging
 from datetime import datetime
 import calendar
+import os
+from concurrent.futures import ProcessPoolExecutor
 import pyutilib
 import numpy as np
+from pyomo.environ import Var
 
-from kivy.clock import mainthread
-
+from es_gui.tools.optimizer import Optimizer
 from es_gui.tools.btm.btm_optimizer import BtmOptimizer, BadParameterException, IncompatibleDataException
 import es_gui.tools.btm.readutdata as readutdata
 
+# BtmOptimizer attributes holding the bill components computed when processing results.
+BILL_ATTRIBUTES = ('total_bill_with_es', 'total_bill_without_es',
+                   'demand_charge_with_es', 'demand_charge_without_es',
+                   'energy_charge_with_es', 'energy_charge_without_es',
+                   'nem_charge_with_es', 'nem_charge_without_es')
+
+# Fields of the solution returned by a worker process for rebuilding the solved BtmOptimizer.
+SOLUTION_FIELDS = ('results', 'run_stats', 'vars') + BILL_ATTRIBUTES
+
 
 class BtmOptimizerHandler:
     """A handler for creating and solving BtmOptimizer instances as requested."""
     dms = None
     solved_ops = []
 
-    def __init__(self, solver_name):
+    def __init__(self, solver_name, n_workers=None):
         self._solver_name = solver_name
+        self.n_workers = n_workers
 
     @property
     def solver_name(self):
@@ -29,6 +41,18 @@ class BtmOptimizerHandler:
     def solver_name(self, value):
         self._solver_name = value
 
+    @property
+    def n_workers(self):
+        """The number of worker processes for solving models in parallel, defaults to one per CPU core; 1 solves models one at a time."""
+        return self._n_workers
+
+    @n_workers.setter
+    def n_workers(self, value):
+        if not value:
+            value = os.cpu_count() or 1
+
+        self._n_workers = int(value)
+
     def process_requests(self, op_handler_requests, *args):
         """Generates and solves BtmOptimizer models based on the given requests."""
         dms = self.dms
@@ -54,72 +78,125 @@ class BtmOptimizerHandler:
 
         rate_df = readutdata.input_df(year, weekday_energy_schedule, weekend_energy_schedule, weekday_demand_schedule, weekend_demand_schedule)
 
-        for ix, month in enumerate(calendar.month_abbr[1:], start=1):
-            param_set_iterator = iter(param_set)
-            continue_param_loop = True
+        tou_energy_rate = [x[1] for x in rate_structure['energy rate structure']['energy rates'].items()]
+        tou_demand_rate = [x[1] for x in rate_structure['demand rate structure']['time of use rates'].items()]
 
-            while continue_param_loop:
-                try:
-                    params = next(param_set_iterator)
-                except StopIteration:
+        # Each job is a month of inputs and one params; the monthly inputs are prepared once and shared by its jobs.
+        jobs = []
+
+        for ix, month in enumerate(calendar.month_abbr[1:], start=1):
+            # Get data.
+            # TODO: Move to a DMS. Should the omission of PV profile data be handled by the BtmOptimizer?
+            load_profile = self.dms.get_load_profile_data(load_profile_path['path'], ix)
+
+            try:
+                pv_profile = self.dms.get_pv_profile_data(pv_profile_path['path'], ix)
+            except KeyError:
+                pv_profile = np.zeros(len(load_profile))
+
+            # Build op inputs.
+            rate_df_month = rate_df.loc[rate_df['month'] == ix]
+
+            op_inputs = {'tou_energy_schedule': rate_df_month['tou_energy_schedule'].values,
+                         'tou_demand_schedule': rate_df_month['tou_demand_schedule'].values,
+                         'tou_energy_rate': tou_energy_rate,
+                         'tou_demand_rate': tou_demand_rate,
+                         'flat_demand_rate': rate_structure['demand rate structure']['flat rates'][month],
+                         'nem_type': nem_type,
+                         'nem_rate': nem_rate,
+                         'load_profile': load_profile,
+                         'pv_profile': pv_profile,
+                         'rate_structure_metadata': rate_structure,
+                         'load_profile_metadata': load_profile_path,
+                         'pv_profile_metadata': pv_profile_path}
+
+            for params in param_set:
+                jobs.append((month, op_inputs, params))
+
+                if not params:
                     break
 
-                op = BtmOptimizer()
+        n_workers = min(self.n_workers, len(jobs))
 
-                # Get data.
-                # TODO: Move to a DMS. Should the omission of PV profile data be handled by the BtmOptimizer?
-                load_profile = self.dms.get_load_profile_data(load_profile_path['path'], ix)
+        if n_workers > 1:
+            job_outcomes = self._run_jobs_parallel(jobs, n_workers)
+        else:
+            job_outcomes = (_solve_btm_job(self.solver_name, op_inputs, params) for _, op_inputs, params in jobs)
 
-                try:
-                    pv_profile = self.dms.get_pv_profile_data(pv_profile_path['path'], ix)
-                except KeyError:
-                    pv_profile = np.zeros(len(load_profile))
+        # Outcomes are collected in submission order so that results are in calendar order.
+        for (month, _, params), (solved_op, error) in zip(jobs, job_outcomes):
+            if error is not None:
+                if error:
+                    logging.error(error)
 
-                # Build op inputs.
-                rate_df_month = rate_df.loc[rate_df['month'] == ix]
+                handler_status = False
+            else:
+                solved_op = self._save_to_solved_ops(solved_op, month, params)
+                solved_requests.append(solved_op)
 
-                # Populate op.
-                op.tou_energy_schedule = rate_df_month['tou_energy_schedule'].values
-                op.tou_demand_schedule = rate_df_month['tou_demand_schedule'].values
+        logging.info('Op Handler: Finished processing requested jobs.')
+        return solved_requests, handler_status
 
-                op.tou_energy_rate = [x[1] for x in rate_structure['energy rate structure']['energy rates'].items()]
-                op.tou_demand_rate = [x[1] for x in rate_structure['demand rate structure']['time of use rates'].items()]
-                op.flat_demand_rate = rate_structure['demand rate structure']['flat rates'][month]
+    def _run_jobs_parallel(self, jobs, n_workers):
+        """Solves the jobs in a pool of worker processes. Returns the outcomes of each job in the order given."""
+        logging.info('Op Handler: Solving {n} jobs with {workers} worker processes.'.format(n=len(jobs), workers=n_workers))
 
-                op.nem_type = nem_type
-                op.nem_rate = nem_rate
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            futures = [executor.submit(_solve_btm_job_remote, self.solver_name, op_inputs, params, Optimizer.stats_log)
+                       for _, op_inputs, params in jobs]
 
-                op.load_profile = load_profile
-                op.pv_profile = pv_profile
-                op.rate_structure_metadata = rate_structure
-                op.load_profile_metadata = load_profile_path
-                op.pv_profile_metadata = pv_profile_path
+            payloads = [future.result() for future in futures]
 
-                if params:
-                    op.set_model_parameters(**params)
-                else:
-                    continue_param_loop = False
+        job_outcomes = []
 
+        for (_, op_inputs, params), (solution, error) in zip(jobs, payloads):
+            if error is None:
                 try:
-                    solved_op = self._solve_model(op)
-                except pyutilib.common._exceptions.ApplicationError as e:
-                    logging.error('Op Handler: Something went wrong when solving: ({error})'.format(error=e))
-                    handler_status = False
-                except AssertionError as e:
-                    handler_status = False
-                except IncompatibleDataException as e:
-                    logging.error(e)
-                    handler_status = False
-                else:
-                    solved_op = self._save_to_solved_ops(solved_op, month, params)
-                    solved_requests.append(solved_op)
+                    job_outcomes.append((self._rebuild_op(op_inputs, params, solution), None))
+                except IncompleteSolutionException as e:
+                    job_outcomes.append((None, str(e)))
+            else:
+                job_outcomes.append((None, error))
 
-        logging.info('Op Handler: Finished processing requested jobs.')
-        return solved_requests, handler_status
+        return job_outcomes
 
-    def _solve_model(self, op):
-        op.solver = self.solver_name
-        op.run()
+    def _rebuild_op(self, op_inputs, params, solution):
+        """Rebuilds a solved BtmOptimizer from the solution returned by a worker process, since Pyomo models do not survive pickling.
+
+        The model is instantiated with its params and vars from the same inputs, but not its constraints. The value of every var and every field in SOLUTION_FIELDS is taken from the solution; an IncompleteSolutionException is raised if any of them is missing.
+        """
+        missing = [field for field in SOLUTION_FIELDS if field not in solution]
+
+        if missing:
+            raise(IncompleteSolutionException('Op Handler: The solution returned by the worker is missing {0}.'.format(', '.join(missing))))
+
+        op = BtmOptimizer(solver=self.solver_name, **op_inputs)
+
+        if params:
+            op.set_model_parameters(**params)
+
+        op.instantiate_model()
+        op._set_model_param()
+        op._set_model_var()
+
+        m = op.model
+
+        for var in m.component_objects(Var):
+            try:
+                values = solution['vars'][var.local_name]
+            except KeyError:
+                raise(IncompleteSolutionException('Op Handler: The solution returned by the worker is missing the values of {0}.'.format(var.local_name)))
+
+            if set(values) != set(var.keys()):
+                raise(IncompleteSolutionException('Op Handler: The solution returned by the worker does not match the indices of {0}.'.format(var.local_name)))
+
+            var.set_values(values, skip_validation=True)
+
+        op.results = solution['results']
+        op.run_stats = solution['run_stats']
+
+        for attr in BILL_ATTRIBUTES:
+            setattr(op, attr, solution[attr])
 
         return op
 
@@ -170,4 +247,45 @@ class BtmOptimizerHandler:
         return_list = reversed(self.solved_ops)
 
         return return_list
-    
\ No newline at end of file
+
+
+def _solve_btm_job(solver_name, op_inputs, params):
+    """Builds and solves a BtmOptimizer model for one month of inputs and params. Returns a (solved_op, error) tuple where error is None if the model was solved."""
+    op = BtmOptimizer(solver=solver_name, **op_inputs)
+
+    if params:
+        op.set_model_parameters(**params)
+
+    try:
+        op.run()
+    except pyutilib.common._exceptions.ApplicationError as e:
+        return None, 'Op Handler: Something went wrong when solving: ({error})'.format(error=e)
+    except AssertionError as e:
+        return None, 'Op Handler: An optimal solution could not be obtained. ({error})'.format(error=e)
+    except IncompatibleDataException as e:
+        return None, str(e)
+
+    return op, None
+
+
+def _solve_btm_job_remote(solver_name, op_inputs, params, stats_log=None):
+    """Worker process entry point for _solve_btm_job. Returns a (solution, error) tuple, which can be pickled. The solution is a dictionary of the fields in SOLUTION_FIELDS, where 'vars' holds the values of each var of the model keyed by var name."""
+    # Class attributes are not inherited by spawned worker processes.
+    Optimizer.stats_log = stats_log
+
+    op, error = _solve_btm_job(solver_name, op_inputs, params)
+
+    if error is not None:
+        return None, error
+
+    solution = {'results': op.results, 'run_stats': op.run_stats,
+                'vars': {var.local_name: var.extract_values() for var in op.model.component_objects(Var)}}
+
+    for attr in BILL_ATTRIBUTES:
+        solution[attr] = getattr(op, attr)
+
+    return solution, None
+
+
+class IncompleteSolutionException(Exception):
+    pass
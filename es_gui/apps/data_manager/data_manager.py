@@ -8,13 +8,13 @@ import threading
 import logging
 import copy
 
-import pandas as pd
 from kivy.app import App
 from kivy.animation import Animation
 from kivy.event import EventDispatcher
 from kivy.properties import NumericProperty
 
 from es_gui.resources.widgets.common import LoadingModalView
+from es_gui.tools.node_registry import node_registry
 
 
 DATA_HOME = 'data'
@@ -534,8 +534,7 @@ class DataManager(EventDispatcher):
         if 'LBMP' in os.listdir(nyiso_root):
             nyiso_data_bank['LBMP'] = {}
 
-            pathf_nodeszones = os.path.join('es_gui', 'apps', 'data_manager', '_static', 'nodes_nyiso.csv')
-            df_nodeszones = pd.read_csv(pathf_nodeszones, index_col=False)
+            df_nodeszones = node_registry.table('NYISO')
 
             # Get zone and gen nodes.
             df_zone_nodes = df_nodeszones.loc[df_nodeszones['Node ID'] == df_nodeszones['Zone ID'], :]
@@ -691,8 +690,7 @@ class DataManager(EventDispatcher):
         if 'LMP' in os.listdir(spp_root):
             spp_data_bank['LMP'] = {}
 
-            pathf_nodes = os.path.join('es_gui', 'apps', 'data_manager', '_static', 'nodes_spp.csv')
-            df_nodes = pd.read_csv(pathf_nodes, index_col=False)
+            df_nodes = node_registry.table('SPP')
 
             # Get location and bus nodes.
             df_loc_nodes = df_nodes.loc[df_nodes['Node Type'] == 'Location', :]
@@ -864,14 +862,11 @@ class DataManager(EventDispatcher):
         """Retrieves all available pricing nodes for the given market_area."""
         if market_area == 'ERCOT':
             # Reads static node ID list.
-            static_ercot_node_list = os.path.join('es_gui', 'apps', 'data_manager', '_static', 'nodes_ercot.csv')
-
-            node_df = pd.read_csv(static_ercot_node_list)
+            node_df = node_registry.table('ERCOT')
             node_dict = {row[0]: row[1] for row in zip(node_df['Node ID'], node_df['Node Name'])}
         elif market_area == 'PJM':
             # Reads static node ID list.
-            static_pjm_node_list = os.path.join('es_gui', 'apps', 'data_manager', '_static', 'nodes_pjm.csv')
-            node_df = pd.read_csv(static_pjm_node_list)
+            node_df = node_registry.table('PJM')
             node_mapping = {str(row[0]): '{nodename} ({nodeid})'.format(nodename=row[1], nodeid=row[0]) for row in zip(node_df['Node ID'], node_df['Node Name'])}
 
             # Reads keys of PJM LMP data bank.
@@ -879,14 +874,11 @@ class DataManager(EventDispatcher):
             node_dict = {node_id: node_mapping.get(node_id, node_id) for node_id in node_id_list}
         elif market_area == 'MISO':
             # Reads static node ID list.
-            static_miso_node_list = os.path.join('es_gui', 'apps', 'data_manager', '_static', 'nodes_miso.csv')
-
-            node_df = pd.read_csv(static_miso_node_list)
+            node_df = node_registry.table('MISO')
             node_dict = {row[0]: row[1] for row in zip(node_df['Node ID'], node_df['Node Name'])}
         elif market_area == 'NYISO':
             # Reads static node ID list.
-            static_nyiso_node_list = os.path.join('es_gui', 'apps', 'data_manager', '_static', 'nodes_nyiso.csv')
-            node_df = pd.read_csv(static_nyiso_node_list)
+            node_df = node_registry.table('NYISO')
             node_mapping = {row[0]: row[1] for row in zip(node_df['Node ID'], node_df['Node Name'])}
 
             # Reads keys of NYISO LBMP data bank.
@@ -894,8 +886,7 @@ class DataManager(EventDispatcher):
             node_dict = {node_id: node_mapping.get(node_id, node_id) for node_id in node_id_list}
         elif market_area == 'ISONE':
             # Reads static node ID list.
-            static_isone_node_list = os.path.join('es_gui', 'apps', 'data_manager', '_static', 'nodes_isone.csv')
-            node_df = pd.read_csv(static_isone_node_list, encoding="cp1252")
+            node_df = node_registry.table('ISONE')
 
             node_dict = {str(row[0]): '{nodename} ({nodeid})'.format(nodename=row[1], nodeid=row[0]) for row in zip(node_df['Node ID'], node_df['Node Name'])}
 
@@ -904,15 +895,9 @@ class DataManager(EventDispatcher):
             node_dict = {node_id: node_dict.get(node_id, node_id) for node_id in node_id_list}
         elif market_area == 'SPP':
             # Reads static node ID list.
-            static_spp_node_list = os.path.join('es_gui', 'apps', 'data_manager', '_static', 'nodes_spp.csv')
-
-            node_df = pd.read_csv(static_spp_node_list)
+            node_df = node_registry.table('SPP')
             node_dict = {row[0]: row[1] for row in zip(node_df['Node ID'], node_df['Node Name'])}
         elif market_area == 'CAISO':
-            # Reads static node ID list.
-            static_caiso_node_list = os.path.join('es_gui', 'apps', 'data_manager', '_static', 'nodes_caiso.csv')
-            node_df = pd.read_csv(static_caiso_node_list)
-
             node_id_list = self.data_bank['valuation']['CAISO']['LMP'].keys()
             node_dict = {node_x: node_x for node_x in node_id_list}
         # Use the PJM pattern of reading data_bank node keys to generate the node_dict (key = value) if no CSV LUT exists.
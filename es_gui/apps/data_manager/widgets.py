@@ -45,6 +45,7 @@ from es_gui.apps.data_manager.data_manager import DataManagerException
 from es_gui.tools.charts import RateScheduleChart
 from es_gui.apps.data_manager.rate_structure import RateStructureDataScreen
 from es_gui.apps.data_manager.utils import check_connection_settings
+from es_gui.tools.node_registry import node_registry
 
 
 MAX_THREADS = 4
@@ -507,17 +508,14 @@ class DataManagerPanelISONE(BoxLayout):
         if not datetime_end:
             datetime_end = datetime_start
     
-        pathlistnodes = path
-        listnodes_file = os.path.join(pathlistnodes, '../es_gui/apps/data_manager/_static/', 'nodes_isone.csv')
-        
         if not nodes:
-            df_listnodes = pd.read_csv(listnodes_file, index_col=False,encoding="cp1252")
+            df_listnodes = node_registry.table('ISONE')
             nodelist = df_listnodes['Node ID']
         else:
             nodelist = []
             for node_x in nodes:
                 if node_x == 'HUBS':
-                    df_listnodes = pd.read_csv(listnodes_file, index_col=False, encoding="cp1252")
+                    df_listnodes = node_registry.table('ISONE')
                     ixzones = df_listnodes['Node ID'] == df_listnodes['Zone ID']
                     zonelist = df_listnodes.loc[ixzones, 'Node ID'].tolist()
                     nodelist = nodelist + zonelist
@@ -1996,16 +1994,14 @@ class DataManagerPanelCAISO(BoxLayout):
         if not datetime_end:
             datetime_end = datetime_start
 
-        pathlistnodes = path
-        listnodes_file = os.path.join(pathlistnodes, '../es_gui/apps/data_manager/_static/', 'nodes_caiso.csv')
         if not nodes:
-            df_listnodes = pd.read_csv(listnodes_file, index_col=False)
+            df_listnodes = node_registry.table('CAISO')
             nodelist = df_listnodes['Node ID']
         else:
             nodelist = []
             for node_x in nodes:
                 if node_x == 'TH' or node_x == 'ASP':
-                    df_listnodes = pd.read_csv(listnodes_file, index_col=False)
+                    df_listnodes = node_registry.table('CAISO')
                     ixnodes_sel = df_listnodes['Node Type'] == node_x
                     selnodelist = df_listnodes.loc[ixnodes_sel, 'Node ID'].tolist()
                     nodelist = nodelist + selnodelist
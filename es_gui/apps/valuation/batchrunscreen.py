@@ -72,6 +72,7 @@ class BatchRunScreen(Screen):
 
             handler = self.manager.get_screen('valuation_home').handler
             handler.solver_name = solver_name
+            handler.n_workers = App.get_running_app().config.getint('optimization', 'n_workers')
 
             try:
                 _, handler_status = handler.process_requests(requests)
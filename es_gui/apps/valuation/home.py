@@ -7,6 +7,7 @@ from kivy.uix.screenmanager import Screen
 from kivy.app import App
 
 from es_gui.tools.valuation.valuation_dms import ValuationDMS
+from es_gui.tools.valuation.result_cache import ResultCache
 from es_gui.resources.widgets.common import WarningPopup
 from .op_handler import ValuationOptimizerHandler
 
@@ -22,10 +23,39 @@ class ValuationHomeScreen(Screen):
         self.dms = ValuationDMS(max_memory=App.get_running_app().config.getint('valuation', 'valuation_dms_size')*1000,
                                 save_data=bool(App.get_running_app().config.getint('valuation', 'valuation_dms_save')),
                                 save_name='valuation_dms.p',
+                                mmap_dir='valuation_dms_mmap' if App.get_running_app().config.getint('valuation', 'valuation_dms_mmap') else None,
                                 home_path='data')
-        self.handler = ValuationOptimizerHandler(App.get_running_app().config.get('optimization', 'solver'))
+        self.handler = ValuationOptimizerHandler(App.get_running_app().config.get('optimization', 'solver'),
+                                                 n_workers=App.get_running_app().config.getint('optimization', 'n_workers'))
         self.handler.dms = self.dms
 
+        # Initialize solved results cache.
+        self.result_cache = ResultCache(cache_dir='valuation_cache',
+                                        max_size=App.get_running_app().config.getint('valuation', 'valuation_cache_size')*1000,
+                                        enabled=bool(App.get_running_app().config.getint('valuation', 'valuation_cache_enabled')))
+        self.handler.result_cache = self.result_cache
+
+        App.get_running_app().settings.bind(on_config_change=self._on_config_change)
+
+    def _on_config_change(self, settings, config, section, key, value):
+        """Applies changes to the results cache settings and shows the data cache statistics."""
+        if section != 'valuation':
+            return
+
+        if key == 'valuation_cache_enabled':
+            self.result_cache.enabled = bool(int(value))
+        elif key == 'valuation_cache_size':
+            self.result_cache.max_size = int(value)*1000
+            self.result_cache.manage_size()
+        elif key == 'valuation_cache_clear':
+            self.result_cache.clear()
+        elif key == 'valuation_dms_stats':
+            popup = WarningPopup()
+            popup.title = 'Data cache statistics'
+            popup.popup_text.text = self.dms.stats_summary()
+            popup.dismiss_button.text = 'Close'
+            popup.open()
+
     def on_enter(self):
         ab = self.manager.nav_bar
         ab.reset_nav_bar()
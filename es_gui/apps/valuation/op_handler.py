@@ -3,20 +3,23 @@ from __future__ import absolute_import
 import logging
 from datetime import datetime
 import calendar
+import os
+from concurrent.futures import ProcessPoolExecutor
 import pyutilib
 
-from kivy.clock import mainthread
-
+from es_gui.tools.optimizer import Optimizer
 from es_gui.tools.valuation.valuation_optimizer import ValuationOptimizer, BadParameterException, IncompatibleDataException
 
 
 class ValuationOptimizerHandler:
     """A handler for creating and solving ValuationOptimizer instances as requested."""
     dms = None
+    result_cache = None
     solved_ops = []
 
-    def __init__(self, solver_name):
+    def __init__(self, solver_name, n_workers=None):
         self._solver_name = solver_name
+        self.n_workers = n_workers
 
     @property
     def solver_name(self):
@@ -27,10 +30,20 @@ class ValuationOptimizerHandler:
     def solver_name(self, value):
         self._solver_name = value
 
+    @property
+    def n_workers(self):
+        """The number of worker processes for solving models in parallel, defaults to one per CPU core; 1 solves models one at a time."""
+        return self._n_workers
+
+    @n_workers.setter
+    def n_workers(self, value):
+        if not value:
+            value = os.cpu_count() or 1
+
+        self._n_workers = int(value)
+
     def process_requests(self, requests, *args):
         """Generates and solves ValuationOptimizer models based on the given requests."""
-        dms = self.dms
-
         iso = requests['iso']
         market_type = requests['market type']
         node_id = str(requests['node id'])
@@ -41,105 +54,189 @@ class ValuationOptimizerHandler:
 
         handler_status = True  # Set to False if any exceptions raised when building or solving ValuationOptimizer model(s).
 
+        # The outcome of each (month, params) in request order, or None if it needs to be solved.
+        slots = []
+
+        # Each job is a month of market data and a chunk of the param set that is not in the result cache.
+        jobs = []
+
         for month, year in requests['months']:
-            param_set_iterator = iter(param_set)
-            continue_param_loop = True
+            market_data = self._get_market_data(iso, year, month, node_id, node_name)
+
+            pending = []
+
+            for params in param_set:
+                outcome = self._get_cached_outcome(market_type, market_data, params)
+                slots.append((month, year, market_data, params, outcome))
+
+                if outcome is None:
+                    pending.append(params)
 
-            while continue_param_loop:
-                try:
-                    params = next(param_set_iterator)
-                except StopIteration:
+                if not params:
                     break
 
-                op = ValuationOptimizer(market_type=market_type)
-
-                if iso == 'PJM':
-                    #lmp_da, RUP, RDW, MR, RA, RD, RegCCP, RegPCP = dms.get_pjm_data(year, month, node_name)
-                    lmp_da, MR, RA, RD, RegCCP, RegPCP = dms.get_pjm_data(year, month, node_id)
-
-                    op.price_electricity = lmp_da
-                    op.mileage_mult = MR
-                    # op.mileage_slow = RA
-                    # op.mileage_fast = RD
-                    op.price_regulation = RegCCP
-                    op.price_reg_service = RegPCP
-                    #op.fraction_reg_up = RUP
-                    #op.fraction_reg_down = RDW
-                elif iso == 'ERCOT':
-                    lmp_da, rd, ru = dms.get_ercot_data(year, month, node_name)
-
-                    op.price_electricity = lmp_da
-                    op.price_reg_up = ru
-                    op.price_reg_down = rd
-                elif iso == 'MISO':
-                    lmp_da, regMCP = dms.get_miso_data(year, month, node_name)
-
-                    op.price_electricity = lmp_da
-                    # op.price_reg_service = regMCP
-                    op.price_regulation = regMCP
-                elif iso == 'ISONE':
-                    daLMP, RegCCP, RegPCP, miMULT = dms.get_isone_data(year, month, node_id)
-
-                    op.price_electricity = daLMP
-                    op.price_regulation = RegCCP
-                    op.price_reg_service = RegPCP
-                    op.mileage_mult = miMULT
-                ########################################################################################################
-                elif iso == 'NYISO':
-                    lbmp_da, rcap_da = dms.get_nyiso_data(year, month, node_id)
-
-                    op.price_electricity = lbmp_da
-                    op.price_regulation = rcap_da
-                elif iso == 'SPP':
-                    lmp_da, mcpru_da, mcprd_da = dms.get_spp_data(year, month, node_name)
-
-                    op.price_electricity = lmp_da
-                    op.price_reg_up = mcpru_da
-                    op.price_reg_down = mcprd_da
-                elif iso == 'CAISO':
-                    lmp_da, aspru_da, asprd_da, asprmu_da, asprmd_da, rmu_mm, rmd_mm, rmu_pacc, rmd_pacc = dms.get_caiso_data(year, month, node_name)
-
-                    op.price_electricity = lmp_da
-                    op.price_reg_up = aspru_da
-                    op.price_reg_down = asprd_da
-                    op.price_reg_serv_up = asprmu_da
-                    op.price_reg_serv_down = asprmd_da
-                    op.mileage_mult_ru = rmu_mm
-                    op.mileage_mult_rd = rmd_mm
-                    op.perf_score_ru = rmu_pacc # TODO: give the option to the user to override this
-                    op.perf_score_rd = rmd_pacc
-                    ########################################################################################################
-                else:
-                    logging.error('ValOp Handler: Invalid ISO provided.')
-                    raise ValueError('Invalid ISO provided to ValuationOptimizer handler.')
+            if pending:
+                for param_chunk in self._chunk_param_set(pending, len(requests['months'])):
+                    jobs.append((month, year, market_data, param_chunk))
 
-                if params:
-                    op.set_model_parameters(**params)
-                else:
-                    continue_param_loop = False
-
-                try:
-                    solved_op = self._solve_model(op)
-                except pyutilib.common._exceptions.ApplicationError as e:
-                    logging.error('ValOp Handler: Something went wrong when solving: ({error})'.format(error=e))
-                    handler_status = False
-                except IncompatibleDataException as e:
-                    logging.error(e)
-                    handler_status = False
-                else:
-                    solved_op = self._save_to_solved_ops(solved_op, iso, market_type, node_name,
-                                                        year, month, params)
-                    solved_requests.append(solved_op)
+        n_workers = min(self.n_workers, len(jobs))
+
+        if n_workers > 1:
+            job_outcomes = self._run_jobs_parallel(jobs, market_type, n_workers)
+        else:
+            job_outcomes = (_solve_valuation_job(market_type, self.solver_name, market_data, param_chunk)
+                            for _, _, market_data, param_chunk in jobs)
+
+        # Jobs are in the same order as the slots that need to be solved.
+        solved_outcomes = (outcome for outcomes in job_outcomes for outcome in outcomes)
+
+        # Outcomes are collected in request order so that results are ordered deterministically.
+        for month, year, market_data, params, outcome in slots:
+            if outcome is None:
+                outcome = next(solved_outcomes)
+                self._put_cached_outcome(market_type, market_data, outcome)
+
+            params, solved_op, error = outcome
+
+            if error is not None:
+                logging.error(error)
+                handler_status = False
+            else:
+                solved_op = self._save_to_solved_ops(solved_op, iso, market_type, node_name,
+                                                    year, month, params)
+                solved_requests.append(solved_op)
 
         logging.info('ValOp Handler: Finished processing requested jobs.')
         return solved_requests, handler_status
 
-    def _solve_model(self, op):
-        op.solver = self.solver_name
-        op.run()
+    def _get_market_data(self, iso, year, month, node_id, node_name):
+        """Retrieves the market data for the given month and node as a dictionary of ValuationOptimizer attribute names and values."""
+        dms = self.dms
+
+        if iso == 'PJM':
+            #lmp_da, RUP, RDW, MR, RA, RD, RegCCP, RegPCP = dms.get_pjm_data(year, month, node_name)
+            lmp_da, MR, RA, RD, RegCCP, RegPCP = dms.get_pjm_data(year, month, node_id)
+
+            market_data = {'price_electricity': lmp_da,
+                           'mileage_mult': MR,
+                           'price_regulation': RegCCP,
+                           'price_reg_service': RegPCP}
+        elif iso == 'ERCOT':
+            lmp_da, rd, ru = dms.get_ercot_data(year, month, node_name)
+
+            market_data = {'price_electricity': lmp_da,
+                           'price_reg_up': ru,
+                           'price_reg_down': rd}
+        elif iso == 'MISO':
+            lmp_da, regMCP = dms.get_miso_data(year, month, node_name)
+
+            market_data = {'price_electricity': lmp_da,
+                           'price_regulation': regMCP}
+        elif iso == 'ISONE':
+            daLMP, RegCCP, RegPCP, miMULT = dms.get_isone_data(year, month, node_id)
+
+            market_data = {'price_electricity': daLMP,
+                           'price_regulation': RegCCP,
+                           'price_reg_service': RegPCP,
+                           'mileage_mult': miMULT}
+        elif iso == 'NYISO':
+            lbmp_da, rcap_da = dms.get_nyiso_data(year, month, node_id)
+
+            market_data = {'price_electricity': lbmp_da,
+                           'price_regulation': rcap_da}
+        elif iso == 'SPP':
+            lmp_da, mcpru_da, mcprd_da = dms.get_spp_data(year, month, node_name)
+
+            market_data = {'price_electricity': lmp_da,
+                           'price_reg_up': mcpru_da,
+                           'price_reg_down': mcprd_da}
+        elif iso == 'CAISO':
+            lmp_da, aspru_da, asprd_da, asprmu_da, asprmd_da, rmu_mm, rmd_mm, rmu_pacc, rmd_pacc = dms.get_caiso_data(year, month, node_name)
+
+            # TODO: give the option to the user to override perf_score_ru and perf_score_rd
+            market_data = {'price_electricity': lmp_da,
+                           'price_reg_up': aspru_da,
+                           'price_reg_down': asprd_da,
+                           'price_reg_serv_up': asprmu_da,
+                           'price_reg_serv_down': asprmd_da,
+                           'mileage_mult_ru': rmu_mm,
+                           'mileage_mult_rd': rmd_mm,
+                           'perf_score_ru': rmu_pacc,
+                           'perf_score_rd': rmd_pacc}
+        else:
+            logging.error('ValOp Handler: Invalid ISO provided.')
+            raise ValueError('Invalid ISO provided to ValuationOptimizer handler.')
+
+        return market_data
+
+    def _chunk_param_set(self, param_set, n_months):
+        """Splits the param set into contiguous chunks so that there are enough jobs to occupy the workers."""
+        n_chunks = max(1, min(len(param_set), -(-self.n_workers // n_months)))
+        chunk_size = -(-len(param_set) // n_chunks)
+
+        return [param_set[ix:ix + chunk_size] for ix in range(0, len(param_set), chunk_size)]
+
+    def _run_jobs_parallel(self, jobs, market_type, n_workers):
+        """Solves the jobs in a pool of worker processes. Returns the outcomes of each job in the order given."""
+        logging.info('ValOp Handler: Solving {n} jobs with {workers} worker processes.'.format(n=len(jobs), workers=n_workers))
+
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            futures = [executor.submit(_solve_valuation_job_remote, market_type, self.solver_name, market_data, param_chunk, Optimizer.stats_log)
+                       for _, _, market_data, param_chunk in jobs]
+
+            payloads = [future.result() for future in futures]
+
+        job_outcomes = []
+
+        for (_, _, market_data, _), payload in zip(jobs, payloads):
+            outcomes = []
+
+            for params, results, gross_revenue, run_stats, error in payload:
+                if error is not None:
+                    outcomes.append((params, None, error))
+                else:
+                    op = self._rebuild_op(market_type, market_data, results, gross_revenue)
+                    op.run_stats = run_stats
+
+                    outcomes.append((params, op, None))
+
+            job_outcomes.append(outcomes)
+
+        return job_outcomes
+
+    def _rebuild_op(self, market_type, market_data, results, gross_revenue):
+        """Rebuilds a solved ValuationOptimizer from its results, e.g., when Pyomo models do not survive pickling."""
+        op = ValuationOptimizer(market_type=market_type, solver=self.solver_name, **market_data)
+        op.results = results
+        op.gross_revenue = gross_revenue
 
         return op
 
+    def _get_cached_outcome(self, market_type, market_data, params):
+        """Returns the outcome for the given model inputs from the result cache, or None if it is not cached."""
+        if self.result_cache is None:
+            return None
+
+        key = self.result_cache.make_key(market_data, market_type, params, self.solver_name)
+        cached = self.result_cache.get(key)
+
+        if cached is None:
+            return None
+
+        results, gross_revenue = cached
+
+        return params, self._rebuild_op(market_type, market_data, results, gross_revenue), None
+
+    def _put_cached_outcome(self, market_type, market_data, outcome):
+        """Stores the results of a successfully solved outcome in the result cache."""
+        params, solved_op, error = outcome
+
+        if self.result_cache is None or error is not None:
+            return
+
+        key = self.result_cache.make_key(market_data, market_type, params, self.solver_name)
+        self.result_cache.put(key, solved_op.results, solved_op.gross_revenue)
+
     @staticmethod
     def _save_to_solved_ops(op, iso, market_type, node_name, year, month, param_set):
         # time_finished = datetime.now().strftime('%A, %B %d, %Y %H:%M:%S')
@@ -170,6 +267,80 @@ class ValuationOptimizerHandler:
 
         return return_list
 
+
+def _can_resolve(prev_params, params):
+    """Returns True if the model built with prev_params can be re-solved for params by only updating mutable params."""
+    if not prev_params or not params or set(prev_params) != set(params):
+        return False
+
+    return all(params[key] == prev_params[key] for key in params if key not in ValuationOptimizer.MUTABLE_PARAMS)
+
+
+def _detach_op(op, market_type, solver_name, market_data, params):
+    """Returns a ValuationOptimizer that holds the results, gross revenue, run stats, and params of the solved op but not its model, which may be re-solved for other params."""
+    detached = ValuationOptimizer(market_type=market_type, solver=solver_name, **market_data)
+
+    if params:
+        detached.set_model_parameters(**params)
+
+    detached.results = op.results
+    detached.gross_revenue = op.gross_revenue
+    detached.run_stats = op.run_stats
+
+    return detached
+
+
+def _solve_valuation_job(market_type, solver_name, market_data, param_chunk):
+    """Solves ValuationOptimizer models for one month of market data and each params in param_chunk.
+
+    The model is built once and re-solved in place while only mutable params change between consecutive params. Returns a list of (params, solved_op, error) tuples where error is None if the model was solved.
+    """
+    outcomes = []
+
+    # Build models with mutable params for parameter sweeps so that they can be re-solved in place.
+    sweep = len(param_chunk) > 1
+
+    # The model most recently built and the params it was built with.
+    sweep_op = None
+    sweep_params = None
+
+    for params in param_chunk:
+        try:
+            if sweep and _can_resolve(sweep_params, params):
+                sweep_op.resolve(**{key: value for key, value in params.items() if key in ValuationOptimizer.MUTABLE_PARAMS})
+            else:
+                op = ValuationOptimizer(market_type=market_type, solver=solver_name, mutable_params=sweep, **market_data)
+
+                if params:
+                    op.set_model_parameters(**params)
+
+                op.run()
+
+                sweep_op, sweep_params = op, params
+        except pyutilib.common._exceptions.ApplicationError as e:
+            outcomes.append((params, None, 'ValOp Handler: Something went wrong when solving: ({error})'.format(error=e)))
+        except IncompatibleDataException as e:
+            outcomes.append((params, None, str(e)))
+        else:
+            # The model is re-solved for the next params, so save only what was obtained for these params.
+            outcomes.append((params, _detach_op(sweep_op, market_type, solver_name, market_data, params) if sweep else sweep_op, None))
+
+        if not params:
+            break
+
+    return outcomes
+
+
+def _solve_valuation_job_remote(market_type, solver_name, market_data, param_chunk, stats_log=None):
+    """Worker process entry point for _solve_valuation_job. Returns (params, results, gross_revenue, run_stats, error) tuples, which can be pickled."""
+    # Class attributes are not inherited by spawned worker processes.
+    Optimizer.stats_log = stats_log
+
+    outcomes = _solve_valuation_job(market_type, solver_name, market_data, param_chunk)
+
+    return [(params, None, None, None, error) if error is not None else (params, op.results, op.gross_revenue, op.run_stats, None)
+            for params, op, error in outcomes]
+
 if __name__ == '__main__':
     with open('valuation_optimizer.log', 'w'):
         pass
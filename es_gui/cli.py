@@ -0,0 +1,336 @@
+"""
+Command line interface for running QuESt Valuation and QuESt BTM batches without the graphical user interface.
+
+Examples, run from the root directory of the codebase:
+
+    python -m es_gui.cli valuation --iso PJM --node 51217 --months 2019-01:2019-12 --sweep Power_rating=1:20:20
+
+    python -m es_gui.cli btm --rate-structure data/rate_structures/my_rate.json --load-profile data/load/commercial/my_load.csv --param Power_rating=50
+
+    python -m es_gui.cli ingest --iso PJM --node 51217 --node 51218 --months 2019-01:2019-12
+
+Results are written to the output directory as a CSV file of the results of each model and a summary CSV file of all of the models solved. None of the Kivy modules are imported; the optimization modules are only imported once the arguments have been parsed.
+"""
+from __future__ import absolute_import, print_function
+
+import argparse
+import calendar
+import csv
+import json
+import logging
+import os
+import sys
+
+
+def _parse_month(text):
+    """Parses a YYYY-MM string into a (year, month) tuple of ints."""
+    try:
+        year, month = (int(x) for x in text.split('-'))
+    except ValueError:
+        raise argparse.ArgumentTypeError('Invalid month "{0}"; expected YYYY-MM.'.format(text))
+
+    if not 1 <= month <= 12:
+        raise argparse.ArgumentTypeError('Invalid month "{0}"; expected YYYY-MM.'.format(text))
+
+    return year, month
+
+
+def parse_months(text):
+    """Parses a YYYY-MM or YYYY-MM:YYYY-MM range string into a list of (month, year) string tuples as used by the op handlers."""
+    start, _, end = text.partition(':')
+
+    start = _parse_month(start)
+    end = _parse_month(end) if end else start
+
+    if end < start:
+        raise argparse.ArgumentTypeError('The end of the month range "{0}" precedes its start.'.format(text))
+
+    months = []
+    year, month = start
+
+    while (year, month) <= end:
+        months.append((str(month), str(year)))
+
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+    return months
+
+
+def parse_param(text):
+    """Parses a NAME=VALUE string into a (name, float) tuple."""
+    name, _, value = text.partition('=')
+
+    try:
+        return name, float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError('Invalid parameter "{0}"; expected NAME=VALUE.'.format(text))
+
+
+def parse_sweep(text):
+    """Parses a NAME=MIN:MAX:STEPS string into a (name, list of values) tuple, with STEPS evenly spaced values from MIN to MAX inclusive."""
+    name, _, sweep_range = text.partition('=')
+
+    try:
+        param_min, param_max, param_step = sweep_range.split(':')
+        param_min = float(param_min)
+        param_max = float(param_max)
+        param_step = int(param_step)
+    except ValueError:
+        raise argparse.ArgumentTypeError('Invalid parameter sweep "{0}"; expected NAME=MIN:MAX:STEPS.'.format(text))
+
+    if param_max < param_min or param_step < 1:
+        raise argparse.ArgumentTypeError('Invalid parameter sweep "{0}"; MIN must not exceed MAX and STEPS must be positive.'.format(text))
+
+    if param_step == 1:
+        return name, [param_min]
+
+    return name, [param_min + (param_max - param_min)*ix/(param_step - 1) for ix in range(param_step)]
+
+
+def build_param_set(base_params, sweep=None):
+    """Builds the list of parameter dictionaries for the op handlers from the base parameters and an optional (name, values) sweep."""
+    if sweep is None:
+        return [dict(base_params)]
+
+    name, values = sweep
+    param_set = []
+
+    for value in values:
+        params = dict(base_params)
+        params[name] = value
+        param_set.append(params)
+
+    return param_set
+
+
+def _write_summary(path, rows):
+    """Writes the list of dictionaries rows to a CSV file at path."""
+    if not rows:
+        return
+
+    with open(path, 'w', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def run_valuation(args):
+    """Runs a QuESt Valuation batch as specified by the parsed command line arguments. Returns the exit status."""
+    from es_gui.apps.valuation.op_handler import ValuationOptimizerHandler
+    from es_gui.tools.valuation.valuation_dms import ValuationDMS
+    from es_gui.tools.valuation.valuation_optimizer import BadParameterException
+    from es_gui.tools.valuation.result_cache import ResultCache
+
+    handler = ValuationOptimizerHandler(args.solver, n_workers=args.workers)
+    handler.dms = ValuationDMS(home_path=args.data_dir, save_name='valuation_dms.p', save_data=False,
+                               max_memory=args.dms_size*1000, mmap_dir=args.mmap_dir,
+                               mmap_max_size=args.mmap_size*1024**2)
+
+    if args.cache_dir:
+        handler.result_cache = ResultCache(cache_dir=args.cache_dir)
+
+    requests = {'iso': args.iso,
+                'market type': args.market_type,
+                'months': args.months,
+                'node id': args.node,
+                'param set': build_param_set(dict(args.param), args.sweep),
+                }
+
+    try:
+        _, handler_status = handler.process_requests(requests)
+    except BadParameterException as e:
+        logging.error(str(e))
+        return 2
+
+    os.makedirs(args.output, exist_ok=True)
+
+    summary = []
+
+    for ix, solved_op in enumerate(handler.solved_ops):
+        op = solved_op['optimizer']
+        month = list(calendar.month_name).index(solved_op['month'])
+        results_file = '{node}_{year}_{month:02d}_{ix:03d}.csv'.format(node=solved_op['node'], year=solved_op['year'], month=month, ix=ix)
+
+        op.results.to_csv(os.path.join(args.output, results_file), index=False)
+
+        summary.append({'iso': solved_op['iso'],
+                        'market type': solved_op['market type'],
+                        'node': solved_op['node'],
+                        'year': solved_op['year'],
+                        'month': month,
+                        'params': json.dumps(solved_op.get('params', {}), sort_keys=True),
+                        'gross revenue': op.gross_revenue,
+                        'results file': results_file,
+                        })
+
+    _write_summary(os.path.join(args.output, 'summary.csv'), summary)
+
+    logging.info('CLI: Wrote the results of {n} models to {path}.'.format(n=len(summary), path=args.output))
+    logging.info('CLI: Data management system usage:\n' + handler.dms.stats_summary())
+
+    return 0 if handler_status else 1
+
+
+def run_btm(args):
+    """Runs a QuESt BTM cost savings batch as specified by the parsed command line arguments. Returns the exit status."""
+    from es_gui.apps.btm.op_handler import BtmOptimizerHandler, BILL_ATTRIBUTES
+    from es_gui.tools.btm.btm_dms import BtmDMS
+    from es_gui.tools.btm.btm_optimizer import BadParameterException
+
+    with open(args.rate_structure, 'r') as fp:
+        rate_structure = json.load(fp)
+
+    # Start from the default system parameters used by the cost savings wizard.
+    with open(os.path.join('es_gui', 'apps', 'data_manager', '_static', 'btm_cost_savings_model_params.json'), 'r') as fp:
+        base_params = {param['attr name']: float(param['default']) for param in json.load(fp)}
+
+    base_params.update(args.param)
+
+    handler = BtmOptimizerHandler(args.solver, n_workers=args.workers)
+    handler.dms = BtmDMS(home_path=args.data_dir, save_name='btm_dms.p', save_data=False,
+                         max_memory=args.dms_size*1000, mmap_dir=args.mmap_dir,
+                         mmap_max_size=args.mmap_size*1024**2)
+
+    requests = {'rate_structure': rate_structure,
+                'load_profile': {'name': os.path.splitext(os.path.basename(args.load_profile))[0], 'path': args.load_profile},
+                'pv_profile': {'name': os.path.splitext(os.path.basename(args.pv_profile))[0], 'path': args.pv_profile} if args.pv_profile else {},
+                'params': build_param_set(base_params, args.sweep),
+                }
+
+    try:
+        _, handler_status = handler.process_requests(requests)
+    except BadParameterException as e:
+        logging.error(str(e))
+        return 2
+
+    os.makedirs(args.output, exist_ok=True)
+
+    summary = []
+
+    for ix, solved_op in enumerate(handler.solved_ops):
+        op = solved_op['optimizer']
+        month = list(calendar.month_abbr).index(solved_op['month'])
+        results_file = '{month:02d}_{ix:03d}.csv'.format(month=month, ix=ix)
+
+        op.results.to_csv(os.path.join(args.output, results_file), index=False)
+
+        row = {'rate structure': rate_structure.get('name', ''),
+               'month': month,
+               'params': json.dumps(solved_op.get('params', {}), sort_keys=True),
+               }
+
+        for attr in BILL_ATTRIBUTES:
+            row[attr] = getattr(op, attr)
+
+        row['results file'] = results_file
+        summary.append(row)
+
+    _write_summary(os.path.join(args.output, 'summary.csv'), summary)
+
+    logging.info('CLI: Wrote the results of {n} models to {path}.'.format(n=len(summary), path=args.output))
+    logging.info('CLI: Data management system usage:\n' + handler.dms.stats_summary())
+
+    return 0 if handler_status else 1
+
+
+def run_ingest(args):
+    """Ingests the raw market data files of the nodes and months specified by the parsed command line arguments into the market data store. Returns the exit status."""
+    import numpy as np
+
+    from es_gui.tools.valuation.valuation_dms import ValuationDMS
+
+    # Only the market data store is of use; keep as little as possible in memory.
+    dms = ValuationDMS(home_path=args.data_dir, ingest=True, refresh=args.refresh, save_name='valuation_dms.p', save_data=False, max_memory=0)
+    dms.market_store.dtype = np.float32 if args.single_precision else np.float64
+
+    getters = {'PJM': dms.get_pjm_data,
+               'ERCOT': dms.get_ercot_data,
+               'MISO': dms.get_miso_data,
+               'ISONE': dms.get_isone_data,
+               'NYISO': dms.get_nyiso_data,
+               'SPP': dms.get_spp_data,
+               'CAISO': dms.get_caiso_data,
+               }
+
+    status = 0
+
+    for month, year in args.months:
+        for node in args.node:
+            try:
+                market_data = getters[args.iso](year, month, node)
+            except Exception as e:
+                logging.error('CLI: Could not ingest {iso} {node} {year}-{month:0>2}. ({e})'.format(iso=args.iso, node=node, year=year, month=month, e=e))
+                status = 1
+                continue
+
+            if not len(market_data[0]):
+                logging.error('CLI: No {iso} {node} LMP data found for {year}-{month:0>2}.'.format(iso=args.iso, node=node, year=year, month=month))
+                status = 1
+            else:
+                logging.info('CLI: Ingested {iso} {node} {year}-{month:0>2}.'.format(iso=args.iso, node=node, year=year, month=month))
+
+    return status
+
+
+def build_parser():
+    """Builds the command line argument parser."""
+    parser = argparse.ArgumentParser(prog='python -m es_gui.cli', description='Run QuESt optimization batches without the graphical user interface.')
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--solver', default='glpk', help='The name of the solver for Pyomo to call. (default: %(default)s)')
+    common.add_argument('--workers', type=int, default=0, help='The number of worker processes for solving models in parallel; 0 uses one per CPU core. (default: %(default)s)')
+    common.add_argument('--data-dir', default='data', help='The path to the QuESt data bank. (default: %(default)s)')
+    common.add_argument('--dms-size', type=int, default=20000, help='The maximum size of the data management system in kilobytes. (default: %(default)s)')
+    common.add_argument('--mmap-dir', help='The path to a directory to keep loaded data in as memory-mapped .npy files, shared between runs and processes.')
+    common.add_argument('--mmap-size', type=int, default=2048, help='The maximum size of the memory-mapped data in megabytes; the least recently used files are deleted beyond it. (default: %(default)s)')
+    common.add_argument('--output', '-o', default=os.path.join('results', 'cli'), help='The directory to write results to. (default: %(default)s)')
+    common.add_argument('--param', type=parse_param, action='append', default=[], metavar='NAME=VALUE', help='Sets a model parameter; may be repeated.')
+    common.add_argument('--sweep', type=parse_sweep, metavar='NAME=MIN:MAX:STEPS', help='Sweeps a model parameter over STEPS evenly spaced values.')
+    common.add_argument('--stats-log', help='The path of a file to append the performance statistics of each model to.')
+    common.add_argument('--verbose', '-v', action='store_true', help='Log informational messages.')
+
+    subparsers = parser.add_subparsers(dest='app')
+    subparsers.required = True
+
+    valuation = subparsers.add_parser('valuation', parents=[common], help='Run QuESt Valuation models.')
+    valuation.add_argument('--iso', required=True, choices=['PJM', 'ERCOT', 'MISO', 'ISONE', 'NYISO', 'SPP', 'CAISO'], help='The market area.')
+    valuation.add_argument('--node', required=True, help='The pricing node ID.')
+    valuation.add_argument('--months', type=parse_months, required=True, metavar='YYYY-MM[:YYYY-MM]', help='The month or inclusive range of months to solve.')
+    valuation.add_argument('--market-type', default='arbitrage', help='The market formulation, e.g., arbitrage or pjm_pfp. (default: %(default)s)')
+    valuation.add_argument('--cache-dir', help='The path to a directory of cached results to reuse and add to.')
+    valuation.set_defaults(func=run_valuation)
+
+    btm = subparsers.add_parser('btm', parents=[common], help='Run QuESt BTM cost savings models.')
+    btm.add_argument('--rate-structure', required=True, help='The path to a rate structure JSON file.')
+    btm.add_argument('--load-profile', required=True, help='The path to a load profile CSV file.')
+    btm.add_argument('--pv-profile', help='The path to a PV profile JSON file.')
+    btm.set_defaults(func=run_btm)
+
+    ingest = subparsers.add_parser('ingest', help='Convert raw QuESt Valuation market data files into the market data store.')
+    ingest.add_argument('--iso', required=True, choices=['PJM', 'ERCOT', 'MISO', 'ISONE', 'NYISO', 'SPP', 'CAISO'], help='The market area.')
+    ingest.add_argument('--node', required=True, action='append', help='The pricing node ID; may be repeated.')
+    ingest.add_argument('--months', type=parse_months, required=True, metavar='YYYY-MM[:YYYY-MM]', help='The month or inclusive range of months to ingest.')
+    ingest.add_argument('--data-dir', default='data', help='The path to the QuESt data bank. (default: %(default)s)')
+    ingest.add_argument('--single-precision', action='store_true', help='Store values as float32 instead of float64.')
+    ingest.add_argument('--refresh', action='store_true', help='Convert the raw files again even if they have been ingested, e.g., after downloading them again.')
+    ingest.add_argument('--verbose', '-v', action='store_true', help='Log informational messages.')
+    ingest.set_defaults(func=run_ingest, stats_log=None)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    logging.basicConfig(format='[%(levelname)s] %(asctime)s: %(message)s', level=logging.INFO if args.verbose else logging.WARNING)
+
+    if args.stats_log:
+        from es_gui.tools.optimizer import Optimizer
+
+        Optimizer.stats_log = args.stats_log
+
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,7 +2,7 @@ from __future__ import absolute_import
 
 from kivy.uix.settings import InterfaceWithSidebar, Settings, SettingItem
 from kivy.uix.label import Label
-from kivy.properties import ListProperty
+from kivy.properties import ListProperty, StringProperty
 
 
 class ESAppSettingsInterface(InterfaceWithSidebar):
@@ -15,6 +15,7 @@ class ESAppSettings(Settings):
     def __init__(self, **kwargs):
         super(ESAppSettings, self).__init__(**kwargs)
         #self.register_type('title', SettingsTitle)
+        self.register_type('button', SettingsButton)
 
     def add_kivy_panel(self):
         """
@@ -32,4 +33,14 @@ class SettingsTitle(Label):
 
 
 class SettingsBoolean(SettingsItem):
-    values = ListProperty(['0', '1'])
\ No newline at end of file
+    values = ListProperty(['0', '1'])
+
+
+class SettingsButton(SettingsItem):
+    """
+    A settings item that performs an action instead of storing a value. Pressing the button dispatches on_config_change for its section and key.
+    """
+    button_text = StringProperty('Clear')
+
+    def on_button_release(self):
+        self.panel.settings.dispatch('on_config_change', self.panel.config, self.section, self.key, self.value)
@@ -25,16 +25,12 @@ class BtmDMS(DataManagementSystem):
         """Retrieves commercial or residential load profile data."""
         logging.info('DMS: Loading load profile data')
 
-        month = str(month)
-        load_profile_key = self.delimiter.join([path, month])
-
-        try:
-            load_profile = self.get_data(load_profile_key)
-        except KeyError:
-            load_profile = read_load_profile(path, month)
-            self.add_data(load_profile, load_profile_key)
-        finally:
-            return load_profile
+        # The file is parsed once and every month of it is added to the DMS together.
+        load_profile_keys = [self.delimiter.join([path, str(ix)]) for ix in range(1, 13)]
+
+        load_profiles = self.get_or_load(load_profile_keys, lambda: read_load_profiles(path).values(), name='read_load_profiles')
+
+        return load_profiles[int(month) - 1]
     
     def get_pv_profile_data(self, path, month):
         """Retrieves PV profile data."""
@@ -43,10 +39,6 @@ class BtmDMS(DataManagementSystem):
         month = str(month)
         pv_profile_key = self.delimiter.join([path, month])
 
-        try:
-            pv_profile = self.get_data(pv_profile_key)
-        except KeyError:
-            pv_profile = read_pv_profile(path, month)
-            self.add_data(pv_profile, pv_profile_key)
-        finally:
-            return pv_profile
\ No newline at end of file
+        pv_profile, = self.get_or_load([pv_profile_key], lambda: [read_pv_profile(path, month)], name='read_pv_profile')
+
+        return pv_profile
\ No newline at end of file
@@ -20,8 +20,7 @@ class BtmOptimizer(optimizer.Optimizer):
                  cost_charge=None, cost_discharge=None,
                  solver='glpk'):
         
-        self._model = ConcreteModel()
-        self._solver = solver
+        super(BtmOptimizer, self).__init__(solver=solver)
 
         self._expressions_block = None
         
@@ -424,12 +423,18 @@ class BtmOptimizer(optimizer.Optimizer):
         
         m.tou_dr = self.tou_demand_rate
         
-        mask_ds = []
-        for i in range(m.dml):
-            listi=[int(self.tou_demand_schedule[t]==i) for t in range(m.nhr)]
-            mask_ds.append(listi)
-       
-        m.mask_ds = mask_ds
+        # Hours belonging to each time-of-use demand period, in a single pass over the schedule.
+        period_hours = [[] for p in range(m.dml)]
+        for t in range(m.nhr):
+            period = int(self.tou_demand_schedule[t])
+
+            if not 0 <= period < m.dml:
+                raise(IncompatibleDataException('The time-of-use demand schedule refers to demand charge period {period} at hour {hour}, but only {n} demand charge rates are given.'.format(period=period, hour=t, n=m.dml)))
+
+            period_hours[period].append(t)
+
+        m.period_hours = period_hours
+        m.period_time = Set(dimen=2, ordered=True, initialize=[(p, t) for p in range(m.dml) for t in period_hours[p]])
         
         m.flt_dr = self.flat_demand_rate
         
@@ -474,7 +479,16 @@ class BtmOptimizer(optimizer.Optimizer):
         ptot = [m.pnet[n] + m.pcha[n].value - m.pdis[n].value for n in m.time]
         soc  = [m.s[n].value for n in m.time]
         pfpk_without_es = max(m.pnet)
-        ptpk_without_es = [max(m.pnet[n]*m.mask_ds[p][n] for n in m.time) for p in m.period]
+
+        ptpk_without_es = []
+        for p in m.period:
+            pnet_period = [m.pnet[n] for n in m.period_hours[p]]
+
+            # Hours outside of the period count as zero demand.
+            if len(pnet_period) < m.nhr:
+                pnet_period.append(0)
+
+            ptpk_without_es.append(max(pnet_period))
         
         demand_charge_with_es=m.pfpk.value*m.flt_dr+sum(m.ptpk[p].value*m.tou_dr[p] for p in m.period)
         demand_charge_without_es=pfpk_without_es*m.flt_dr+sum(ptpk_without_es[p]*m.tou_dr[p] for p in m.period)
@@ -62,9 +62,10 @@ def eq_stateofcharge_final(m):
     """Requires the final state of charge of the energy storage device to equal its initial value."""
     mp = m.parent_block()
     T  = mp.nhr-1
-    def _eq_stateofcharge_final(_m, t):
+    def _eq_stateofcharge_final(_m):
         return mp.s[T] == mp.State_of_charge_init*mp.Energy_capacity
-    m.stateofcharge_final = Constraint(mp.time, rule=_eq_stateofcharge_final)
+    # Scalar constraint; it is emitted once rather than once per timestep.
+    m.stateofcharge_final = Constraint(rule=_eq_stateofcharge_final)
 
 
 def ineq_peak_demand(m):
@@ -78,8 +79,9 @@ def ineq_tou_demand(m):
     """Requires all net power at time t period p less the peak demand of period p"""
     mp = m.parent_block()
     def _ineq_tou_demand(_m, p, t):
-        return mp.mask_ds[p][t]*(mp.pnet[t]+mp.pcha[t]-mp.pdis[t])<=mp.ptpk[p]
-    m.tou_demand = Constraint(mp.period, mp.time, rule=_ineq_tou_demand)
+        return mp.pnet[t]+mp.pcha[t]-mp.pdis[t]<=mp.ptpk[p]
+    # Only hours belonging to period p are constrained; ptpk is nonnegative otherwise.
+    m.tou_demand = Constraint(mp.period_time, rule=_ineq_tou_demand)
     
 def ineq_nem_xnet(m):
     """Requires all net power at time t less the peak demand"""
@@ -185,21 +185,25 @@ def find_utschld(**kwargs):
 
 def read_load_profile(path, month):
     """Reads the annual load profile file located at path and returns the array of the load profile for the given month."""
-    load_df = pd.read_csv(path)
-
     if isinstance(month, str):
         month = int(month)
 
-    # Parse the Date/Time field.
-    load_df['dt split'] = load_df['Date/Time'].str.split()
+    return read_load_profiles(path)[month]
+
+def read_load_profiles(path):
+    """Reads the annual load profile file located at path once and returns a dictionary of the arrays of the load profile of each month, keyed by month (int) [1, 12]."""
+    load_df = pd.read_csv(path, usecols=['Date/Time', 'Electricity:Facility [kW](Hourly)'])
 
-    load_df['month'] = load_df['dt split'].apply(lambda x: int(x[0].split('/')[0]))
-    load_df['day'] = load_df['dt split'].apply(lambda x: int(x[0].split('/')[-1]))
-    load_df['hour'] = load_df['dt split'].apply(lambda x: int(x[1].split(':')[0]))
+    # Parse the month of the Date/Time field, e.g., ' 01/01  01:00:00'.
+    months = load_df['Date/Time'].str.extract(r'^\s*(\d+)/', expand=False).astype(int).values
+    load = load_df['Electricity:Facility [kW](Hourly)'].values
 
-    load_profile = load_df.loc[load_df['month'] == month]['Electricity:Facility [kW](Hourly)'].values
+    # Split into months in one pass, keeping the order of the hours within each month.
+    order = np.argsort(months, kind='stable')
+    month_ix = np.arange(1, 13)
+    bounds = np.searchsorted(months[order], month_ix[1:])
 
-    return load_profile
+    return dict(zip(month_ix, np.split(load[order], bounds)))
 
 def read_pv_profile(path, month):
     """Reads the annual PV profile file located at path and returns the array of the PV profile for the given month."""
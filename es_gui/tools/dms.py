@@ -4,91 +4,145 @@ from collections import OrderedDict
 import pickle
 import logging
 import os
+import threading
+import time
 
 import numpy as np
 
+from es_gui.tools.dms_store import PersistentStore, ArrayStore
+
 
 class DataManagementSystem():
     """
     A class used to store processed DataFrames as NumPy ndarrays and manage memory consumed. Data is stored in nested dictionaries up to a depth of 2: {key_0: {key_0_0: data}}. When the calculated memory exceeds max_memory, the dictionary at depth 1 at the front of the queue is popped out of the dictionary until the memory consumption is less than the maximum. The queue is determined by time of accessing. Accessing or adding to the structure at any depth will push the depth 1 dictionary to the back of the queue.
 
-    :param save_name: The path/filename to pickle the DMS's data.
+    The DMS's data persists in a directory named after save_name without its extension, e.g., valuation_dms/ for valuation_dms.p, with one file per depth 1 entry. Persisted entries are listed at startup but only read from disk when first retrieved. If save_data is True, changes are written to disk in the background; see PersistentStore.
+
+    The DMS may be used from several threads at once. Data that several threads request at the same time is only loaded once; see get_or_load().
+
+    If mmap_dir is given, depth 1 ndarrays are instead written to .npy files in mmap_dir and retrieved memory-mapped; see ArrayStore. They do not count toward max_memory; the files are limited to mmap_max_size bytes instead.
+
+    :param save_name: The path/filename to persist the DMS's data.
+    :param save_data: True if changes to the DMS's data should be persisted.
     :param max_memory: The maximum amount of memory, in bytes, that the contained ndarrays may collectively occupy.
+    :param mmap_dir: The path to the directory to store memory-mapped ndarrays in, or None to keep them in memory.
+    :param mmap_max_size: The maximum number of bytes the memory-mapped ndarrays may occupy on disk.
     """
-    def __init__(self, save_name, save_data=False, max_memory=500000):
+    def __init__(self, save_name, save_data=False, max_memory=500000, mmap_dir=None, mmap_max_size=ArrayStore.DEFAULT_MAX_SIZE):
         self.memory_used = 0
         self.max_memory = max_memory
         self.save_data = save_data
         self.save_name = save_name
 
+        self.array_store = ArrayStore(store_dir=mmap_dir, max_size=mmap_max_size) if mmap_dir else None
+
+        # Guards self.data and the memory accounting. It is only held for bookkeeping, never while reading data files.
+        self._lock = threading.RLock()
+
+        # Events for the keys currently being loaded by get_or_load(), which are set when loading finishes.
+        self._loading = {}
+
+        self.reset_stats()
+
+        # Memory footprint of each entry of self.data, so that memory_used can be maintained without traversing self.data.
+        self._entry_sizes = {}
+
+        self.store = PersistentStore(store_dir=os.path.splitext(self.save_name)[0])
+
+        # Persisted entries are loaded lazily; until then, they are represented by placeholders.
+        self.data = OrderedDict((key, _StoredEntry(size)) for key, size in self.store.index)
+
+        if os.path.exists(self.save_name):
+            self._load_pickle()
+
+        self.compute_memory()
+        self.manage_memory()
+
+    def _load_pickle(self):
+        """Loads data pickled at self.save_name by earlier versions and moves it to the store."""
         try:
             with open(self.save_name, 'rb') as pfile:
-                self.data = pickle.load(pfile)
+                data = pickle.load(pfile)
                 logging.info('DMS: Successfully loaded {fname}.'.format(fname=self.save_name))
-        except FileNotFoundError:
-            self.data = OrderedDict()
-        except pickle.PickleError:
+        except (pickle.PickleError, EOFError):
             logging.error('DMS: Could not unpickle data; purging and restarting DMS.')
             self.delete_pickle()
-            self.data = OrderedDict()
-    
+            return
+
+        for key, value in data.items():
+            self.data[key] = value
+
+            if self.save_data:
+                self.store.put(key, value, self._sizeof(value))
+
+        if self.save_data:
+            self.store.flush()
+            self.delete_pickle()
+
     def delete_pickle(self):
-        """Deletes the pickle file used for self.data object persistence."""
-        os.remove(self.save_data)
+        """Deletes the pickle file used for self.data object persistence by earlier versions."""
+        os.remove(self.save_name)
 
     def save_state(self):
-        """Pickles self.data at self.save_name."""
+        """Writes any pending changes to self.data to disk."""
         if self.save_data:
-            logging.info('DMS: Saving {0}.'.format(self.save_name))
-            with open(self.save_name, 'wb') as pfile:
-                pickle.dump(self.data, pfile, protocol=3)
+            self.store.flush()
 
     def pop(self):
         """Shortcut for popping the queue of the OrderedDict."""
-        k, v = self.data.popitem(last=False)
-        print('Popped: ', (k))
+        with self._lock:
+            k, v = self.data.popitem(last=False)
+            self.memory_used -= self._entry_sizes.pop(k, 0)
+            self._stats['evictions'] += 1
+
+            if self.save_data:
+                self.store.delete(k)
+
+        logging.info('DMS: Popped {0}.'.format(k))
 
     def requeue(self, key):
         """Moves self.data[key] to the back of the queue for being purged."""
+        with self._lock:
+            if key in self.data:
+                self.data.move_to_end(key)
 
-        if key in self.data:
-            to_requeue = self.data.pop(key)
-            self.data[key] = to_requeue
+                if self.save_data:
+                    self.store.touch(key)
 
     def manage_memory(self):
         """Pops entries from the queue until occupied memory is less than the maximum allocated."""
-        dms_sz = self.compute_memory()
-
-        while dms_sz > self.max_memory:
-            print('Memory limit exceeded. Purging old data...')
-            print('Currently using: ', dms_sz, 'bytes')
-            print('Maximum allowed: ', self.max_memory, 'bytes')
-            self.pop()
-            dms_sz = self.compute_memory()
-            print('Now using: ', dms_sz, 'bytes')
+        with self._lock:
+            if self.memory_used > self.max_memory:
+                logging.info('DMS: Memory limit exceeded ({used} of {max} bytes). Purging old data...'.format(used=self.memory_used, max=self.max_memory))
 
-        self.save_state()
+                # The least recently used entries are at the front of the queue; a single pass evicts as many as needed.
+                while self.memory_used > self.max_memory and self.data:
+                    self.pop()
 
-    def compute_memory(self):
-        """Computes the memory footprint of the entire data structure."""
-        def _compute_memory(coll):
-            dms_sz = 0
+                logging.info('DMS: Now using {used} bytes.'.format(used=self.memory_used))
 
-            for value in coll.values():
-                if isinstance(value, np.ndarray):
-                    array_sz = value.nbytes
-                else:
-                    array_sz = _compute_memory(value)
+    @staticmethod
+    def _sizeof(value):
+        """Computes the memory footprint of an ndarray or of the ndarrays in a (nested) dictionary."""
+        if isinstance(value, np.ndarray):
+            return value.nbytes
+        elif isinstance(value, _StoredEntry):
+            return value.size
+        elif isinstance(value, dict):
+            return sum(DataManagementSystem._sizeof(v) for v in value.values())
+        else:
+            return 0
 
-                dms_sz += array_sz
-            return dms_sz
+    def compute_memory(self):
+        """Computes the memory footprint of the entire data structure by traversing it. The footprint is otherwise maintained incrementally as memory_used."""
+        with self._lock:
+            self._entry_sizes = {key: self._sizeof(value) for key, value in self.data.items()}
+            self.memory_used = sum(self._entry_sizes.values())
 
-        dms_sz = _compute_memory(self.data)
-        self.memory_used = dms_sz
-        return dms_sz
+            return self.memory_used
 
-    def add_data(self, value, *args):
-        """Adds value to self.data[arg[0]][...][arg[N-1]]. Requeues self.data[arg[0]] after updating."""
+    def add_data(self, value, *args, persist=True):
+        """Adds value to self.data[arg[0]][...][arg[N-1]]. Requeues self.data[arg[0]] after updating. If persist is False, value is only kept in memory: it is neither memory-mapped nor saved, e.g., because it is incomplete and should be read again by later sessions."""
 
         # def _add_data(keys, val):
         #     val = {keys.pop(): val}
@@ -112,16 +166,80 @@ class DataManagementSystem():
         #         tmp_dict = value
         #     finally:
         #         self.data[args[0]] = tmp_dict
-        self.data[args[0]] = value
+        if persist and self.array_store is not None and self.array_store.can_store(value):
+            self.array_store.put(args[0], value)
 
-        self.requeue(args[0])
-        self.manage_memory()
+            # The array is retrieved from the array store from now on.
+            self._discard(args[0])
+
+            return
+
+        entry_size = self._sizeof(value)
+
+        # An entry larger than max_memory would evict every other entry and then itself, so it is not kept at all.
+        if entry_size > self.max_memory:
+            logging.info('DMS: {key} ({size} bytes) exceeds the memory limit and is not kept.'.format(key=args[0], size=entry_size))
+            self._discard(args[0])
+
+            return
+
+        with self._lock:
+            # Replacing an entry releases the memory of the previous value.
+            self.memory_used += entry_size - self._entry_sizes.get(args[0], 0)
+            self._entry_sizes[args[0]] = entry_size
+            self.data[args[0]] = value
+
+            if self.save_data:
+                if persist:
+                    self.store.put(args[0], value, entry_size)
+                else:
+                    self.store.delete(args[0])
+
+            self.requeue(args[0])
+            self.manage_memory()
+
+    def _discard(self, key):
+        """Removes the entry key, if any, without counting it as an eviction."""
+        with self._lock:
+            if key in self.data:
+                del self.data[key]
+                self.memory_used -= self._entry_sizes.pop(key, 0)
+
+                if self.save_data:
+                    self.store.delete(key)
 
     def get_data(self, *args):
         """Retrieves NumPy ndarray from self.data according to provided sequence of keys."""
-        tmp = self.data
+        try:
+            tmp = self._lookup(*args)
+        except KeyError:
+            self._count('misses')
+            logging.info('DMS: Data not yet in DMS, loading...')
+            raise
+
+        self._count('hits')
+        logging.info('DMS: Data located in DMS, retrieving...')
+        return tmp
+
+    def _lookup(self, *args):
+        """Retrieves the value of get_data() without counting the retrieval in stats(). Raises KeyError if it is not in the DMS."""
+        with self._lock:
+            tmp = self.data.get(args[0], None)
+
+        if tmp is None and self.array_store is not None:
+            try:
+                return self.array_store.load(args[0])
+            except KeyError:
+                pass
 
-        for key in args:
+        if tmp is None:
+            raise(KeyError('KeyError when retrieving: {0}'.format(args[0])))
+
+        if isinstance(tmp, _StoredEntry):
+            tmp = self._load_stored(args[0])
+
+        # Stored values are not modified in place, so nested values can be retrieved without holding the lock.
+        for key in args[1:]:
             if isinstance(tmp, np.ndarray):
                 print('>>> Warning: Already reached end of data tree. Too many arguments provided.')
                 print('keys provided: {0}'.format(args))
@@ -131,9 +249,212 @@ class DataManagementSystem():
                 try:
                     tmp = tmp[key]
                 except KeyError:
-                    logging.info('DMS: Data not yet in DMS, loading...')
                     raise(KeyError('KeyError when retrieving: {0}'.format(key)))
 
         self.requeue(args[0])
-        logging.info('DMS: Data located in DMS, retrieving...')
         return tmp
+
+    def get_or_load(self, keys, loader, name=None, persist=True):
+        """Retrieves the values stored under each of keys. If any of them is missing, loader is called to produce the values of all of keys, in order, which are then added.
+
+        The loader of only one caller runs at a time for any given key. Concurrent callers that need a key which is being loaded wait for that load to finish and use its values, or check again if it did not load all of the keys they need, instead of loading the same data themselves. The values are handed over even if they are not kept, e.g., because they exceed max_memory.
+
+        :param keys: A list of depth 1 keys.
+        :param loader: A function with no arguments that returns a sequence of the values of keys, e.g., by reading the corresponding data files.
+        :param name: The name to record the loads of loader under in stats(), e.g., the name of the function that reads the data files. Defaults to the name of loader.
+        :param persist: False if the loaded values should only be kept in memory; see add_data().
+        :return: A list of the values of keys.
+        """
+        keys = list(keys)
+
+        # Only the caller that loads the keys counts them as misses; callers that wait for it count them as hits.
+        while True:
+            try:
+                values = [self._lookup(key) for key in keys]
+            except KeyError:
+                pass
+            else:
+                for key in keys:
+                    self._count('hits')
+
+                return values
+
+            with self._lock:
+                in_flight = []
+
+                for key in keys:
+                    event = self._loading.get(key, None)
+
+                    if event is not None and event not in in_flight:
+                        in_flight.append(event)
+
+                if not in_flight:
+                    done = _Load(keys)
+
+                    for key in keys:
+                        self._loading[key] = done
+
+                    self._stats['misses'] += len(keys)
+                    logging.info('DMS: Data not yet in DMS, loading...')
+
+                    break
+
+            for event in in_flight:
+                event.wait()
+
+            # Use the values of a load of all of keys as is; they may not have been kept.
+            loaded = getattr(in_flight[0], 'loaded', None) if len(in_flight) == 1 else None
+
+            if loaded is not None and all(key in loaded for key in keys):
+                for key in keys:
+                    self._count('hits')
+
+                return [loaded[key] for key in keys]
+
+        try:
+            start_time = time.perf_counter()
+            values = list(loader())
+
+            self._record_load(name or loader.__name__, time.perf_counter() - start_time, sum(self._sizeof(value) for value in values))
+
+            for key, value in zip(keys, values):
+                self.add_data(value, key, persist=persist)
+
+            done.loaded = dict(zip(keys, values))
+        finally:
+            with self._lock:
+                for key in keys:
+                    if self._loading.get(key) is done:
+                        del self._loading[key]
+
+            done.set()
+
+        return values
+
+    def _count(self, counter):
+        with self._lock:
+            self._stats[counter] += 1
+
+    def _record_load(self, name, load_time, nbytes):
+        """Records a load of nbytes from disk that took load_time seconds under the reader name."""
+        with self._lock:
+            reader = self._stats['readers'].setdefault(name, {'loads': 0, 'bytes loaded': 0, 'load time': 0.0})
+            reader['loads'] += 1
+            reader['bytes loaded'] += nbytes
+            reader['load time'] += load_time
+
+    def reset_stats(self):
+        """Resets the counters reported by stats()."""
+        with self._lock:
+            self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'readers': {}}
+
+    def stats(self):
+        """Returns a dictionary of the DMS's usage since it was created or its stats were last reset.
+
+        'hits' and 'misses' count the retrievals of data that was and was not loaded already. 'evictions' counts the entries popped to stay within max_memory. 'readers' maps the name of each function used to load data to its number of loads, the bytes loaded, and the total time spent loading in seconds; 'bytes loaded' and 'load time' are the totals over all readers.
+        """
+        with self._lock:
+            readers = {name: dict(reader) for name, reader in self._stats['readers'].items()}
+            lookups = self._stats['hits'] + self._stats['misses']
+
+            return {'hits': self._stats['hits'],
+                    'misses': self._stats['misses'],
+                    'hit rate': self._stats['hits']/lookups if lookups else None,
+                    'evictions': self._stats['evictions'],
+                    'entries': len(self.data),
+                    'memory used': self.memory_used,
+                    'max memory': self.max_memory,
+                    'bytes loaded': sum(reader['bytes loaded'] for reader in readers.values()),
+                    'load time': sum(reader['load time'] for reader in readers.values()),
+                    'readers': readers,
+                    }
+
+    def stats_summary(self):
+        """Returns stats() formatted as lines of text."""
+        stats = self.stats()
+
+        lines = ['Hits: {0}'.format(stats['hits']),
+                 'Misses: {0}'.format(stats['misses']),
+                 'Hit rate: {0}'.format('{0:.1%}'.format(stats['hit rate']) if stats['hit rate'] is not None else 'N/A'),
+                 'Evictions: {0}'.format(stats['evictions']),
+                 'Memory used: {0:,} of {1:,} bytes in {2} entries'.format(stats['memory used'], stats['max memory'], stats['entries']),
+                 'Loaded from disk: {0:,} bytes in {1:.2f} s'.format(stats['bytes loaded'], stats['load time']),
+                 ]
+
+        for name, reader in sorted(stats['readers'].items()):
+            lines.append('    {name}: {loads} loads, {bytes:,} bytes, {time:.2f} s'.format(name=name, loads=reader['loads'], bytes=reader['bytes loaded'], time=reader['load time']))
+
+        return '\n'.join(lines)
+
+    def _load_stored(self, key):
+        """Reads the persisted entry key from disk in place of its placeholder. Its placeholder is removed if it cannot be read.
+
+        Like get_or_load(), only one caller reads a given entry at a time; concurrent callers wait for that read to finish and then use its value.
+        """
+        while True:
+            with self._lock:
+                value = self.data.get(key, None)
+
+                if value is None:
+                    raise(KeyError('KeyError when retrieving: {0}'.format(key)))
+
+                # The entry was read or replaced while waiting.
+                if not isinstance(value, _StoredEntry):
+                    return value
+
+                in_flight = self._loading.get(key, None)
+
+                if in_flight is None:
+                    done = threading.Event()
+                    self._loading[key] = done
+
+                    break
+
+            in_flight.wait()
+
+        try:
+            try:
+                start_time = time.perf_counter()
+                value = self.store.load(key)
+            except KeyError:
+                with self._lock:
+                    if isinstance(self.data.get(key, None), _StoredEntry):
+                        del self.data[key]
+                        self.memory_used -= self._entry_sizes.pop(key, 0)
+
+                        if self.save_data:
+                            self.store.delete(key)
+
+                raise
+
+            self._record_load('saved data', time.perf_counter() - start_time, self._sizeof(value))
+
+            with self._lock:
+                # The entry may have been replaced or evicted while it was being read.
+                if isinstance(self.data.get(key, None), _StoredEntry):
+                    self.data[key] = value
+        finally:
+            with self._lock:
+                if self._loading.get(key) is done:
+                    del self._loading[key]
+
+            done.set()
+
+        return value
+
+
+class _Load(threading.Event):
+    """The load of the values of keys by get_or_load(), which is set when it finishes. If it succeeds, loaded maps each of keys to its value."""
+    def __init__(self, keys):
+        threading.Event.__init__(self)
+
+        self.keys = keys
+        self.loaded = None
+
+
+class _StoredEntry():
+    """A placeholder for a persisted DMS entry that has not been read from disk yet."""
+    __slots__ = ('size',)
+
+    def __init__(self, size):
+        self.size = size
@@ -0,0 +1,445 @@
+from __future__ import print_function, absolute_import
+
+from collections import OrderedDict
+import atexit
+import hashlib
+import pickle
+import logging
+import os
+import shutil
+import threading
+import weakref
+
+import numpy as np
+
+
+# The persistent stores to flush at exit, which are closed by a single exit handler.
+_open_stores = weakref.WeakSet()
+
+
+def _close_open_stores():
+    for store in list(_open_stores):
+        store.close()
+
+
+atexit.register(_close_open_stores)
+
+
+class PersistentStore():
+    """
+    A per-key on-disk store for the entries of a DataManagementSystem. Each entry is pickled to its own file in store_dir and an index of the entries, in queue order, is kept alongside them. Writes are deferred: put() and delete() only record the change, which is applied by a background thread every flush_interval seconds or by an explicit flush(). Every file is written to a temporary file first and then renamed so that an interrupted flush cannot corrupt the store.
+
+    :param store_dir: The path to the directory to store entries in.
+    :param flush_interval: The number of seconds between background flushes of pending changes.
+    """
+    INDEX_NAME = 'index.p'
+
+    # Marks a pending deletion.
+    _DELETED = object()
+
+    def __init__(self, store_dir, flush_interval=5.0):
+        self.store_dir = store_dir
+        self.flush_interval = flush_interval
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+        # Entry sizes keyed by entry key in queue order, and changes not yet written to disk.
+        self._index = self._load_index()
+        self._pending = {}
+        self._index_dirty = False
+
+        self._stop = threading.Event()
+        self._thread = None
+
+        _open_stores.add(self)
+
+    def _path(self, key):
+        return os.path.join(self.store_dir, hashlib.sha1(str(key).encode('utf-8')).hexdigest() + '.p')
+
+    def _load_index(self):
+        try:
+            with open(os.path.join(self.store_dir, self.INDEX_NAME), 'rb') as pfile:
+                return OrderedDict(pickle.load(pfile))
+        except FileNotFoundError:
+            return OrderedDict()
+        except (OSError, pickle.PickleError, EOFError, ValueError, TypeError):
+            logging.error('DMS: Could not load the index of {0}; starting with an empty store.'.format(self.store_dir))
+            return OrderedDict()
+
+    @property
+    def index(self):
+        """A list of (key, size) tuples of the stored entries in queue order."""
+        with self._lock:
+            return list(self._index.items())
+
+    def load(self, key):
+        """Retrieves the value stored under key. Raises KeyError if there is no such entry or it cannot be read."""
+        with self._lock:
+            if key not in self._index:
+                raise KeyError(key)
+
+            value = self._pending.get(key, None)
+
+        if value is not None and value is not self._DELETED:
+            return value
+
+        try:
+            with open(self._path(key), 'rb') as pfile:
+                return pickle.load(pfile)
+        except (OSError, pickle.PickleError, EOFError):
+            logging.error('DMS: Could not load {0} from {1}.'.format(key, self.store_dir))
+            raise KeyError(key)
+
+    def put(self, key, value, size):
+        """Schedules value, with in-memory footprint size, to be stored under key and moves key to the back of the queue."""
+        with self._lock:
+            self._index[key] = size
+            self._index.move_to_end(key)
+            self._pending[key] = value
+            self._index_dirty = True
+
+        self._start()
+
+    def delete(self, key):
+        """Schedules the entry stored under key to be deleted."""
+        with self._lock:
+            if self._index.pop(key, None) is None:
+                return
+
+            self._pending[key] = self._DELETED
+            self._index_dirty = True
+
+        self._start()
+
+    def touch(self, key):
+        """Moves key to the back of the queue."""
+        with self._lock:
+            if key in self._index:
+                self._index.move_to_end(key)
+                self._index_dirty = True
+
+    def _start(self):
+        """Starts the background flushing thread if it is not running."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='DMS store flush', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def _write(self, path, value):
+        tmp_path = path + '.tmp'
+
+        with open(tmp_path, 'wb') as pfile:
+            pickle.dump(value, pfile, protocol=3)
+
+        os.replace(tmp_path, path)
+
+    def flush(self):
+        """Writes all pending changes to disk."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._index_dirty:
+                    return
+
+                pending = self._pending
+                self._pending = {}
+                index = list(self._index.items())
+                self._index_dirty = False
+
+            try:
+                os.makedirs(self.store_dir, exist_ok=True)
+
+                for key, value in pending.items():
+                    if value is self._DELETED:
+                        try:
+                            os.remove(self._path(key))
+                        except FileNotFoundError:
+                            pass
+                    else:
+                        self._write(self._path(key), value)
+
+                self._write(os.path.join(self.store_dir, self.INDEX_NAME), index)
+            except OSError as e:
+                logging.error('DMS: Could not save to {0}. ({1})'.format(self.store_dir, e))
+
+                # Retry the changes that were not written at the next flush, unless they have been superseded.
+                with self._lock:
+                    for key, value in pending.items():
+                        self._pending.setdefault(key, value)
+
+                    self._index_dirty = True
+            else:
+                logging.info('DMS: Saved {n} changes to {path}.'.format(n=len(pending), path=self.store_dir))
+
+    def close(self):
+        """Stops the background flushing thread and writes all pending changes to disk."""
+        self._stop.set()
+        self.flush()
+
+    def clear(self):
+        """Deletes all stored entries."""
+        with self._flush_lock:
+            with self._lock:
+                keys = list(self._index.keys()) + list(self._pending.keys())
+                self._index = OrderedDict()
+                self._pending = {}
+                self._index_dirty = False
+
+            for key in keys:
+                try:
+                    os.remove(self._path(key))
+                except FileNotFoundError:
+                    pass
+
+            try:
+                os.remove(os.path.join(self.store_dir, self.INDEX_NAME))
+            except FileNotFoundError:
+                pass
+
+
+class ArrayStore():
+    """
+    An on-disk store of NumPy ndarrays that are served back memory-mapped. Each array is written to its own .npy file in store_dir and read with np.load(mmap_mode='r'), so that it occupies shared page cache instead of process memory and several processes can read the same array without copying it.
+
+    Stored arrays are never overwritten: an array may be mapped by a reader at any time, and replacing a mapped file fails on Windows. Each version of a key is instead written to a file named after the key and a hash of its contents, and a small reference file, which is never mapped, names the current version of the key. Putting a new version of a key repoints its reference file; the file of the previous version is deleted at the next eviction. The files are limited to max_size bytes in total; the least recently used ones are deleted to make room for new arrays. Files that cannot be deleted because they are still mapped are retried at the next eviction.
+
+    :param store_dir: The path to the directory to store arrays in.
+    :param max_size: The maximum number of bytes the stored arrays may occupy on disk, or None for no limit.
+    """
+    DEFAULT_MAX_SIZE = 2*1024**3
+
+    def __init__(self, store_dir, max_size=DEFAULT_MAX_SIZE):
+        self.store_dir = store_dir
+        self.max_size = max_size
+
+        self._lock = threading.Lock()
+
+        # Sizes of the files of current versions keyed by path, least recently used first, and of the files of superseded versions to delete.
+        self._index, self._stale = self._scan()
+        self.size = sum(self._index.values()) + sum(self._stale.values())
+
+    def _scan(self):
+        """Lists the stored files of current versions in order of last use, which is recorded as their modification time, and the files of superseded versions."""
+        try:
+            entries = list(os.scandir(self.store_dir))
+        except FileNotFoundError:
+            return OrderedDict(), {}
+
+        current = set()
+
+        for entry in entries:
+            if entry.name.endswith('.ref'):
+                try:
+                    with open(entry.path, 'r') as reffile:
+                        current.add(os.path.join(self.store_dir, reffile.read().strip()))
+                except OSError:
+                    pass
+
+        arrays = sorted((entry for entry in entries if entry.name.endswith('.npy')), key=lambda entry: entry.stat().st_mtime)
+
+        index = OrderedDict((entry.path, entry.stat().st_size) for entry in arrays if entry.path in current)
+        stale = {entry.path: entry.stat().st_size for entry in arrays if entry.path not in current}
+
+        return index, stale
+
+    @staticmethod
+    def can_store(value):
+        """Returns True if value is an ndarray that can be memory-mapped."""
+        return isinstance(value, np.ndarray) and not value.dtype.hasobject and value.size > 0
+
+    @staticmethod
+    def _name(key):
+        return hashlib.sha1(str(key).encode('utf-8')).hexdigest()
+
+    def _ref_path(self, key):
+        return os.path.join(self.store_dir, self._name(key) + '.ref')
+
+    def _version_path(self, key, value):
+        """Returns the path of the file of the version value of key."""
+        content = hashlib.sha1('{0}{1}'.format(value.dtype.str, value.shape).encode('utf-8'))
+        content.update(np.ascontiguousarray(value))
+
+        return os.path.join(self.store_dir, '{0}.{1}.npy'.format(self._name(key), content.hexdigest()[:16]))
+
+    def _current(self, key):
+        """Returns the path of the file of the current version of key, or None if key is not stored."""
+        try:
+            with open(self._ref_path(key), 'r') as reffile:
+                return os.path.join(self.store_dir, reffile.read().strip())
+        except OSError:
+            return None
+
+    def __contains__(self, key):
+        return self._current(key) is not None
+
+    def _touch(self, path):
+        """Moves path to the back of the eviction queue."""
+        with self._lock:
+            if path in self._index:
+                self._index.move_to_end(path)
+
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _track(self, path):
+        """Adds the file at path to the back of the eviction queue as the file of a current version."""
+        file_size = os.path.getsize(path)
+
+        with self._lock:
+            previous = self._index.pop(path, None)
+
+            if previous is None:
+                previous = self._stale.pop(path, 0)
+
+            self.size += file_size - previous
+            self._index[path] = file_size
+
+    def load(self, key):
+        """Retrieves the read-only memory-mapped array stored under key. Raises KeyError if there is no such array or it cannot be read."""
+        path = self._current(key)
+
+        if path is None:
+            raise KeyError(key)
+
+        try:
+            value = np.load(path, mmap_mode='r')
+        except FileNotFoundError:
+            # The version was superseded and deleted while the reference was being read.
+            raise KeyError(key)
+        except (OSError, ValueError):
+            logging.error('DMS: Could not load {0} from {1}, discarding...'.format(key, self.store_dir))
+            self.delete(key)
+
+            raise KeyError(key)
+
+        self._touch(path)
+
+        return value
+
+    def put(self, key, value):
+        """Writes the ndarray value to disk under key. If a different version of key is stored, key is pointed at the new version and the file of the previous version is deleted at the next eviction."""
+        path = self._version_path(key, value)
+        current = self._current(key)
+
+        if path == current and os.path.exists(path):
+            self._touch(path)
+            return
+
+        os.makedirs(self.store_dir, exist_ok=True)
+
+        tmp_suffix = '.{0}.{1}.tmp'.format(os.getpid(), threading.get_ident())
+
+        if not os.path.exists(path):
+            with open(path + tmp_suffix, 'wb') as npyfile:
+                np.save(npyfile, value, allow_pickle=False)
+
+            try:
+                os.replace(path + tmp_suffix, path)
+            except OSError:
+                # The same version was stored by someone else in the meantime and is mapped.
+                os.remove(path + tmp_suffix)
+
+        self._track(path)
+
+        ref_path = self._ref_path(key)
+
+        try:
+            with open(ref_path + tmp_suffix, 'w') as reffile:
+                reffile.write(os.path.basename(path))
+
+            os.replace(ref_path + tmp_suffix, ref_path)
+        except OSError as e:
+            logging.warning('DMS: Could not store a new version of {0}; it will be retried. ({1})'.format(key, e))
+
+            try:
+                os.remove(ref_path + tmp_suffix)
+            except OSError:
+                pass
+
+            self._supersede(path)
+        else:
+            if current is not None and current != path:
+                self._supersede(current)
+
+        self._evict()
+
+    def _supersede(self, path):
+        """Marks the file at path as no longer current, to be deleted at the next eviction."""
+        with self._lock:
+            file_size = self._index.pop(path, None)
+
+            if file_size is not None:
+                self._stale[path] = file_size
+
+    def _remove(self, path):
+        """Deletes the file at path. Returns False if it could not be deleted, e.g., because it is mapped on Windows, in which case it is retried at the next eviction."""
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logging.warning('DMS: Could not delete {0}; it will be retried. ({1})'.format(path, e))
+            self._supersede(path)
+            return False
+
+        with self._lock:
+            self.size -= self._index.pop(path, 0) + self._stale.pop(path, 0)
+
+        return True
+
+    def _release(self, path):
+        """Deletes the reference file that names the file at path as a current version, if any."""
+        ref_path = os.path.join(self.store_dir, os.path.basename(path).split('.')[0] + '.ref')
+
+        try:
+            with open(ref_path, 'r') as reffile:
+                if reffile.read().strip() != os.path.basename(path):
+                    return
+
+            os.remove(ref_path)
+        except OSError:
+            pass
+
+    def _evict(self):
+        """Deletes the files of superseded versions, then the least recently used arrays until the store is within max_size."""
+        with self._lock:
+            stale = list(self._stale)
+
+        for path in stale:
+            self._remove(path)
+
+        if self.max_size is None:
+            return
+
+        with self._lock:
+            queue = list(self._index)
+
+        # The most recently used array is kept even if it alone exceeds max_size.
+        for path in queue[:-1]:
+            if self.size <= self.max_size:
+                break
+
+            self._release(path)
+            self._remove(path)
+
+    def delete(self, key):
+        """Deletes the array stored under key."""
+        path = self._current(key)
+
+        if path is not None:
+            self._release(path)
+            self._remove(path)
+
+    def clear(self):
+        """Deletes all stored arrays."""
+        shutil.rmtree(self.store_dir, ignore_errors=True)
+
+        with self._lock:
+            self._index, self._stale = self._scan()
+            self.size = sum(self._index.values()) + sum(self._stale.values())
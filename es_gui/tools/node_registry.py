@@ -0,0 +1,121 @@
+from __future__ import print_function, absolute_import
+
+import logging
+import os
+import threading
+
+import pandas as pd
+
+
+NODES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'apps', 'data_manager', '_static')
+
+
+class NodeRegistry():
+    """
+    A registry of the pricing nodes of each market area. The static node table of a market area is read the first time it is needed and then kept for the rest of the process, along with an index of its nodes by node ID and by node name for constant-time lookups.
+
+    :param nodes_dir: The path to the directory of the nodes_<iso>.csv node tables.
+    """
+    # File name and encoding of the node table of each market area.
+    TABLES = {
+        'ERCOT': ('nodes_ercot.csv', 'utf-8-sig'),
+        'PJM': ('nodes_pjm.csv', None),
+        'MISO': ('nodes_miso.csv', 'utf-8-sig'),
+        'NYISO': ('nodes_nyiso.csv', None),
+        'ISONE': ('nodes_isone.csv', 'cp1252'),
+        'SPP': ('nodes_spp.csv', 'cp1252'),
+        'CAISO': ('nodes_caiso.csv', None),
+    }
+
+    def __init__(self, nodes_dir=NODES_DIR):
+        self.nodes_dir = nodes_dir
+
+        self._lock = threading.Lock()
+        self._tables = {}
+        self._ids = {}
+        self._names = {}
+
+    def _load(self, iso):
+        """Reads the node table of iso and indexes it, unless it has already been loaded."""
+        if iso in self._tables:
+            return
+
+        with self._lock:
+            if iso in self._tables:
+                return
+
+            try:
+                fname, encoding = self.TABLES[iso]
+            except KeyError:
+                raise ValueError('Invalid market_area given (got {0})'.format(iso))
+
+            node_df = pd.read_csv(os.path.join(self.nodes_dir, fname), index_col=False, encoding=encoding)
+
+            # Zone IDs are read as floats when any are missing; keep them comparable to node IDs otherwise.
+            if 'Zone ID' in node_df.columns and node_df['Zone ID'].dtype.kind == 'f' and node_df['Zone ID'].notna().all():
+                node_df['Zone ID'] = node_df['Zone ID'].astype(int)
+
+            records = node_df.to_dict('records')
+
+            # Lookups by node ID take precedence over lookups by node name; the first row of a duplicated node wins.
+            ids = {}
+            names = {}
+
+            for record in records:
+                ids.setdefault(str(record['Node ID']), record)
+                names.setdefault(str(record['Node Name']), record)
+
+            self._ids[iso] = ids
+            self._names[iso] = names
+            self._tables[iso] = node_df
+
+            logging.info('NodeRegistry: Loaded {n} {iso} nodes.'.format(n=len(node_df), iso=iso))
+
+    def table(self, iso):
+        """Retrieves the node table of iso as a pandas DataFrame. The DataFrame is shared and should not be modified."""
+        self._load(iso)
+
+        return self._tables[iso]
+
+    def get(self, iso, node):
+        """Retrieves the row of the node table of iso for the node with ID or name node as a dictionary keyed by column name, or None if there is no such node."""
+        self._load(iso)
+
+        key = str(node)
+        record = self._ids[iso].get(key)
+
+        if record is None:
+            record = self._names[iso].get(key)
+
+        return record
+
+    def _lookup(self, iso, node, column):
+        record = self.get(iso, node)
+
+        if record is None:
+            return None
+
+        return record.get(column)
+
+    def zone(self, iso, node):
+        """Retrieves the ID of the zone of the node with ID or name node, or None if the node does not exist or iso has no zones."""
+        return self._lookup(iso, node, 'Zone ID')
+
+    def node_type(self, iso, node):
+        """Retrieves the type of the node with ID or name node, e.g., 'Location' or 'Bus' in SPP, or None if the node does not exist or iso has no node types."""
+        return self._lookup(iso, node, 'Node Type')
+
+    def reserve_zone(self, iso, node):
+        """Retrieves the ID of the reserve zone of the node with ID or name node, or None if the node does not exist or iso has no reserve zones."""
+        return self._lookup(iso, node, 'Reserve ID')
+
+    def clear(self):
+        """Discards all loaded node tables so that they are read again the next time they are needed."""
+        with self._lock:
+            self._tables = {}
+            self._ids = {}
+            self._names = {}
+
+
+# The node registry shared by the whole process.
+node_registry = NodeRegistry()
@@ -1,19 +1,32 @@
 from abc import ABCMeta, abstractmethod, abstractproperty
+from contextlib import contextmanager
+from datetime import datetime
+import json
 import logging
+import time
 
 from six import with_metaclass
 from pyomo.environ import *
 
 
+
 class Optimizer(with_metaclass(ABCMeta)):
     """Abstract base class for Pyomo ConcreteModel optimization framework."""
 
+    # Path to a JSON lines file to append the run_stats of every run to; None to disable.
+    stats_log = None
+
     def __init__(self, solver='glpk'):
         self._model = ConcreteModel()
         self._solver = solver
 
         self._results = None
 
+        # The solver instance reused across solves, the name of the solver it was created for, and the instrumentation of the most recent run.
+        self._solver_instance = None
+        self._solver_instance_name = None
+        self._run_stats = None
+
     @property
     def model(self):
         """Pyomo ConcreteModel."""
@@ -29,6 +42,15 @@ class Optimizer(with_metaclass(ABCMeta)):
         """A results DataFrame containing series of indices, decision variables, and/or model parameters or derived quantities."""
         return self._results
 
+    @property
+    def run_stats(self):
+        """A dictionary of instrumentation from the most recent run: wall time of each phase [s], model size, and solver status and iteration count."""
+        return self._run_stats
+
+    @run_stats.setter
+    def run_stats(self, value):
+        self._run_stats = value
+
     @abstractmethod
     def _set_model_param(self):
         """A method for assigning model parameters and their default values to the model."""
@@ -50,18 +72,33 @@ class Optimizer(with_metaclass(ABCMeta)):
         pass
 
     def solve_model(self):
-        """Solves the model using the specified solver."""
+        """Solves the model using the specified solver and processes the results, recording run_stats for the solve."""
+        self._start_run_stats()
+        self._solve_and_process()
+
+    def _call_solver(self, warmstart=False):
+        """Calls the specified solver on the model, reusing the solver instance across calls. Warm-starts from the current variable values if requested and supported by the solver. The solution is not loaded into the model, except by NEOS; see _load_solver_results()."""
         if self.solver == 'neos':
             opt = SolverFactory('cbc')
             solver_manager = SolverManagerFactory('neos')
-            results = solver_manager.solve(self.model, opt=opt)
-        else:
-            solver = SolverFactory(self.solver)
-            results = solver.solve(self.model, tee=False, keepfiles=False)
 
-        assert (results.solver.termination_condition.key == 'optimal')
+            return solver_manager.solve(self.model, opt=opt)
+
+        if self._solver_instance is None or self._solver_instance_name != self.solver:
+            self._solver_instance = SolverFactory(self.solver)
+            self._solver_instance_name = self.solver
+
+        solver = self._solver_instance
+
+        if warmstart and getattr(solver, 'warm_start_capable', lambda: False)():
+            return solver.solve(self.model, tee=True, keepfiles=False, load_solutions=False, warmstart=True)
 
-        self._process_results()
+        return solver.solve(self.model, tee=True, keepfiles=False, load_solutions=False)
+
+    def _load_solver_results(self, results):
+        """Loads the solution in the solver results into the model."""
+        if self.solver != 'neos':
+            self.model.solutions.load_from(results)
 
     @abstractmethod
     def _process_results(self):
@@ -75,29 +112,108 @@ class Optimizer(with_metaclass(ABCMeta)):
 
     def run(self):
         """Instantiates, creates, and solves the optimizer model based on supplied information. Use if no steps are needed between constructing the model and solving it."""
-        self.instantiate_model()
-        self.populate_model()
+        self._start_run_stats()
 
-        if self.solver == 'neos':
-            opt = SolverFactory('cbc')
-            solver_manager = SolverManagerFactory('neos')
-            results = solver_manager.solve(self.model, opt=opt)
-        else:
-            solver = SolverFactory(self.solver)
-            results = solver.solve(self.model, tee=True, keepfiles=False)
+        with self._time_phase('instantiate_model'):
+            self.instantiate_model()
+
+        with self._time_phase('populate_model'):
+            self.populate_model()
+
+        self._solve_and_process()
+
+        return self.get_results()
+
+    def _solve_and_process(self, warmstart=False):
+        """Solves the model, records the solver statistics, and processes the results."""
+        # Includes writing the problem file for the solver and running it; loading the solution into the model is timed separately.
+        with self._time_phase('solve'):
+            results = self._call_solver(warmstart=warmstart)
+
+        self._record_solver_stats(results)
 
         try:
-            assert (results.solver.termination_condition.key == 'optimal')
+            assert (results.solver.termination_condition == TerminationCondition.optimal)
         except AssertionError as e:
             logging.error('Optimizer: An optimal solution could not be obtained. (Infeasible problem?)')
+            self._write_run_stats()
             raise(e)
         else:
-            self._process_results()
+            with self._time_phase('read_solution'):
+                self._load_solver_results(results)
 
-        return self.get_results()
+            with self._time_phase('process_results'):
+                self._process_results()
+
+        self._write_run_stats()
+
+    def _run_stats_labels(self):
+        """Returns a dictionary of labels identifying the run in run_stats."""
+        return {'optimizer': type(self).__name__, 'solver': self.solver}
+
+    def _start_run_stats(self):
+        """Resets run_stats for a new run."""
+        self.run_stats = {'time': datetime.now().isoformat(), 'phases': {},
+                          'variables': None, 'constraints': None, 'nonzeros': None,
+                          'status': None, 'termination_condition': None, 'iterations': None, 'solver_time': None}
+        self.run_stats.update(self._run_stats_labels())
+
+    @contextmanager
+    def _time_phase(self, phase):
+        """Records the wall time of the enclosed block as the given phase in run_stats."""
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self.run_stats['phases'][phase] = time.perf_counter() - start
+
+    def _record_solver_stats(self, results):
+        """Records the model size and solver statistics from Pyomo solver results in run_stats."""
+        stats = self.run_stats
+
+        stats['variables'] = self.model.nvariables()
+        stats['constraints'] = self.model.nconstraints()
+        stats['nonzeros'] = _result_value(results.problem, 'number_of_nonzeros')
+
+        stats['status'] = str(results.solver.status)
+        stats['termination_condition'] = str(results.solver.termination_condition)
+        stats['solver_time'] = _result_value(results.solver, 'wallclock_time', 'time')
+
+        try:
+            stats['iterations'] = _result_value(results.solver.statistics, 'number_of_iterations', 'iterations')
+        except AttributeError:
+            stats['iterations'] = None
+
+    def _write_run_stats(self):
+        """Appends run_stats to the stats_log JSON lines file, if any."""
+        if not self.stats_log:
+            return
+
+        try:
+            with open(self.stats_log, 'a') as stats_file:
+                stats_file.write(json.dumps(self.run_stats, default=str) + '\n')
+        except OSError as e:
+            logging.warning('Optimizer: Could not write run statistics to {fname}: ({error})'.format(fname=self.stats_log, error=e))
 
     def set_model_parameters(self, **kwargs):
         """Sets model parameters in kwargs to their respective values."""
         for kw_key, kw_value in kwargs.items():
             logging.info('Optimizer: Setting {param} to {value}'.format(param=kw_key, value=kw_value))
-            setattr(self.model, kw_key, kw_value)
\ No newline at end of file
+            setattr(self.model, kw_key, kw_value)
+
+
+def _result_value(container, *names):
+    """Returns the first of names defined in a Pyomo results container as a number, or None."""
+    for name in names:
+        try:
+            value = getattr(container, name)
+        except AttributeError:
+            continue
+
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            continue
+
+    return None
@@ -0,0 +1,120 @@
+from __future__ import print_function, absolute_import
+
+import io
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+
+
+class MarketStore():
+    """
+    A columnar on-disk store of ingested ISO market data. Each market series of a month is saved to its own .npz file holding the hourly values and a small JSON metadata header, so that a node-month can be loaded without parsing the raw vendor files again. Series of a pricing node, e.g., the LMP, are stored per node; market-wide series, e.g., regulation prices, are stored once for all nodes.
+
+    The store of each market area is kept in the STORE directory of its data bank directory, e.g., data/PJM/STORE/. The stored series are not checked against the raw files they were read from; deleting the directory causes the data to be read from the raw files again.
+
+    :param root: The path to the root of the valuation data bank.
+    :param dtype: The NumPy dtype to store values as, e.g., np.float32 to halve the size of the store.
+    """
+    DIR_NAME = 'STORE'
+    VERSION = 1
+
+    # Directory name of the market-wide series.
+    MARKET_DIR = '_market'
+
+    def __init__(self, root, dtype=np.float64):
+        self.root = root
+        self.dtype = dtype
+
+    def path(self, iso, series, year, month, node=None):
+        """Returns the path of the file of a market series for a month, or of a node's series for a month if node is given."""
+        year = int(year)
+        month = int(month)
+
+        return os.path.join(self.root, iso, self.DIR_NAME, self.MARKET_DIR if node is None else str(node), str(year),
+                            '{0:d}{1:02d}_{2}.npz'.format(year, month, series))
+
+    def load(self, iso, series, year, month, node=None):
+        """Retrieves the values of a series and its metadata. Raises KeyError if the series has not been ingested or cannot be read.
+
+        :return: values, meta: A NumPy ndarray of the values and a dictionary of the metadata.
+        """
+        path = self.path(iso, series, year, month, node)
+
+        try:
+            with np.load(path, allow_pickle=False) as npzfile:
+                meta = json.loads(str(npzfile['meta']))
+                values = npzfile['values']
+        except FileNotFoundError:
+            raise KeyError(path)
+        except (OSError, ValueError, KeyError):
+            logging.error('MarketStore: Could not load {0}, discarding...'.format(path))
+            self._discard(path)
+
+            raise KeyError(path)
+
+        if meta.get('version') != self.VERSION:
+            raise KeyError(path)
+
+        return values, meta
+
+    def save(self, iso, series, year, month, values, node=None):
+        """Writes the values of a series to the store."""
+        values = np.asarray(values, dtype=self.dtype)
+        meta = {'version': self.VERSION,
+                'iso': iso,
+                'series': series,
+                'node': None if node is None else str(node),
+                'year': int(year),
+                'month': int(month),
+                'dtype': values.dtype.name,
+                'length': len(values),
+                'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                }
+
+        path = self.path(iso, series, year, month, node)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to a temporary file first so that an interrupted write cannot leave a corrupt file.
+        buffer = io.BytesIO()
+        np.savez(buffer, values=values, meta=np.array(json.dumps(meta)))
+
+        tmp_path = '{0}.{1}.{2}.tmp'.format(path, os.getpid(), threading.get_ident())
+
+        with open(tmp_path, 'wb') as npzfile:
+            npzfile.write(buffer.getvalue())
+
+        os.replace(tmp_path, path)
+
+    def load_group(self, iso, series, year, month, node=None):
+        """Retrieves the values of each of series. Raises KeyError if any of them has not been ingested.
+
+        :param series: A list of series names.
+        :return: A list of NumPy ndarrays of the values of series.
+        """
+        return [self.load(iso, name, year, month, node)[0] for name in series]
+
+    def save_group(self, iso, series, year, month, values, node=None):
+        """Writes the values of each of series to the store.
+
+        :param series: A list of series names.
+        :param values: A sequence of the array-like values of series, in order.
+        """
+        for name, value in zip(series, values):
+            self.save(iso, name, year, month, value, node)
+
+    def _discard(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def clear(self, iso):
+        """Deletes the store of the market area iso."""
+        shutil.rmtree(os.path.join(self.root, iso, self.DIR_NAME), ignore_errors=True)
+
+        logging.info('MarketStore: Cleared the {0} store.'.format(iso))
@@ -0,0 +1,245 @@
+from __future__ import division, print_function, absolute_import
+
+import logging
+import math
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.optimize import linprog
+
+
+class MatrixFormulation:
+    """Assembles the valuation linear programs directly into sparse matrices, bypassing Pyomo expression generation.
+
+    The formulations are identical to the ones generated by ExpressionsBlock for each market_type. The resulting problem is of the form: minimize c'x subject to A_ub x <= b_ub, A_eq x == b_eq, and lb <= x <= ub, where c is the negated objective since the valuation models maximize revenue.
+    """
+
+    # Decision variables (other than the state of charge) used by each market formulation.
+    MARKET_VARS = {
+        'arbitrage': ('q_r', 'q_d'),
+        'ercot_arbreg': ('q_r', 'q_d', 'q_ru', 'q_rd'),
+        'pjm_pfp': ('q_r', 'q_d', 'q_reg'),
+        'miso_pfp': ('q_r', 'q_d', 'q_reg'),
+        'isone_pfp': ('q_r', 'q_d', 'q_reg'),
+        'nyiso_pfp': ('q_r', 'q_d', 'q_reg'),
+        'spp_pfp': ('q_r', 'q_d', 'q_ru', 'q_rd'),
+        'caiso_pfp': ('q_r', 'q_d', 'q_ru', 'q_rd'),
+    }
+
+    def __init__(self, market_type):
+        self._market_type = market_type
+
+        self._n_time = 0
+        self._offsets = {}
+        self._stats = {}
+
+    @property
+    def market_type(self):
+        """The market formulation to create matrices for."""
+        return self._market_type
+
+    @market_type.setter
+    def market_type(self, value):
+        self._market_type = value
+
+    @property
+    def n_time(self):
+        """The number of timesteps in the formulation."""
+        return self._n_time
+
+    @property
+    def stats(self):
+        """A dictionary of the model size and solver statistics from the most recent solve."""
+        return self._stats
+
+    @property
+    def n_var(self):
+        """The number of columns (decision variables) in the formulation."""
+        return (self.n_time + 1) + self.n_time*len(self.MARKET_VARS[self.market_type])
+
+    def _column(self, var, t):
+        """Returns the column indices of var at timestep(s) t."""
+        return self._offsets[var] + t
+
+    def _series(self, model, name):
+        """Returns the model attribute name as a float64 ndarray of length n_time. Scalars are broadcast."""
+        value = getattr(model, name)
+
+        if np.isscalar(value):
+            return np.full(self.n_time, float(value))
+
+        array = np.asarray(value, dtype=float).ravel()
+
+        if len(array) < self.n_time:
+            # Mirrors the IndexError raised by ExpressionsBlock when an array-like is too short.
+            raise IndexError('{name} has length {n} but {T} timesteps are required.'.format(name=name, n=len(array), T=self.n_time))
+
+        return array[:self.n_time]
+
+    def build(self, model):
+        """Assembles the objective vector, constraint matrices, and variable bounds for model.
+
+        :param model: A Pyomo ConcreteModel with its time series data and model parameters already assigned.
+        :return: A dictionary with keys 'c', 'c0', 'A_ub', 'b_ub', 'A_eq', 'b_eq', and 'bounds'.
+        """
+        if self.market_type not in self.MARKET_VARS:
+            raise ValueError('Invalid market type specified!')
+
+        m = model
+        T = len(m.time)
+        self._n_time = T
+
+        # Column layout: [s_0 ... s_T, var_0 block, var_1 block, ...].
+        self._offsets = {'s': 0}
+        offset = T + 1
+
+        for var in self.MARKET_VARS[self.market_type]:
+            self._offsets[var] = offset
+            offset += T
+
+        n = self.n_var
+        t = np.arange(T)
+
+        E = m.Energy_capacity
+        soc_init = m.State_of_charge_init*E
+        soc_min = m.State_of_charge_min*E
+        soc_max = m.State_of_charge_max*E
+        rte = m.Round_trip_efficiency
+
+        price_electricity = self._series(m, 'price_electricity')
+        discount = np.power(math.e, -t*m.R)
+
+        # Objective (revenue to be maximized) coefficients and constant term.
+        c = np.zeros(n)
+        c0 = 0.0
+
+        c[self._column('q_d', t)] = price_electricity
+        c[self._column('q_r', t)] = -price_electricity
+
+        # State of charge dynamics coefficients for the regulation products.
+        soc_up = None
+        soc_down = None
+
+        if self.market_type in {'ercot_arbreg', 'spp_pfp', 'caiso_pfp'}:
+            fraction_reg_up = self._series(m, 'fraction_reg_up')
+            fraction_reg_down = self._series(m, 'fraction_reg_down')
+
+            c[self._column('q_ru', t)] = self._series(m, 'price_reg_up') + price_electricity*fraction_reg_up
+            c[self._column('q_rd', t)] = self._series(m, 'price_reg_down') - price_electricity*fraction_reg_down
+
+            if self.market_type == 'caiso_pfp':
+                # These terms do not depend on any decision variables.
+                c0 = np.sum((self._series(m, 'perf_score_ru')*self._series(m, 'mi_mult_ru')*self._series(m, 'price_reg_serv_up')
+                             + self._series(m, 'perf_score_rd')*self._series(m, 'mi_mult_rd')*self._series(m, 'price_reg_serv_down'))
+                            * discount)
+
+            soc_up = ('q_ru', fraction_reg_up)
+            soc_down = ('q_rd', rte*fraction_reg_down)
+        elif self.market_type in {'pjm_pfp', 'miso_pfp', 'isone_pfp', 'nyiso_pfp'}:
+            fraction_reg_up = self._series(m, 'fraction_reg_up')
+            fraction_reg_down = self._series(m, 'fraction_reg_down')
+            perf_score = self._series(m, 'perf_score')
+            price_regulation = self._series(m, 'price_regulation')
+
+            if self.market_type in {'pjm_pfp', 'isone_pfp'}:
+                c_reg = perf_score*(self._series(m, 'mi_mult')*self._series(m, 'price_reg_service') + price_regulation)
+            elif self.market_type == 'miso_pfp':
+                c_reg = (1 + m.Make_whole)*perf_score*price_regulation
+            else:
+                c_reg = price_electricity*(fraction_reg_up - fraction_reg_down) + price_regulation*(1 - 1.1*(1 - perf_score))
+
+            c[self._column('q_reg', t)] = c_reg
+
+            # The single regulation product both charges and discharges the device.
+            soc_up = ('q_reg', fraction_reg_up - rte*fraction_reg_down)
+
+        c *= np.concatenate([np.zeros(T + 1), np.tile(discount, len(self.MARKET_VARS[self.market_type]))])
+        c0 = float(c0)
+
+        # Equality constraints: state of charge dynamics, initial and final state of charge.
+        rows = [t, t, t, t]
+        cols = [self._column('s', t), self._column('s', t + 1), self._column('q_r', t), self._column('q_d', t)]
+        vals = [np.full(T, float(m.Self_discharge_efficiency)), -np.ones(T), np.full(T, float(rte)), -np.ones(T)]
+
+        if soc_up is not None:
+            rows.append(t)
+            cols.append(self._column(soc_up[0], t))
+            vals.append(-soc_up[1])
+
+        if soc_down is not None:
+            rows.append(t)
+            cols.append(self._column(soc_down[0], t))
+            vals.append(soc_down[1])
+
+        rows.extend([np.array([T]), np.array([T + 1])])
+        cols.extend([np.array([self._column('s', 0)]), np.array([self._column('s', T)])])
+        vals.extend([np.ones(1), np.ones(1)])
+
+        A_eq = sp.csr_matrix((np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))), shape=(T + 2, n))
+        b_eq = np.concatenate([np.zeros(T), [soc_init, soc_init]])
+
+        # Inequality constraints.
+        lb = np.zeros(n)
+        ub = np.full(n, np.inf)
+
+        power_vars = self.MARKET_VARS[self.market_type]
+        rows = [t for _ in power_vars]
+        cols = [self._column(var, t) for var in power_vars]
+        vals = [np.ones(T) for _ in power_vars]
+        b_ub = [np.full(T, float(m.Power_rating))]
+
+        if self.market_type == 'arbitrage':
+            # The state of charge limits apply to every element of soc_time; they are imposed as bounds.
+            lb[self._column('s', np.arange(T + 1))] = max(soc_min, 0)
+            ub[self._column('s', np.arange(T + 1))] = soc_max
+        else:
+            # Reserve requirements on the state of charge.
+            reg_min_var = 'q_reg' if 'q_reg' in power_vars else 'q_ru'
+            reg_max_var = 'q_reg' if 'q_reg' in power_vars else 'q_rd'
+
+            rows.extend([T + t, T + t, 2*T + t, 2*T + t])
+            cols.extend([self._column(reg_min_var, t), self._column('s', t + 1), self._column(reg_max_var, t), self._column('s', t + 1)])
+            vals.extend([np.full(T, float(m.Reserve_reg_min)), -np.ones(T), np.full(T, float(rte*m.Reserve_reg_max)), np.ones(T)])
+            b_ub.extend([np.full(T, -float(soc_min)), np.full(T, float(soc_max))])
+
+        b_ub = np.concatenate(b_ub)
+        A_ub = sp.csr_matrix((np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))), shape=(len(b_ub), n))
+
+        return {'c': -c, 'c0': c0, 'A_ub': A_ub, 'b_ub': b_ub, 'A_eq': A_eq, 'b_eq': b_eq,
+                'bounds': list(zip(lb, [None if np.isinf(x) else x for x in ub]))}
+
+    def solve(self, model):
+        """Builds and solves the linear program for model.
+
+        :param model: A Pyomo ConcreteModel with its time series data and model parameters already assigned.
+        :return: A dictionary of NumPy ndarrays of the decision variable values, keyed by variable name, plus the objective value under 'objective'.
+        """
+        lp = self.build(model)
+
+        res = linprog(lp['c'], A_ub=lp['A_ub'], b_ub=lp['b_ub'], A_eq=lp['A_eq'], b_eq=lp['b_eq'],
+                      bounds=lp['bounds'], method='highs')
+
+        self._stats = {'variables': self.n_var,
+                       'constraints': lp['A_ub'].shape[0] + lp['A_eq'].shape[0],
+                       'nonzeros': lp['A_ub'].nnz + lp['A_eq'].nnz,
+                       'status': 'ok' if res.status == 0 else 'error',
+                       'termination_condition': res.message,
+                       'iterations': int(res.nit)}
+
+        if res.status != 0:
+            logging.error('MatrixFormulation: An optimal solution could not be obtained. ({0})'.format(res.message))
+            raise AssertionError(res.message)
+
+        T = self.n_time
+        x = res.x
+
+        solution = {var: np.zeros(T) for var in ('q_r', 'q_d', 'q_ru', 'q_rd', 'q_reg')}
+        solution['s'] = x[self._column('s', np.arange(T + 1))]
+
+        for var in self.MARKET_VARS[self.market_type]:
+            solution[var] = x[self._column(var, np.arange(T))]
+
+        solution['objective'] = -res.fun + lp['c0']
+
+        return solution
+
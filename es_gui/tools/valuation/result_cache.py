@@ -0,0 +1,148 @@
+from __future__ import print_function, absolute_import
+
+from collections import OrderedDict
+import hashlib
+import pickle
+import logging
+import os
+import shutil
+
+import numpy as np
+
+
+class ResultCache():
+    """
+    A disk-backed cache of solved ValuationOptimizer results. Each entry is stored in its own pickle file, named by a fingerprint of the model inputs: the market data arrays, the market type, the model parameters, and the solver. When the total size of the entries exceeds max_size, the least recently used entries are deleted until it no longer does.
+
+    :param cache_dir: The path to the directory to store cache entries in.
+    :param max_size: The maximum amount of disk space, in bytes, that the cache entries may collectively occupy.
+    :param enabled: False if the cache should be bypassed.
+    """
+    def __init__(self, cache_dir, max_size=100000000, enabled=True):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.enabled = enabled
+
+        # Sizes of entries on disk in order of least to most recently used; built lazily from the directory.
+        self._index = None
+
+    @staticmethod
+    def make_key(market_data, market_type, params, solver):
+        """Computes the fingerprint of the inputs of a ValuationOptimizer model.
+
+        :param market_data: A dictionary of ValuationOptimizer attribute names and their array-like values.
+        :param market_type: The name of the market formulation.
+        :param params: A dictionary of model parameters or None.
+        :param solver: The name of the solver.
+        :return: The hexadecimal digest of the inputs.
+        """
+        h = hashlib.sha256()
+
+        h.update(repr((market_type, solver, sorted((params or {}).items()))).encode('utf-8'))
+
+        for name in sorted(market_data):
+            h.update(name.encode('utf-8'))
+
+            value = market_data[name]
+
+            if value is None:
+                h.update(b'None')
+            else:
+                h.update(np.ascontiguousarray(value, dtype=np.float64).tobytes())
+
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + '.p')
+
+    def _load_index(self):
+        """Builds the index of cache entries from the cache directory, ordered by last access."""
+        self._index = OrderedDict()
+
+        try:
+            entries = [entry for entry in os.scandir(self.cache_dir) if entry.name.endswith('.p')]
+        except FileNotFoundError:
+            return
+
+        for entry in sorted(entries, key=lambda entry: entry.stat().st_mtime):
+            self._index[entry.name[:-2]] = entry.stat().st_size
+
+    @property
+    def index(self):
+        """The sizes of the cache entries keyed by fingerprint, in order of least to most recently used."""
+        if self._index is None:
+            self._load_index()
+
+        return self._index
+
+    @property
+    def size(self):
+        """The total size, in bytes, of the cache entries."""
+        return sum(self.index.values())
+
+    def get(self, key):
+        """Retrieves the results DataFrame and gross revenue stored under key, or None if there is no such entry."""
+        if not self.enabled or key not in self.index:
+            return None
+
+        try:
+            with open(self._path(key), 'rb') as pfile:
+                results, gross_revenue = pickle.load(pfile)
+        except (OSError, pickle.PickleError, EOFError):
+            logging.warning('ResultCache: Could not load entry {key}, discarding...'.format(key=key))
+            self._discard(key)
+
+            return None
+
+        # Mark as most recently used.
+        self.index.move_to_end(key)
+        os.utime(self._path(key))
+
+        logging.info('ResultCache: Entry located in cache, retrieving...')
+
+        return results, gross_revenue
+
+    def put(self, key, results, gross_revenue):
+        """Stores the results DataFrame and gross revenue under key and evicts least recently used entries as necessary."""
+        if not self.enabled:
+            return
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        # Write to a temporary file first so that an interrupted write cannot leave a corrupt entry.
+        tmp_path = self._path(key) + '.tmp'
+
+        with open(tmp_path, 'wb') as pfile:
+            pickle.dump((results, gross_revenue), pfile, protocol=3)
+
+        os.replace(tmp_path, self._path(key))
+
+        self.index[key] = os.path.getsize(self._path(key))
+        self.index.move_to_end(key)
+
+        self.manage_size()
+
+    def manage_size(self):
+        """Deletes least recently used entries until the cache size is at most max_size."""
+        size = self.size
+
+        while size > self.max_size and self.index:
+            key, entry_size = next(iter(self.index.items()))
+            self._discard(key)
+
+            size -= entry_size
+
+    def _discard(self, key):
+        self.index.pop(key, None)
+
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        """Deletes all cache entries."""
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        self._index = OrderedDict()
+
+        logging.info('ResultCache: Cleared all entries.')
@@ -5,9 +5,13 @@ import numpy as np
 import os
 import calendar
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
 from xlrd.biffh import XLRDError
 
+from es_gui.tools.node_registry import node_registry
+
 
 def read_ercot_da_spp(fname, month, settlement_point):
     """
@@ -101,6 +105,75 @@ def read_ercot_da_ccp(fname, month):
     return regdn, regup
 
 
+def convert_ercot_da_spp(fname):
+    """
+    Reads every month of the day-ahead market historical settlement point prices file at fname at once, so that the workbook only has to be parsed one time for all of the settlement points and months in it.
+
+    :param fname: string giving location of DAM SPPs file
+    :type fname: str
+    :return: SPPs keyed by month (int) [1, 12] and then by settlement point, as in read_ercot_da_spp(); the prices of each month form one settlement point x hour array
+    :rtype: dict of dicts of NumPy ndarrays
+    """
+    month_abbrs = list(calendar.month_abbr)
+
+    sheets = pd.read_excel(fname, sheet_name=None, usecols=['Settlement Point', 'Settlement Point Price'])
+
+    spp_table = {}
+
+    for sheet_name, df in sheets.items():
+        try:
+            month_ix = month_abbrs.index(sheet_name[:3])
+        except ValueError:
+            logging.warning('convert_ercot_da_spp: Skipping worksheet {sheet} that does not correspond to a month. (got {fname})'.format(sheet=sheet_name, fname=fname))
+            continue
+
+        # Group the prices by settlement point, keeping each settlement point's hours in order.
+        codes, settlement_points = pd.factorize(df['Settlement Point'])
+        spp = df['Settlement Point Price'].astype('float').values
+
+        # Rows without a settlement point are coded -1.
+        spp = spp[codes >= 0]
+        codes = codes[codes >= 0]
+
+        spp = spp[np.argsort(codes, kind='stable')]
+        spp_points = np.split(spp, np.cumsum(np.bincount(codes, minlength=len(settlement_points)))[:-1])
+
+        # remove NaN
+        spp_table[month_ix] = {settlement_point: spp_point[~np.isnan(spp_point)]
+                               for settlement_point, spp_point in zip(settlement_points, spp_points)}
+
+    return spp_table
+
+
+def convert_ercot_da_ccp(fname):
+    """
+    Reads every month of the day-ahead market historical capacity clearing prices file at fname at once, so that the file only has to be parsed one time for all of the months in it.
+
+    :param fname: string giving location of DAM CCPs file
+    :type fname: str
+    :return: regdn and regup CCPs, keyed by 'REGDN' and 'REGUP', keyed by month (int) [1, 12], as in read_ercot_da_ccp()
+    :rtype: dict of dicts of NumPy ndarrays
+    """
+    df = pd.read_csv(fname, low_memory=False)
+    series_month = pd.to_datetime(df['Delivery Date']).dt.month.values
+
+    regup_col = 'REGUP ' if 'REGUP ' in df.columns else 'REGUP'  # why is there an extra space in the key
+    regdn = df['REGDN'].astype('float').values
+    regup = df[regup_col].astype('float').values
+
+    ccp_table = {}
+
+    for month_ix in np.unique(series_month):
+        in_month = series_month == month_ix
+
+        regdn_month = regdn[in_month]
+        regup_month = regup[in_month]
+
+        ccp_table[int(month_ix)] = {'REGDN': regdn_month[~np.isnan(regdn_month)], 'REGUP': regup_month[~np.isnan(regup_month)]}
+
+    return ccp_table
+
+
 def read_nodeid(fname,iso):
     from xlrd import open_workbook
     wb = open_workbook(filename = fname)
@@ -114,7 +187,25 @@ def read_nodeid(fname,iso):
     return nodeid
 
 
-def read_pjm_data(fpath, year, month, nodeid):
+def read_daily_files(fnames, read, n_workers=None):
+    """
+    Reads each of the daily data files fnames with read, several at a time. Parsing CSV files mostly happens outside of the GIL, so the files are read in threads.
+    :param fnames: A list of paths of the data files.
+    :param read: A function of the path of a data file that returns its parsed contents, e.g., a DataFrame.
+    :param n_workers: The maximum number of files to read at a time; defaults to one per file, up to 8.
+    :return: A list of the results of read, in the order of fnames. Raises FileNotFoundError if any of the files is missing.
+    """
+    if not fnames:
+        return []
+
+    if n_workers is None:
+        n_workers = min(8, len(fnames))
+
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        return list(executor.map(read, fnames))
+
+
+def read_pjm_data(fpath, year, month, nodeid, typedat="both"):
     """"
     Reads the historical LMP, regulation capacity, and regulation service (mileage) prices for the year 'year',
     the month 'month' and for the node 'nodeid'. Returns NumPy ndarrays for those three prices.
@@ -125,6 +216,8 @@ def read_pjm_data(fpath, year, month, nodeid):
     :type year: int or str
     :param month: Month of data to read
     :type month: int or str
+    :param typedat: "lmp" to read only the node LMP, "reg" to read only the market-wide regulation prices and mileage, or "both"; the arrays not read are returned empty
+    :type typedat: str
     :return: daLMP, RegCCP, RegPCP: Hourly LMP and regulation capacity/performance clearing price values.
     :rtype: NumPy ndarrays
     """
@@ -152,12 +245,16 @@ def read_pjm_data(fpath, year, month, nodeid):
     fname_path_REG = os.path.join(fpath, 'REG', str(year), fnameREG)
     fname_path_MILEAGE = os.path.join(fpath, 'MILEAGE', str(year), fnameMILEAGE)
 
-    try:
-        dfLMP = pd.read_csv(fname_path_LMP,index_col=False)
-        daLMP = dfLMP['total_lmp_da'].values
-    except FileNotFoundError:
-        logging.warning('read_pjm_data: No LMP data matching input parameters found, returning empty array. (got {fname}, {year}, {month}, {nodeid})'.format(fname=fnameLMP, year=year, month=month, nodeid=nodeid))
-    
+    if typedat == "lmp" or typedat == "both":
+        try:
+            dfLMP = pd.read_csv(fname_path_LMP,index_col=False)
+            daLMP = dfLMP['total_lmp_da'].values
+        except FileNotFoundError:
+            logging.warning('read_pjm_data: No LMP data matching input parameters found, returning empty array. (got {fname}, {year}, {month}, {nodeid})'.format(fname=fnameLMP, year=year, month=month, nodeid=nodeid))
+
+    if typedat == "lmp":
+        return daLMP, mr, rega, regd, RegCCP, RegPCP
+
     try:
         dfREG = pd.read_csv(fname_path_REG,index_col=False)
         RegCCP = dfREG['rmccp'].values
@@ -210,24 +307,28 @@ def read_pjm_reg_signal(fname):
     :param fname: A string containing the path to the relevant regulation signal file.
     :return: RU, RD: NumPy ndarrays containing the hourly integrated regulation up/down signals.
     """
-    # read in the Excel file
-    df = pd.read_excel(fname, skip_footer=1)
+    # samples of the signal per hour and the duration of a sample in hours
+    n_samples = 1800
+    dt = 2.0/(60*60)
 
-    # create DateTime indexing to facilitate resampling
-    dt_ix = pd.date_range('2017-11-01', periods=30*60*24, freq='2S')
-    df.index = dt_ix
+    # read in the Excel file; each column holds the 2-second signal of a day
+    df = pd.read_excel(fname, skipfooter=1)
+    signal = df.astype('float').values
 
-    # define function for performing hourly integration
-    def _hourly_integration(array_like):
-        # ZOH integration
-        dt = 2.0/(60*60)
-        return np.sum(array_like)*dt
+    # missing samples count as zero, as they did when resampling with pandas
+    n_missing = np.count_nonzero(np.isnan(signal))
 
-    # use resample to apply hourly integration
-    df1 = df.resample(rule='H', closed='left').apply(_hourly_integration)
+    if n_missing:
+        logging.warning('read_pjm_reg_signal: {n} missing samples in {fname} counted as zero.'.format(n=n_missing, fname=fname))
+        signal = np.where(np.isnan(signal), 0.0, signal)
 
-    # convert DataFrame to NumPy ndarray and ravel
-    REG = np.ravel(df1.astype('float').values, 'F')
+    # pad each day to a whole number of hours, then order the samples in time: the number of days is taken from the data
+    n_pad = -len(signal) % n_samples
+    signal = np.pad(signal, ((0, n_pad), (0, 0)), mode='constant')
+    signal = np.ravel(signal, 'F')
+
+    # ZOH integration of every hour at once
+    REG = np.sum(signal.reshape(-1, n_samples), axis=1)*dt
 
     # assign reg up/down values appropriately based on sign of regulation signal
     RU = REG * (REG >= 0)
@@ -369,13 +470,14 @@ def read_miso_reg_price(fname):
 
 ##################################################################################################################
 #///////////////////////////////////////////////////////#
-def read_isone_data(fpath, year, month, nodeid):
+def read_isone_data(fpath, year, month, nodeid, typedat="both"):
     """"
     Reads the historical LMP, regulation capacity, and regulation service (mileage) prices for the year 'year',
     the month 'month' and for the node 'nodeid'. Returns NumPy ndarrays for those three prices.
     :param fpath: A string containing the path to the relevant historical ancillary services data file.
     :param year: An int corresponding to the year of interest
     :param month: An int corresponding to the month of interest (1: Jan., 2: Feb., etc.)
+    :param typedat: "lmp" to read only the node LMP, "rcp" to read only the market-wide regulation prices and mileage multiplier, or "both"; the arrays not read are returned empty
     :return: daLMP, RegCCP, RegPCP: NumPy ndarrays containing hourly LMP as well as regulation capacity/performance clearing price values.
     """
 
@@ -409,13 +511,17 @@ def read_isone_data(fpath, year, month, nodeid):
     miMULT = np.empty([0])
 
 
-    try:
-        dfLMP = pd.read_csv(fname_path_LMP, index_col=False)
-        daLMP = dfLMP['LmpTotal'].values
-    except FileNotFoundError:
-        logging.warning \
-            ('read_isone_data: No LMP data matching input parameters found, returning empty array. (got {fname}, {year}, {month}, {nodeid})'.format
-                (fname=fnameLMP, year=year, month=month, nodeid=nodeid))
+    if typedat == "lmp" or typedat == "both":
+        try:
+            dfLMP = pd.read_csv(fname_path_LMP, index_col=False)
+            daLMP = dfLMP['LmpTotal'].values
+        except FileNotFoundError:
+            logging.warning \
+                ('read_isone_data: No LMP data matching input parameters found, returning empty array. (got {fname}, {year}, {month}, {nodeid})'.format
+                    (fname=fnameLMP, year=year, month=month, nodeid=nodeid))
+
+    if typedat == "lmp":
+        return daLMP, RegCCP, RegPCP, miMULT
 
     try:
         if year > 2014:
@@ -427,41 +533,10 @@ def read_isone_data(fpath, year, month, nodeid):
                 dfRCP = pd.read_csv(fname_path_RCP, index_col=False)
                 RegCCP = dfRCP['RegCapacityClearingPrice'].values
                 RegPCP = dfRCP['RegServiceClearingPrice'].values
-                                   
-                dataF_mileage_file = pd.read_excel(fname_path_MILEAGE, sheet_name = 'Energy Neutral Trinary', usecols = ['Fleet ATRR dispatch [MW]'])
-                dataF_mileage_file = dataF_mileage_file.append(pd.DataFrame([-10]*15, columns = ['Fleet ATRR dispatch [MW]']), ignore_index = True) #   changes number of data points to 24 hours; doesn't change mileage
-                            
-                #   AGC setpoints given every 4 seconds, take the total mileage for each hour; total of one day of mileage
-                hours = [i for i in range(len(dataF_mileage_file.index)//900)]
-                
-                mileage_day = []
-                for hour in hours:
-                    dataF_mileage_hour = dataF_mileage_file[900*hour:900*(hour + 1)] #    every 900 values represents an hour (900*4 = 3600)
-                    mileage_hour = 0 
-                    for i in range(len(dataF_mileage_hour.index)):
-                        if i == len(dataF_mileage_hour.index) - 1:
-                            break
-                    
-                        if not dataF_mileage_hour.iloc[i, 0] == dataF_mileage_hour.iloc[i + 1, 0]:
-                            mileage_hour += abs(dataF_mileage_hour.iloc[i, 0] - dataF_mileage_hour.iloc[i + 1, 0])/10
-                            
-                    mileage_day.append(mileage_hour)
-            
-                dataF_mileage_day = pd.DataFrame(mileage_day, columns = ['Trinary Mileage'])
-                
-                #   have one days worth of data, need one months worth
-                days = len(daLMP)//24
-                mileage_mult = pd.DataFrame(columns = ['Trinary Mileage'])
-                for day in range(days):
-                    mileage_mult = mileage_mult.append(dataF_mileage_day, ignore_index = True)
-                #   if the len are offset, make them match
-                if not len(daLMP) == len(mileage_mult):
-                    diff = len(daLMP) - len(mileage_mult)
-                    
-                    for i in range(diff):
-                        mileage_mult = mileage_mult.append(dataF_mileage_day.iloc[i], ignore_index = True)
-                        
-                miMULT = mileage_mult['Trinary Mileage'].values
+
+                #   have one days worth of data, need one months worth; the clearing prices cover the same hours as the LMP
+                #   repeat the day, starting it over for any hours beyond the last whole day
+                miMULT = np.resize(read_isone_mileage(fname_path_MILEAGE), len(RegCCP))
         else:
             dfRCP = pd.read_csv(fname_path_RCP, index_col=False)
             RegCCP = dfRCP['RegClearingPrice'].values
@@ -474,10 +549,37 @@ def read_isone_data(fpath, year, month, nodeid):
     
 
     return daLMP, RegCCP, RegPCP, miMULT
+
+
+def read_isone_mileage(fname):
+    """
+    Reads the ISO-NE regulation mileage file at fname and returns the hourly trinary mileage of one day. The file is only read
+    once; the mileage is cached until the file is modified.
+    :param fname: A string containing the path to MileageFile.xlsx.
+    :return: mileage_day: A NumPy ndarray of 24 hourly mileage values.
+    """
+    return _read_isone_mileage(fname, os.path.getmtime(fname))
+
+
+@lru_cache(maxsize=4)
+def _read_isone_mileage(fname, mtime):
+    dispatch = pd.read_excel(fname, sheet_name='Energy Neutral Trinary', usecols=['Fleet ATRR dispatch [MW]'])['Fleet ATRR dispatch [MW]'].values
+
+    #   changes number of data points to 24 hours; doesn't change mileage
+    dispatch = np.concatenate([dispatch, np.full(15, -10.0)])
+
+    #   AGC setpoints given every 4 seconds, every 900 values represents an hour (900*4 = 3600); take the total mileage for each hour
+    hours = len(dispatch)//900
+    mileage_day = np.abs(np.diff(dispatch[:900*hours].reshape(hours, 900), axis=1)).sum(axis=1)/10
+
+    #   callers share the cached array
+    mileage_day.setflags(write=False)
+
+    return mileage_day
 #///////////////////////////////////////////////////////#
 
 
-def read_miso_data(fpath, year, month, nodeid):
+def read_miso_data(fpath, year, month, nodeid, typedat="both"):
     """Reads the daily MISO data files and returns the NumPy ndarrays for LMP and MCP.
 
     
@@ -489,6 +591,8 @@ def read_miso_data(fpath, year, month, nodeid):
     :type month: int or str
     :param nodeid: pricing node ID
     :type nodeid: str
+    :param typedat: "lmp" to read only the node LMP, "mcp" to read only the market-wide regulation MCP, or "both"; the array not read is returned empty
+    :type typedat: str
     :return: arrays of data specified
     :rtype: NumPy ndarrays
     """
@@ -508,58 +612,186 @@ def read_miso_data(fpath, year, month, nodeid):
             lmp_fname = os.path.join(fpath, 'LMP', str(year), str(month).zfill(2), '{prefix}_da_exante_lmp.csv'.format(prefix=date_str))
             mcp_fname = os.path.join(fpath, 'MCP', str(year), str(month).zfill(2), '{prefix}_asm_exante_damcp.csv'.format(prefix=date_str))
         
-        # LMP file.
-        try:
-            df = pd.read_csv(lmp_fname, skiprows=4, low_memory=False)
-        except FileNotFoundError:
-            logging.warning('read_miso_data: LMP file missing, returning empty array.')
-            break
+        if typedat == "lmp" or typedat == "both":
+            # LMP file.
+            try:
+                df = pd.read_csv(lmp_fname, skiprows=4, low_memory=False)
+            except FileNotFoundError:
+                logging.warning('read_miso_data: LMP file missing, returning empty array.')
+                break
 
-        # Filter rows by node_name.
-        col1 = df.axes[1][0]
-        col3 = df.axes[1][2]
-        pnode_ix1 = df.index[df[col1] == nodeid]
-        df1 = df.iloc[pnode_ix1, :]
+            # Filter rows by node_name.
+            col1 = df.axes[1][0]
+            col3 = df.axes[1][2]
+            pnode_ix1 = df.index[df[col1] == nodeid]
+            df1 = df.iloc[pnode_ix1, :]
         
-        # Find LMP values.
-        pnode_ix2 = df1.index[df1[col3] == "LMP"]
-        df2 = df.iloc[pnode_ix2, :]
+            # Find LMP values.
+            pnode_ix2 = df1.index[df1[col3] == "LMP"]
+            df2 = df.iloc[pnode_ix2, :]
         
-        # Filter Total LMP columns.
-        df3 = df2[df2.axes[1][3:27]]
+            # Filter Total LMP columns.
+            df3 = df2[df2.axes[1][3:27]]
 
-        if len(df3) == 0:
-            LMP = np.array([])
-            logging.warning('read_miso_data: A daily LMP file is missing required data, returning empty array.')
-            break
+            if len(df3) == 0:
+                LMP = np.array([])
+                logging.warning('read_miso_data: A daily LMP file is missing required data, returning empty array.')
+                break
 
-        # Convert to NumPy ndarray, ravel, and remove NaNs.
-        LMP_day = np.ravel(df3.astype('float').values)
-        LMP_day = LMP_day[~np.isnan(LMP_day)] 
-        LMP = np.append(LMP, LMP_day)
+            # Convert to NumPy ndarray, ravel, and remove NaNs.
+            LMP_day = np.ravel(df3.astype('float').values)
+            LMP_day = LMP_day[~np.isnan(LMP_day)] 
+            LMP = np.append(LMP, LMP_day)
 
-        # MCP file.
-        try:
-            df = pd.read_csv(mcp_fname, skiprows=4, nrows=7, low_memory=False)
-        except FileNotFoundError:
-            RegMCP = np.array([])
-            logging.warning('read_miso_data: MCP file missing, returning empty array.')
-            break
+        if typedat == "mcp" or typedat == "both":
+            # MCP file.
+            try:
+                df = pd.read_csv(mcp_fname, skiprows=4, nrows=7, low_memory=False)
+            except FileNotFoundError:
+                RegMCP = np.array([])
+                logging.warning('read_miso_data: MCP file missing, returning empty array.')
+                break
         
-        # Find SERREGMCP values.
-        col3 = df.axes[1][2]
-        pnode_ix1 = df.index[df[col3] == "SERREGMCP"]
-        df1 = df.iloc[pnode_ix1, :]
-        df2 = df1[df1.axes[1][3:27]]
+            # Find SERREGMCP values.
+            col3 = df.axes[1][2]
+            pnode_ix1 = df.index[df[col3] == "SERREGMCP"]
+            df1 = df.iloc[pnode_ix1, :]
+            df2 = df1[df1.axes[1][3:27]]
     
-        # convert to NumPy ndarray, ravel, and remove NaNs
-        RegMCP_day = np.ravel(df2.astype('float').values)
-        RegMCP_day = RegMCP_day[~np.isnan(RegMCP_day)] 
-        RegMCP = np.append(RegMCP, RegMCP_day)
+            # convert to NumPy ndarray, ravel, and remove NaNs
+            RegMCP_day = np.ravel(df2.astype('float').values)
+            RegMCP_day = RegMCP_day[~np.isnan(RegMCP_day)] 
+            RegMCP = np.append(RegMCP, RegMCP_day)
     
     return LMP, RegMCP
 
 
+def _miso_daily_fnames(fpath, year, month, series):
+    """Returns the paths of the daily MISO LMP ("LMP") or MCP ("MCP") files of a month."""
+    _, n_days_month = calendar.monthrange(int(year), int(month))
+
+    if (int(year) <= 2014) or (int(year) == 2015 and int(month) <= 2):
+        suffix = {'LMP': 'da_lmp', 'MCP': 'asm_damcp'}[series]
+    else:
+        suffix = {'LMP': 'da_exante_lmp', 'MCP': 'asm_exante_damcp'}[series]
+
+    return [os.path.join(fpath, series, str(year), str(month).zfill(2),
+                         '{year}{month}{day}_{suffix}.csv'.format(year=year, month=str(month).zfill(2), day=str(day).zfill(2), suffix=suffix))
+            for day in range(1, n_days_month+1)]
+
+
+def miso_month_complete(fpath, year, month, series):
+    """Returns True if every daily MISO LMP ("LMP") or MCP ("MCP") file of a month is available."""
+    return all(os.path.isfile(fname) for fname in _miso_daily_fnames(fpath, year, month, series))
+
+
+def _miso_available_fnames(fnames, series, caller):
+    """Returns the daily files of a month up to the first missing one, logging which file is missing, so that a partial month is read as read_miso_data() does."""
+    for day, fname in enumerate(fnames):
+        if not os.path.isfile(fname):
+            logging.warning('{caller}: {series} file missing ({fname}), returning the {n} day(s) before it.'.format(caller=caller, series=series, fname=fname, n=day))
+            return fnames[:day]
+
+    return fnames
+
+
+def read_miso_lmp_month(fpath, year, month, n_workers=None):
+    """Reads the day-ahead LMP of every MISO pricing node for a month. Each daily file is parsed once, for only the node, value type, and hourly columns, and several files are parsed at a time. The hourly LMP of each day is written into a preallocated array of the month, so that any number of nodes can be served without reading the files again.
+
+    :param fpath: root of the MISO data folder
+    :type fpath: str
+    :param year: year of data
+    :type year: int or str
+    :param month: month of data
+    :type month: int or str
+    :param n_workers: the maximum number of daily files to parse at a time; see read_daily_files()
+    :type n_workers: int
+    :return: hourly LMP keyed by pricing node ID; nodes missing from any daily file read are left out, and if a daily file is missing only the days before it are read
+    :rtype: dict of NumPy ndarrays
+    """
+    fnames = _miso_daily_fnames(fpath, year, month, 'LMP')
+
+    def _read_lmp(fname):
+        df = pd.read_csv(fname, skiprows=4, usecols=[0, 2] + list(range(3, 27)), low_memory=False)
+
+        # Index the LMP rows by node.
+        df = df.loc[df[df.columns[1]] == "LMP", :]
+        df = df.set_index(df.columns[0])
+        df = df.loc[~df.index.duplicated(), df.columns[1:]]
+
+        return df.astype('float')
+
+    fnames = _miso_available_fnames(fnames, 'LMP', 'read_miso_lmp_month')
+
+    if not fnames:
+        return {}
+
+    df_days = read_daily_files(fnames, _read_lmp, n_workers)
+
+    # Only the nodes in every daily file have a complete month of data.
+    nodes = df_days[0].index
+
+    for df_day in df_days[1:]:
+        nodes = nodes.intersection(df_day.index, sort=False)
+
+    LMP = np.empty((len(nodes), 24*len(df_days)))
+
+    for day, df_day in enumerate(df_days):
+        LMP[:, 24*day:24*(day + 1)] = df_day.reindex(nodes).values
+
+    lmp_table = {}
+
+    for node, LMP_node in zip(nodes, LMP):
+        # Remove NaNs.
+        if np.isnan(LMP_node).any():
+            LMP_node = LMP_node[~np.isnan(LMP_node)]
+
+        lmp_table[node] = LMP_node
+
+    return lmp_table
+
+
+def read_miso_mcp_month(fpath, year, month, n_workers=None):
+    """Reads the day-ahead regulation MCP of MISO for a month. The daily files are parsed several at a time and written into a preallocated array of the month.
+
+    :param fpath: root of the MISO data folder
+    :type fpath: str
+    :param year: year of data
+    :type year: int or str
+    :param month: month of data
+    :type month: int or str
+    :param n_workers: the maximum number of daily files to parse at a time; see read_daily_files()
+    :type n_workers: int
+    :return: hourly regulation MCP; if a daily file is missing only the days before it are read
+    :rtype: NumPy ndarray
+    """
+    fnames = _miso_daily_fnames(fpath, year, month, 'MCP')
+
+    def _read_mcp(fname):
+        df = pd.read_csv(fname, skiprows=4, nrows=7, low_memory=False)
+
+        # Find SERREGMCP values.
+        df = df.loc[df[df.columns[2]] == "SERREGMCP", df.columns[3:27]]
+
+        return np.ravel(df.astype('float').values)
+
+    fnames = _miso_available_fnames(fnames, 'MCP', 'read_miso_mcp_month')
+
+    if not fnames:
+        return np.array([])
+
+    RegMCP_days = read_daily_files(fnames, _read_mcp, n_workers)
+
+    RegMCP = np.empty(sum(len(RegMCP_day) for RegMCP_day in RegMCP_days))
+    day_ends = np.cumsum([len(RegMCP_day) for RegMCP_day in RegMCP_days])
+
+    for RegMCP_day, end in zip(RegMCP_days, day_ends):
+        RegMCP[end - len(RegMCP_day):end] = RegMCP_day
+
+    # Remove NaNs.
+    return RegMCP[~np.isnan(RegMCP)]
+
+
 
 
 #######################################################################################################################
@@ -600,29 +832,12 @@ def read_nyiso_data(fpath, year, month, nodeid, typedat="both", RT_DAM="both"):
         nodeid = int(nodeid)
 
     ############################################################################################
-    # folderfile = fpath
-    # # TODO: path_nodes_file is a folder to adjust when integrating it to QuESt
-    # path_nodes_file = 'C:/Users/fwilche/Documents/data_bank/NYISO/'
-    path_nodes_file = '../../es_gui/apps/data_manager/_static/'
-    pathf_nodeszones = os.path.join(fpath, path_nodes_file, 'nodes_nyiso.csv')
-    df_nodeszones = pd.read_csv(pathf_nodeszones, index_col=False)
-    df_nodeszones_x = df_nodeszones.loc[df_nodeszones['Node ID'] == nodeid, :]
+    node_zone = read_nyiso_node_zone(nodeid)
 
-    if df_nodeszones_x.empty:
-        print("The node does NOT exists in NYISO")
-        # raise ValueError('Not a valid bus number!!!')
+    if node_zone is None:
         return daLBMP, rtLBMP, daCAP, rtCAP, rtMOV
-    else:
-        if df_nodeszones_x.iloc[0,0] == df_nodeszones_x.iloc[0,2]:
-            print("It's a zone node")
-            zoneid = nodeid
-            zone_gen = "zone"
-        else:
-            print("It's a gen node")
-            zoneid = df_nodeszones_x.iloc[0,2]
-            zone_gen = "gen"
-    print("Identified zone:")
-    print(zoneid)
+
+    zoneid, zone_gen = node_zone
     ############################################################################################
 
     ndaysmonth = calendar.monthrange(year, month)
@@ -726,6 +941,75 @@ def read_nyiso_data(fpath, year, month, nodeid, typedat="both", RT_DAM="both"):
     return daLBMP, rtLBMP, daCAP, rtCAP, rtMOV
 
 
+def read_nyiso_node_zone(nodeid):
+    """
+    Looks up the zone of the NYISO node 'nodeid' in the NYISO node table.
+    :param nodeid: ID of the node
+    :return: zoneid, zone_gen: The PTID of the zone of the node and "zone" if the node is a zone or "gen" if it is a generator, or None if the node does not exist.
+    """
+    if isinstance(nodeid, str):
+        nodeid = int(nodeid)
+
+    zoneid = node_registry.zone('NYISO', nodeid)
+
+    if zoneid is None:
+        logging.warning('read_nyiso_node_zone: The node {0} does not exist in NYISO.'.format(nodeid))
+        return None
+
+    if zoneid == nodeid:
+        zone_gen = "zone"
+    else:
+        zone_gen = "gen"
+
+    logging.info('read_nyiso_node_zone: Identified zone {0} ({1} node).'.format(zoneid, zone_gen))
+
+    return zoneid, zone_gen
+
+
+def read_nyiso_lbmp_month(fpath, year, month, zone_gen, RT_DAM="DAM", n_workers=None):
+    """
+    Reads the historical LBMP of every NYISO node of the type 'zone_gen' for the year 'year' and the month 'month'. Each daily
+    file is parsed once, for only the PTID and LBMP columns, and several files are parsed at a time. Any number of nodes can
+    then be sliced from the result without reading the files again.
+    :param fpath: The path to the root of the NYISO data directory
+    :param year: Year of data to read
+    :param month: Month of data to read
+    :param zone_gen: "zone" or "gen" for zone or generator nodes
+    :param RT_DAM: "DAM" for day-ahead or "RT" for real-time LBMP
+    :param n_workers: The maximum number of daily files to parse at a time; see read_daily_files()
+    :return: lbmp: A dictionary of NumPy ndarrays of hourly LBMP keyed by PTID. Nodes missing from any daily file are left out; it is empty if a daily file is missing.
+    """
+    year = int(year)
+    month = int(month)
+
+    ndaysmonth = calendar.monthrange(year, month)[1]
+
+    if RT_DAM == "RT":
+        fnames = [os.path.join(fpath, 'LBMP', 'RT', zone_gen, str(year), str(month).zfill(2),
+                               "{0:d}{1:02d}{2:02d}realtime_{3}.csv".format(year, month, day, zone_gen)) for day in range(1, ndaysmonth+1)]
+    else:
+        fnames = [os.path.join(fpath, 'LBMP', 'DAM', zone_gen, str(year), str(month).zfill(2),
+                               "{0:d}{1:02d}{2:02d}damlbmp_{3}.csv".format(year, month, day, zone_gen)) for day in range(1, ndaysmonth+1)]
+
+    def _read_lbmp(fname):
+        return pd.read_csv(fname, index_col=False, usecols=['PTID', 'LBMP ($/MWHr)'],
+                           dtype={'PTID': np.int64, 'LBMP ($/MWHr)': np.float64})
+
+    try:
+        df_days = read_daily_files(fnames, _read_lbmp, n_workers)
+    except FileNotFoundError:
+        logging.warning('read_nyiso_lbmp_month: LMP file missing, returning empty table.')
+        return {}
+
+    # Only the nodes in every daily file have a complete month of data.
+    ptids = set.intersection(*(set(df_day['PTID'].values) for df_day in df_days))
+
+    df_month = pd.concat(df_days, ignore_index=True)
+    df_month = df_month.loc[df_month['PTID'].isin(ptids), :]
+
+    return {ptid: lbmp.values for ptid, lbmp in df_month.groupby('PTID', sort=False)['LBMP ($/MWHr)']}
+
+
 #TODO: delete function below:
 def read_nyiso_data_old(fpath, year, month, nodeid, typedat="both", RT_DAM="both"):
     """"
@@ -926,24 +1210,10 @@ def read_spp_data(fpath, year, month, node, typedat="both"):
         year = int(year)
 
     ############################################################################################
-    # TODO: path_nodes_file is a folder to adjust when integrating it to QuESt
-    path_nodes_file = '../../es_gui/apps/data_manager/_static/'
-    pathf_nodeszones = os.path.join(fpath, path_nodes_file, 'nodes_spp.csv')
-    df_nodes = pd.read_csv(pathf_nodeszones, index_col=False, encoding="cp1252")
-    df_nodes_x = df_nodes.loc[df_nodes['Node ID'] == node, :]
+    bus_loc = read_spp_node_type(node)
 
-    if df_nodes_x.empty:
-        print("The node does NOT exists in SPP")
-        # raise ValueError('Not a valid bus number!!!')
+    if bus_loc is None:
         return daLMP, daMCPRU, daMCPRD
-    else:
-        nodetype = df_nodes_x.iloc[0,2]
-        if nodetype == 'Location':
-            # print('It is a Location node')
-            bus_loc = ["location", "SL"]
-        elif nodetype == 'Bus':
-            # print('It is a Bus node')
-            bus_loc = ["bus", "B"]
 
     # TODO: figure out the reserve zone for each node, for SPP there are 5 reserve zones and there should be a correspondance with the nodes
     ResZone = 1
@@ -998,6 +1268,84 @@ def read_spp_data(fpath, year, month, node, typedat="both"):
     return daLMP, daMCPRU, daMCPRD
 
 
+def read_spp_node_type(node):
+    """
+    Looks up the type of the SPP node 'node' in the SPP node table.
+    :param node: A string with the name of the node in SPP
+    :return: bus_loc: ["location", "SL"] for a settlement location or ["bus", "B"] for a bus: the data directory and file name prefix of its LMP files, or None if the node does not exist.
+    """
+    nodetype = node_registry.node_type('SPP', node)
+
+    if nodetype is None:
+        logging.warning('read_spp_node_type: The node {0} does not exist in SPP.'.format(node))
+        return None
+
+    if nodetype == 'Location':
+        return ["location", "SL"]
+    elif nodetype == 'Bus':
+        return ["bus", "B"]
+
+    logging.warning('read_spp_node_type: The node {0} has an unknown type {1}.'.format(node, nodetype))
+    return None
+
+
+def read_spp_lmp_month(fpath, year, month, bus_loc, n_workers=None):
+    """
+    Reads the historical day-ahead LMP of every SPP node of the type 'bus_loc' for the year 'year' and the month 'month'. Each
+    daily file is parsed once, for only the Pnode and LMP columns, and several files are parsed at a time. The LMP of all nodes is
+    gathered into one preallocated array, which is split by node, so that any number of nodes can be served without reading the
+    files again.
+    :param fpath: The path to the root of the SPP data directory
+    :param year: An int corresponding to the year of interest
+    :param month: An int corresponding to the month of interest (1: Jan., 2: Feb., etc.)
+    :param bus_loc: The node type as returned by read_spp_node_type()
+    :param n_workers: The maximum number of daily files to parse at a time; see read_daily_files()
+    :return: lmp: A dictionary of NumPy ndarrays of hourly LMP keyed by Pnode. Nodes missing from any daily file are left out; it is empty if a daily file is missing.
+    """
+    year = int(year)
+    month = int(month)
+
+    ndaysmonth = calendar.monthrange(year, month)[1]
+
+    fnames = [os.path.join(fpath, 'LMP', 'DAM', bus_loc[0], str(year), str(month).zfill(2),
+                           "DA-LMP-{0:s}-{1:d}{2:02d}{3:02d}0100.csv".format(bus_loc[1], year, month, day)) for day in range(1, ndaysmonth+1)]
+
+    def _read_lmp(fname):
+        return pd.read_csv(fname, index_col=False, usecols=['Pnode', 'LMP'], dtype={'Pnode': str, 'LMP': np.float64})
+
+    try:
+        df_days = read_daily_files(fnames, _read_lmp, n_workers)
+    except FileNotFoundError:
+        logging.warning('read_spp_lmp_month: LMP file missing, returning empty table.')
+        return {}
+
+    # Concatenate the daily files into preallocated arrays.
+    n_rows = sum(len(df_day) for df_day in df_days)
+    pnodes = np.empty(n_rows, dtype=object)
+    lmp = np.empty(n_rows)
+    day_ends = np.cumsum([len(df_day) for df_day in df_days])
+
+    for df_day, end in zip(df_days, day_ends):
+        pnodes[end - len(df_day):end] = df_day['Pnode'].values
+        lmp[end - len(df_day):end] = df_day['LMP'].values
+
+    codes, names = pd.factorize(pnodes)
+
+    # Only the nodes in every daily file have a complete month of data.
+    complete = np.ones(len(names), dtype=bool)
+
+    for start, end in zip(np.concatenate([[0], day_ends[:-1]]), day_ends):
+        in_day = np.zeros(len(names), dtype=bool)
+        in_day[codes[start:end]] = True
+        complete &= in_day
+
+    # Group the LMP by node, keeping each node's hours in order, and split it into views of each node.
+    lmp = lmp[np.argsort(codes, kind='stable')]
+    lmp_nodes = np.split(lmp, np.cumsum(np.bincount(codes, minlength=len(names)))[:-1])
+
+    return {name: lmp_node for name, lmp_node, is_complete in zip(names, lmp_nodes, complete) if is_complete}
+
+
 def read_spp_data_old(fpath, year, month, node, typedat="both"):
     """"
     Reads the historical LMP, regulation capacity, and regulation service (mileage) prices for the year 'year',
@@ -1099,7 +1447,7 @@ def read_spp_data_old(fpath, year, month, node, typedat="both"):
 # CAISO
 #######################################################################################################################
 
-def read_caiso_data(fpath, year, month, nodeid):
+def read_caiso_data(fpath, year, month, nodeid, typedat="both"):
     """"
     Reads the historical LMP, regulation up/down and regulation mileage up/down for the year 'year',
     the month 'month' and for the node 'nodeid'. Returns NumPy ndarrays for those three prices.
@@ -1112,6 +1460,8 @@ def read_caiso_data(fpath, year, month, nodeid):
     :type month: int or str
     :param nodeid: ID of the node to read
     :type nodeid: str
+    :param typedat: "lmp" to read only the node LMP, "asp" to read only the market-wide regulation prices, mileage multipliers, and performance accuracies, or "both"; the arrays not read are returned empty
+    :type typedat: str
     :return: daLMP, RegCCP, RegPCP: Hourly LMP and regulation capacity/performance clearing price values.
     :rtype: NumPy ndarrays
     """
@@ -1162,14 +1512,18 @@ def read_caiso_data(fpath, year, month, nodeid):
     fname_path_ASP = os.path.join(fpath, 'ASP', str(year), fnameASP)
     fname_path_MILEAGE = os.path.join(fpath, 'MILEAGE', str(year), fnameMILEAGE)
 
-    try:
-        dfLMP = pd.read_csv(fname_path_LMP, index_col=False)
-        daLMP = dfLMP['LMP'].values
-    except FileNotFoundError:
-        logging.warning \
-            (
-                'read_caiso_data: No LMP data matching input parameters found, returning empty array. (got {fname}, {year}, {month}, {nodeid})'.format
-                (fname=fnameLMP, year=year, month=month, nodeid=nodeid))
+    if typedat == "lmp" or typedat == "both":
+        try:
+            dfLMP = pd.read_csv(fname_path_LMP, index_col=False)
+            daLMP = dfLMP['LMP'].values
+        except FileNotFoundError:
+            logging.warning \
+                (
+                    'read_caiso_data: No LMP data matching input parameters found, returning empty array. (got {fname}, {year}, {month}, {nodeid})'.format
+                    (fname=fnameLMP, year=year, month=month, nodeid=nodeid))
+
+    if typedat == "lmp":
+        return daLMP, daREGU, daREGD, daRMU, daRMD, RMU_MM, RMD_MM, RMU_PACC, RMD_PACC
 
     try:
         dfASP = pd.read_csv(fname_path_ASP, index_col=False)
@@ -3,9 +3,11 @@ import logging
 import os
 import json
 
+import numpy as np
 import pandas as pd
 
 from es_gui.tools.dms import DataManagementSystem
+from es_gui.tools.valuation.market_store import MarketStore
 from es_gui.tools.valuation.utilities import *
 
 
@@ -13,13 +15,21 @@ class ValuationDMS(DataManagementSystem):
     """
     A class for managing data for the energy storage valuation optimization functions. Class methods for each type of file to be loaded are included, extending from the get_data() method of the superclass. Each of these methods uses get_data() to retrieve the relevant data and loads the file and adds it to the DMS if the data is not loaded. An optional class method for calling each of the individual data methods can be included to, e.g., form the necessary arguments and return the desired variables.
 
+    Market data is read from the columnar market data store when it has been ingested there and from the raw data files otherwise; see MarketStore. The store is not checked against the raw data files, so market data is only ingested on request, e.g., by the ingest command of the CLI: if ingest is True, market data read from the raw data files is ingested into the store so that later runs do not have to parse the raw files again. If refresh is also True, the raw data files are read and ingested again even if they have been ingested already.
+
     :param home_path: A string indicating the relative path to where data is saved.
+    :param ingest: True if market data read from the raw data files should be ingested into the market data store.
+    :param refresh: True if market data should be read from the raw data files even if it has been ingested.
     """
-    def __init__(self, home_path, **kwargs):
+    def __init__(self, home_path, ingest=False, refresh=False, **kwargs):
         DataManagementSystem.__init__(self, **kwargs)
 
         self.home_path = home_path
 
+        self.market_store = MarketStore(root=home_path)
+        self.ingest = ingest
+        self.refresh = refresh
+
         # with open(os.path.abspath(os.path.join(self.home_path, '..', 'es_gui', 'apps', 'valuation', 'definitions', 'nodes.json')), 'r') as fp:
         #     self.NODES = json.load(fp)
 
@@ -43,38 +53,98 @@ class ValuationDMS(DataManagementSystem):
         # else:
         #     return node_name
 
-    def get_ercot_spp_data(self, id_key):
-        """Retrieves DAM-SPP data for ERCOT."""
+    def _read_market_data(self, iso, year, month, node, series, reader, persist=True):
+        """Reads market series from the market data store if they have been ingested; otherwise, reads them with reader and ingests them.
+
+        :param iso: The market area.
+        :param node: The pricing node of the series or None for market-wide series.
+        :param series: A list of series names.
+        :param reader: A function with no arguments that returns a sequence of the values of series read from the raw data files.
+        :param persist: False if the series are incomplete, e.g., because raw data files are missing, and should not be ingested.
+        :return: A list of the values of series.
+        """
+        if not self.refresh:
+            try:
+                return self.market_store.load_group(iso, series, year, month, node)
+            except KeyError:
+                pass
+
+        values = list(reader())
+
+        # Missing raw data files are read as empty arrays; leave them out of the store so that they are looked for again.
+        if self.ingest and persist and any(len(value) for value in values):
+            try:
+                self.market_store.save_group(iso, series, year, month, values, node)
+            except OSError as e:
+                logging.warning('DMS: Could not ingest {iso} {series} data. ({e})'.format(iso=iso, series=', '.join(series), e=e))
+
+        return values
+
+    def get_ercot_spp_table(self, fname):
+        """Retrieves every month and settlement point of the ERCOT DAM SPPs file fname, converting the workbook on first access; see convert_ercot_da_spp()."""
+        spp_table, = self.get_or_load([self.delimiter.join([fname, 'SPP table'])], lambda: [convert_ercot_da_spp(fname)],
+                                      name='convert_ercot_da_spp')
+
+        return spp_table
+
+    def get_ercot_ccp_table(self, fname):
+        """Retrieves every month of the ERCOT DAM CCPs file fname, converting the file on first access; see convert_ercot_da_ccp()."""
+        ccp_table, = self.get_or_load([self.delimiter.join([fname, 'CCP table'])], lambda: [convert_ercot_da_ccp(fname)],
+                                      name='convert_ercot_da_ccp')
+
+        return ccp_table
+
+    def get_ercot_spp_data(self, id_key, year=None):
+        """Retrieves DAM-SPP data for ERCOT. If year is given, the data is read from the market data store if it has been ingested there."""
         logging.info('DMS: Loading ERCOT DA-SPP')
-        try:
-            # attempt to access data if it is already loaded
-            spp_da = self.get_data(id_key)
-        except KeyError:
-            # load the data and add it to the DMS
 
-            # deconstruct id_key to obtain args for read function
-            spp_da = read_ercot_da_spp(*id_key.split(self.delimiter))
-            self.add_data(spp_da, id_key)
-        finally:
-            return spp_da
+        # deconstruct id_key to obtain args for read function
+        fname, month, settlement_point = id_key.split(self.delimiter)
+
+        def _read_ercot_da_spp():
+            # every month and settlement point of the file is converted at once and kept for the others
+            spp_da = self.get_ercot_spp_table(fname).get(int(month), {}).get(settlement_point, np.array([]))
+
+            if not len(spp_da):
+                logging.warning('DMS: No ERCOT DA-SPP data found, returning empty array. (got {fname}, {month}, {settlement_point})'.format(fname=fname, month=month, settlement_point=settlement_point))
+
+            return [spp_da]
+
+        if year is None:
+            loader = _read_ercot_da_spp
+        else:
+            loader = lambda: self._read_market_data('ERCOT', year, month, settlement_point, ['SPP'], _read_ercot_da_spp)
 
-    def get_ercot_ccp_data(self, id_key):
-        """Retrieves DAM-CCP data for ERCOT."""
+        spp_da, = self.get_or_load([id_key], loader, name='read_ercot_da_spp')
+
+        return spp_da
+
+    def get_ercot_ccp_data(self, id_key, year=None):
+        """Retrieves DAM-CCP data for ERCOT. If year is given, the data is read from the market data store if it has been ingested there."""
         logging.info('DMS: Loading ERCOT DA-CCP')
-        try:
-            # attempt to access data if it is already loaded
-            REGUP = self.get_data(id_key + self.delimiter + 'REGUP')
-            REGDN = self.get_data(id_key + self.delimiter + 'REGDN')
-        except KeyError:
-            # load the data and add it to the DMS
 
-            # deconstruct id_key to obtain args for read function
-            REGDN, REGUP = read_ercot_da_ccp(*id_key.split(self.delimiter)[:2])
+        # deconstruct id_key to obtain args for read function
+        fname, month = id_key.split(self.delimiter)[:2]
 
-            self.add_data(REGUP, id_key + self.delimiter + 'REGUP')
-            self.add_data(REGDN, id_key + self.delimiter + 'REGDN')
-        finally:
-            return REGDN, REGUP
+        def _read_ercot_da_ccp():
+            # every month of the file is converted at once and kept for the others
+            ccp = self.get_ercot_ccp_table(fname).get(int(month), None)
+
+            if ccp is None:
+                logging.warning('DMS: No ERCOT DA-CCP data found, returning empty arrays. (got {fname}, {month})'.format(fname=fname, month=month))
+                return np.array([]), np.array([])
+
+            return ccp['REGDN'], ccp['REGUP']
+
+        if year is None:
+            loader = _read_ercot_da_ccp
+        else:
+            loader = lambda: self._read_market_data('ERCOT', year, month, None, ['REGDN', 'REGUP'], _read_ercot_da_ccp)
+
+        REGDN, REGUP = self.get_or_load([id_key + self.delimiter + 'REGDN', id_key + self.delimiter + 'REGUP'],
+                                        loader, name='read_ercot_da_ccp')
+
+        return REGDN, REGUP
 
     def get_ercot_data(self, year, month, settlement_point):
         # construct file name paths
@@ -110,8 +180,8 @@ class ValuationDMS(DataManagementSystem):
         ccp_id = self.delimiter.join([ccp_fname, month])
 
         # retrieve data
-        spp_da = self.get_ercot_spp_data(spp_id)
-        rd, ru = self.get_ercot_ccp_data(ccp_id)
+        spp_da = self.get_ercot_spp_data(spp_id, year=year)
+        rd, ru = self.get_ercot_ccp_data(ccp_id, year=year)
 
         return spp_da, rd, ru
 
@@ -185,24 +255,16 @@ class ValuationDMS(DataManagementSystem):
         rccp_key = self.delimiter.join([path, year, month, 'RegCCP'])
         rpcp_key = self.delimiter.join([path, year, month, 'RegPCP'])
 
-        try:
-            # attempt to access data if it is already loaded
-            lmp_da = self.get_data(lmp_key)
-            MR = self.get_data(mr_key)
-            RA = self.get_data(ra_key)
-            RD = self.get_data(rd_key)
-            RegCCP = self.get_data(rccp_key)
-            RegPCP = self.get_data(rpcp_key)
-        except KeyError:
-            # load the data and add it to the DMS
-            lmp_da, MR, RA, RD, RegCCP, RegPCP = read_pjm_data(path, year, month, nodeid)
-
-            self.add_data(lmp_da, lmp_key)
-            self.add_data(MR, mr_key)
-            self.add_data(RA, ra_key)
-            self.add_data(RD, rd_key)
-            self.add_data(RegCCP, rccp_key)
-            self.add_data(RegPCP, rpcp_key)
+        # retrieve the data if it is already loaded, otherwise load it and add it to the DMS
+        # the node LMP and the market-wide series are loaded separately so that only the missing ones are read
+        lmp_da, = self.get_or_load([lmp_key],
+                                   lambda: self._read_market_data('PJM', year, month, nodeid, ['LMP'],
+                                                                  lambda: read_pjm_data(path, year, month, nodeid, typedat='lmp')[:1]),
+                                   name='read_pjm_data')
+        MR, RA, RD, RegCCP, RegPCP = self.get_or_load([mr_key, ra_key, rd_key, rccp_key, rpcp_key],
+                                                      lambda: self._read_market_data('PJM', year, month, None, ['MR', 'RA', 'RD', 'RegCCP', 'RegPCP'],
+                                                                                     lambda: read_pjm_data(path, year, month, nodeid, typedat='reg')[1:]),
+                                                      name='read_pjm_data')
 
         return lmp_da, MR, RA, RD, RegCCP, RegPCP
     
@@ -232,6 +294,17 @@ class ValuationDMS(DataManagementSystem):
         finally:
             return RegMCP
 
+    def get_miso_lmp_table(self, year, month):
+        """Retrieves the day-ahead LMP of every MISO pricing node for a month as a dictionary keyed by node ID; see read_miso_lmp_month(). The month is read once, even by concurrent callers, and kept as a single entry unless it exceeds max_memory; see get_or_load()."""
+        path = os.path.join(self.home_path, 'MISO')
+
+        table_key = self.delimiter.join([path, str(year), str(month), 'LMP table'])
+
+        table, = self.get_or_load([table_key], lambda: [read_miso_lmp_month(path, year, month)], name='read_miso_lmp_month',
+                                  persist=miso_month_complete(path, year, month, 'LMP'))
+
+        return table
+
     def get_miso_data(self, year, month, nodeid):
         path = os.path.join(self.home_path, 'MISO')
 
@@ -241,16 +314,23 @@ class ValuationDMS(DataManagementSystem):
         lmp_key = self.delimiter.join([path, year, month, nodeid, 'LMP'])
         regmcp_key = self.delimiter.join([path, year, month, 'MCP'])
 
-        try:
-            # attempt to access data if it is already loaded
-            lmp_da = self.get_data(lmp_key)
-            RegMCP = self.get_data(regmcp_key)
-        except KeyError:
-            # load the data and add it to the DMS
-            lmp_da, RegMCP = read_miso_data(path, year, month, nodeid)
-
-            self.add_data(lmp_da, lmp_key)
-            self.add_data(RegMCP, regmcp_key)
+        # a month with daily files missing is read up to the first missing file and only kept in memory, so that it is read again once the files arrive
+        lmp_complete = miso_month_complete(path, year, month, 'LMP')
+        mcp_complete = miso_month_complete(path, year, month, 'MCP')
+
+        # retrieve the data if it is already loaded, otherwise load it and add it to the DMS
+        # the node LMP and the market-wide series are loaded separately so that only the missing ones are read
+        # the LMP of every node is read at once and kept for the other nodes
+        lmp_da, = self.get_or_load([lmp_key],
+                                   lambda: self._read_market_data('MISO', year, month, nodeid, ['LMP'],
+                                                                  lambda: [self.get_miso_lmp_table(year, month).get(nodeid, np.array([]))],
+                                                                  persist=lmp_complete),
+                                   name='read_miso_data', persist=lmp_complete)
+        RegMCP, = self.get_or_load([regmcp_key],
+                                   lambda: self._read_market_data('MISO', year, month, None, ['MCP'],
+                                                                  lambda: [read_miso_mcp_month(path, year, month)],
+                                                                  persist=mcp_complete),
+                                   name='read_miso_mcp_month', persist=mcp_complete)
 
         return lmp_da, RegMCP
 
@@ -267,25 +347,32 @@ class ValuationDMS(DataManagementSystem):
         rpcp_key = self.delimiter.join([path, year, month, 'RegPCP'])
         mimult_key = self.delimiter.join([path, year, month, 'MiMult'])
 
-        try:
-            # attempt to access data if it is already loaded
-            lmp_da = self.get_data(lmp_key)
-            rccp = self.get_data(rccp_key)
-            rpcp = self.get_data(rpcp_key)
-            mi_mult = self.get_data(mimult_key)
-        except KeyError:
-            # load the data and add it to the DMS
-            lmp_da, rccp, rpcp, mi_mult = read_isone_data(path, year, month, nodeid)
-
-            self.add_data(lmp_da, lmp_key)
-            self.add_data(rccp, rccp_key)
-            self.add_data(rpcp, rpcp_key)
-            self.add_data(mi_mult, mimult_key)
+        # retrieve the data if it is already loaded, otherwise load it and add it to the DMS
+        # the node LMP and the market-wide series are loaded separately so that only the missing ones are read
+        lmp_da, = self.get_or_load([lmp_key],
+                                   lambda: self._read_market_data('ISONE', year, month, nodeid, ['LMP'],
+                                                                  lambda: read_isone_data(path, year, month, nodeid, typedat='lmp')[:1]),
+                                   name='read_isone_data')
+        rccp, rpcp, mi_mult = self.get_or_load([rccp_key, rpcp_key, mimult_key],
+                                               lambda: self._read_market_data('ISONE', year, month, None, ['RegCCP', 'RegPCP', 'MiMult'],
+                                                                              lambda: read_isone_data(path, year, month, nodeid, typedat='rcp')[1:]),
+                                               name='read_isone_data')
 
         return lmp_da, rccp, rpcp, mi_mult
 
     ####################################################################################################################
 
+    def get_nyiso_lbmp_table(self, year, month, zone_gen):
+        """Retrieves the day-ahead LBMP of every NYISO zone or generator node for a month as a dictionary keyed by PTID; see read_nyiso_lbmp_month(). The month is read once, even by concurrent callers, and kept as a single entry unless it exceeds max_memory; see get_or_load()."""
+        path = os.path.join(self.home_path, 'NYISO')
+
+        table_key = self.delimiter.join([path, str(year), str(month), zone_gen, 'LBMP table'])
+
+        table, = self.get_or_load([table_key], lambda: [read_nyiso_lbmp_month(path, year, month, zone_gen, RT_DAM="DAM")],
+                                  name='read_nyiso_lbmp_month')
+
+        return table
+
     def get_nyiso_data(self, year, month, nodeid):
         path = os.path.join(self.home_path, 'NYISO')
 
@@ -296,20 +383,46 @@ class ValuationDMS(DataManagementSystem):
         lbmp_key = self.delimiter.join([path, year, month, nodeid, 'LBMP'])
         rcap_key = self.delimiter.join([path, year, month, 'RegCAP'])
 
-        try:
-            # attempt to access data if it is already loaded
-            lbmp_da = self.get_data(lbmp_key)
-            rcap_da = self.get_data(rcap_key)
-        except KeyError:
-            # load the data and add it to the DMS
-            lbmp_da, lbmp_rt, rcap_da, rcap_rt, rmov_da = read_nyiso_data(path, year, month, nodeid, typedat="both", RT_DAM="DAM")
+        def _read_nyiso_lbmp():
+            # the LBMP of every node of the same type is read at once and kept for the other nodes
+            node_zone = read_nyiso_node_zone(nodeid)
+
+            if node_zone is None:
+                return np.empty([0]),
 
-            self.add_data(lbmp_da, lbmp_key)
-            self.add_data(rcap_da, rcap_key)
+            zoneid, zone_gen = node_zone
+            lbmp_table = self.get_nyiso_lbmp_table(year, month, zone_gen)
+
+            return lbmp_table.get(int(nodeid), np.empty([0])),
+
+        def _read_nyiso_asp():
+            lbmp_da, lbmp_rt, rcap_da, rcap_rt, rmov_da = read_nyiso_data(path, year, month, nodeid, typedat="asp", RT_DAM="DAM")
+
+            return rcap_da,
+
+        # retrieve the data if it is already loaded, otherwise load it and add it to the DMS
+        # the node LBMP and the market-wide series are loaded separately so that only the missing ones are read
+        lbmp_da, = self.get_or_load([lbmp_key],
+                                    lambda: self._read_market_data('NYISO', year, month, nodeid, ['LBMP'], _read_nyiso_lbmp),
+                                    name='read_nyiso_data')
+        rcap_da, = self.get_or_load([rcap_key],
+                                    lambda: self._read_market_data('NYISO', year, month, None, ['RegCAP'], _read_nyiso_asp),
+                                    name='read_nyiso_data')
 
         return lbmp_da, rcap_da
 
 
+    def get_spp_lmp_table(self, year, month, bus_loc):
+        """Retrieves the day-ahead LMP of every SPP node of a type for a month as a dictionary keyed by Pnode; see read_spp_lmp_month(). The month is read once, even by concurrent callers, and kept as a single entry unless it exceeds max_memory; see get_or_load()."""
+        path = os.path.join(self.home_path, 'SPP')
+
+        table_key = self.delimiter.join([path, str(year), str(month), bus_loc[0], 'LMP table'])
+
+        table, = self.get_or_load([table_key], lambda: [read_spp_lmp_month(path, year, month, bus_loc)],
+                                  name='read_spp_lmp_month')
+
+        return table
+
     def get_spp_data(self, year, month, nodeid):
         path = os.path.join(self.home_path, 'SPP')
 
@@ -320,19 +433,26 @@ class ValuationDMS(DataManagementSystem):
         mcpru_key = self.delimiter.join([path, year, month, 'MCPRU'])
         mcprd_key = self.delimiter.join([path, year, month, 'MCPRD'])
 
-        try:
-            # attempt to access data if it is already loaded
-            lmp_da = self.get_data(lmp_key)
-            mcpru_da = self.get_data(mcpru_key)
-            mcprd_da = self.get_data(mcprd_key)
-        except KeyError:
-            # load the data and add it to the DMS
-            # lmp_da, MR, RA, RD, RegCCP, RegPCP = read_pjm_data(path, year, month, nodeid)
-            lmp_da, mcpru_da, mcprd_da = read_spp_data(path, year, month, nodeid, typedat="both")
+        def _read_spp_lmp():
+            # the LMP of every node of the same type is read at once and kept for the other nodes
+            bus_loc = read_spp_node_type(nodeid)
+
+            if bus_loc is None:
+                return np.empty([0]),
+
+            lmp_table = self.get_spp_lmp_table(year, month, bus_loc)
 
-            self.add_data(lmp_da, lmp_key)
-            self.add_data(mcpru_da, mcpru_key)
-            self.add_data(mcprd_da, mcprd_key)
+            return lmp_table.get(nodeid, np.empty([0])),
+
+        # retrieve the data if it is already loaded, otherwise load it and add it to the DMS
+        # the node LMP and the market-wide series are loaded separately so that only the missing ones are read
+        lmp_da, = self.get_or_load([lmp_key],
+                                   lambda: self._read_market_data('SPP', year, month, nodeid, ['LMP'], _read_spp_lmp),
+                                   name='read_spp_data')
+        mcpru_da, mcprd_da = self.get_or_load([mcpru_key, mcprd_key],
+                                              lambda: self._read_market_data('SPP', year, month, None, ['MCPRU', 'MCPRD'],
+                                                                             lambda: read_spp_data(path, year, month, nodeid, typedat="mcp")[1:]),
+                                              name='read_spp_data')
 
         return lmp_da, mcpru_da, mcprd_da
 
@@ -353,31 +473,18 @@ class ValuationDMS(DataManagementSystem):
         rmu_pacc_key = self.delimiter.join([path, year, month, 'RMU_PACC'])
         rmd_pacc_key = self.delimiter.join([path, year, month, 'RMD_PACC'])
 
-        try:
-            # attempt to access data if it is already loaded
-            lmp_da = self.get_data(lmp_key)
-            aspru_da = self.get_data(aspru_key)
-            asprd_da = self.get_data(asprd_key)
-            asprmu_da = self.get_data(asprmu_key)
-            asprmd_da = self.get_data(asprmd_key)
-            rmu_mm = self.get_data(rmu_mm_key)
-            rmd_mm = self.get_data(rmd_mm_key)
-            rmu_pacc = self.get_data(rmu_pacc_key)
-            rmd_pacc = self.get_data(rmd_pacc_key)
-        except KeyError:
-            # load the data and add it to the DMS
-            # lmp_da, MR, RA, RD, RegCCP, RegPCP = read_pjm_data(path, year, month, nodeid)
-            lmp_da, aspru_da, asprd_da, asprmu_da, asprmd_da, rmu_mm, rmd_mm, rmu_pacc, rmd_pacc = read_caiso_data(path, year, month, nodeid)
-
-            self.add_data(lmp_da, lmp_key)
-            self.add_data(aspru_da, aspru_key)
-            self.add_data(asprd_da, asprd_key)
-            self.add_data(asprmu_da, asprmu_key)
-            self.add_data(asprmd_da, asprmd_key)
-            self.add_data(rmu_mm, rmu_mm_key)
-            self.add_data(rmd_mm, rmd_mm_key)
-            self.add_data(rmu_pacc, rmu_pacc_key)
-            self.add_data(rmd_pacc, rmd_pacc_key)
+        # retrieve the data if it is already loaded, otherwise load it and add it to the DMS
+        # the node LMP and the market-wide series are loaded separately so that only the missing ones are read
+        lmp_da, = self.get_or_load([lmp_key],
+                                   lambda: self._read_market_data('CAISO', year, month, nodeid, ['LMP'],
+                                                                  lambda: read_caiso_data(path, year, month, nodeid, typedat='lmp')[:1]),
+                                   name='read_caiso_data')
+        aspru_da, asprd_da, asprmu_da, asprmd_da, rmu_mm, rmd_mm, rmu_pacc, rmd_pacc = self.get_or_load(
+            [aspru_key, asprd_key, asprmu_key, asprmd_key, rmu_mm_key, rmd_mm_key, rmu_pacc_key, rmd_pacc_key],
+            lambda: self._read_market_data('CAISO', year, month, None,
+                                           ['ASPRU', 'ASPRD', 'ASPRMU', 'ASPRMD', 'RMU_MM', 'RMD_MM', 'RMU_PACC', 'RMD_PACC'],
+                                           lambda: read_caiso_data(path, year, month, nodeid, typedat='asp')[1:]),
+            name='read_caiso_data')
 
         return lmp_da, aspru_da, asprd_da, asprmu_da, asprmd_da, rmu_mm, rmd_mm, rmu_pacc, rmd_pacc
 
@@ -9,11 +9,20 @@ import numpy as np
 
 from es_gui.tools import optimizer
 from es_gui.tools.valuation.constraints import ExpressionsBlock
+from es_gui.tools.valuation.matrix import MatrixFormulation
 
 
 class ValuationOptimizer(optimizer.Optimizer):
     """A framework wrapper class for creating Pyomo ConcreteModels for energy storage valuation."""
 
+    # Model params that can be updated in-place between solves when mutable_params is set.
+    MUTABLE_PARAMS = ('Power_rating', 'Energy_capacity', 'Self_discharge_efficiency', 'Round_trip_efficiency',
+                      'State_of_charge_min', 'State_of_charge_max', 'State_of_charge_init')
+
+    # Model params interpreted as percentages when greater than 1.0.
+    FRACTION_PARAMS = ('Self_discharge_efficiency', 'Round_trip_efficiency',
+                       'State_of_charge_min', 'State_of_charge_max', 'State_of_charge_init')
+
     def __init__(self, price_electricity=None,
                  price_reg_up=None, price_reg_down=None,
                  price_reg_serv_up=None, price_reg_serv_down=None,
@@ -23,13 +32,14 @@ class ValuationOptimizer(optimizer.Optimizer):
                  perf_score=None, perf_score_ru=None, perf_score_rd=None,
                  fraction_reg_up=None, fraction_reg_down=None,
                  market_type='arbitrage',
-                 solver='glpk'):
+                 solver='glpk', backend='pyomo', mutable_params=False):
 
         # TODO: deprecate Perf_score and mileage_ratio
 
-        self._model = ConcreteModel()
+        super(ValuationOptimizer, self).__init__(solver=solver)
         self._market_type = market_type
-        self._solver = solver
+        self.backend = backend
+        self._mutable_params = mutable_params
 
         self._expressions_block = None
 
@@ -222,6 +232,27 @@ class ValuationOptimizer(optimizer.Optimizer):
     def solver(self, value):
         self._solver = value
 
+    @property
+    def backend(self):
+        """The formulation backend, either 'pyomo' for Pyomo expressions or 'matrix' for sparse matrices solved with SciPy, defaults to 'pyomo'."""
+        return self._backend
+
+    @backend.setter
+    def backend(self, value):
+        if value in {'pyomo', 'matrix'}:
+            self._backend = value
+        else:
+            raise ValueError("backend must be either 'pyomo' or 'matrix'.")
+
+    @property
+    def mutable_params(self):
+        """True if the MUTABLE_PARAMS are built as mutable Pyomo Params so that the model can be re-solved for new values without being rebuilt, defaults to False."""
+        return self._mutable_params
+
+    @mutable_params.setter
+    def mutable_params(self, value):
+        self._mutable_params = value
+
     @property
     def expressions_block(self):
         """ExpressionsBlock object for setting model objectives and constraints."""
@@ -538,6 +569,9 @@ class ValuationOptimizer(optimizer.Optimizer):
         self._set_model_param()
         self._set_model_var()
 
+        if self.mutable_params:
+            self._set_mutable_params()
+
         self.expressions_block = ExpressionsBlock(self.market_type)
 
         try:
@@ -552,137 +586,172 @@ class ValuationOptimizer(optimizer.Optimizer):
         #     # Detect constant objective function value.
         #     raise(IncompatibleDataException('The objective function was ill-formed, resulting in a constant objective function.'))
 
+    def run(self):
+        """Instantiates, creates, and solves the optimizer model using the specified backend."""
+        if self.backend == 'pyomo':
+            return super(ValuationOptimizer, self).run()
+
+        self._start_run_stats()
+
+        with self._time_phase('instantiate_model'):
+            self.instantiate_model()
+
+        with self._time_phase('populate_model'):
+            self._set_model_param()
+            self._set_model_var()
+
+        return self._solve_matrix()
+
+    def resolve(self, **kwargs):
+        """Updates the model params in kwargs and re-solves the existing model without rebuilding it.
+
+        Only MUTABLE_PARAMS may be updated. With the Pyomo backend, the model must have been built with mutable_params set; the solver instance is reused and warm-started from the previous solution if it supports it.
+        """
+        m = self.model
+
+        if self.backend == 'pyomo' and not self.mutable_params:
+            raise(BadParameterException('The model must be built with mutable_params set in order to be re-solved.'))
+
+        self._start_run_stats()
+
+        with self._time_phase('update_params'):
+            for kw_key, kw_value in kwargs.items():
+                if kw_key not in self.MUTABLE_PARAMS:
+                    raise(BadParameterException('{param} cannot be updated without rebuilding the model.'.format(param=kw_key)))
+
+                if kw_key in self.FRACTION_PARAMS and kw_value > 1.0:
+                    kw_value = kw_value/100
+
+                logging.info('ValuationOptimizer: Updating {param} to {value}'.format(param=kw_key, value=kw_value))
+
+                if self.backend == 'matrix':
+                    setattr(m, kw_key, kw_value)
+                else:
+                    getattr(m, kw_key).set_value(kw_value)
+
+        if self.backend == 'matrix':
+            return self._solve_matrix()
+
+        self._solve_and_process(warmstart=True)
+
+        return self.get_results()
+
+    def _run_stats_labels(self):
+        """Returns a dictionary of labels identifying the run in run_stats."""
+        labels = super(ValuationOptimizer, self)._run_stats_labels()
+        labels.update({'market_type': self.market_type, 'backend': self.backend})
+
+        return labels
+
+    def _set_mutable_params(self):
+        """Replaces the MUTABLE_PARAMS on the Pyomo ConcreteModel with mutable Pyomo Params of the same value."""
+        m = self.model
+
+        for param in self.MUTABLE_PARAMS:
+            value = getattr(m, param)
+
+            if isinstance(value, Param):
+                continue
+
+            delattr(m, param)
+            setattr(m, param, Param(initialize=value, mutable=True))
+
+    def _solve_matrix(self):
+        """Solves the model using the sparse matrix formulation."""
+        formulation = MatrixFormulation(self.market_type)
+
+        try:
+            with self._time_phase('solve'):
+                solution = formulation.solve(self.model)
+        except IndexError:
+            # Array-like object(s) do(es) not match the length of the price_electricity array-like.
+            raise(IncompatibleDataException('At least one of the array-like parameter objects is not the expected length. (It should match the length of the price_electricity object.)'))
+        except AssertionError as e:
+            logging.error('Optimizer: An optimal solution could not be obtained. (Infeasible problem?)')
+            self.run_stats.update(formulation.stats)
+            self._write_run_stats()
+            raise(e)
+
+        self.run_stats.update(formulation.stats)
+
+        with self._time_phase('process_results'):
+            self._load_solution(solution)
+            self._process_results()
+
+        self._write_run_stats()
+
+        return self.get_results()
+
+    def _load_solution(self, solution):
+        """Assigns decision variable values from a dictionary of arrays to the Pyomo ConcreteModel."""
+        m = self.model
+
+        for n in m.soc_time:
+            m.s[n].value = float(solution['s'][n])
+
+        for var in ('q_r', 'q_d', 'q_ru', 'q_rd', 'q_reg'):
+            model_var = getattr(m, var)
+
+            for n in m.time:
+                model_var[n].value = float(solution[var][n])
 
     def _process_results(self):
         """Processes optimization results for further evaluation."""
         m = self.model
 
-        t = m.time
-        q_r = [m.q_r[n].value for n in m.time]
-        q_d = [m.q_d[n].value for n in m.time]
-        q_ru = [m.q_ru[n].value for n in m.time]
-        q_rd = [m.q_rd[n].value for n in m.time]
-        q_reg = [m.q_reg[n].value for n in m.time]
-        soc = [m.s[n].value for n in m.time]
-        price_electricity = [m.price_electricity[n] for n in m.time]
+        T = len(m.time)
 
-        run_results = {'time': t, 'q_r': q_r, 'q_d': q_d, 'q_ru': q_ru, 'q_rd': q_rd, 'q_reg': q_reg,
-                       'state of charge': soc, 'price of electricity': price_electricity}
+        def _series(name):
+            # Model param array-like as float64, positionally indexed; it must have a value for each timestep.
+            series = np.asarray(getattr(m, name), dtype=np.float64)
+
+            if series.shape != (T,):
+                logging.warning('ValuationOptimizer: The {param} array is not the same length as the price_electricity array.'.format(param=name))
+                raise(IncompatibleDataException('ValuationOptimizer: There was a mismatch in array sizes between {param} and price_electricity.'.format(param=name)))
+
+            return series
 
-        if self.market_type == 'pjm_pfp':
-            rev_arb = np.cumsum(np.array([m.price_electricity[t]*(m.q_d[t].value - m.q_r[t].value) for t in m.time]))
-            rev_reg = np.cumsum(np.array([m.q_reg[t].value*m.perf_score[t]*(m.mi_mult[t]*m.price_reg_service[t] + m.price_regulation[t]) for t in m.time]))
+        def _values(var):
+            # Decision variable values as float64 in index order, extracted in bulk; unassigned values become NaN.
+            return np.array(list(var.extract_values().values()), dtype=np.float64)[:T]
+
+        q_r = _values(m.q_r)
+        q_d = _values(m.q_d)
+        q_ru = _values(m.q_ru)
+        q_rd = _values(m.q_rd)
+        q_reg = _values(m.q_reg)
+        soc = _values(m.s)
+        price_electricity = _series('price_electricity')
+
+        run_results = {'time': np.arange(T), 'q_r': q_r, 'q_d': q_d, 'q_ru': q_ru, 'q_rd': q_rd, 'q_reg': q_reg,
+                       'state of charge': soc, 'price of electricity': price_electricity}
 
-            revenue = rev_arb + rev_reg
+        rev_arb = np.cumsum(price_electricity*(q_d - q_r))
 
-            run_results['rev_arb'] = rev_arb
-            run_results['rev_reg'] = rev_reg
-            run_results['revenue'] = revenue
+        if self.market_type in {'pjm_pfp', 'isone_pfp'}:
+            rev_reg = np.cumsum(q_reg*_series('perf_score')*(_series('mi_mult')*_series('price_reg_service') + _series('price_regulation')))
         elif self.market_type == 'miso_pfp':
-            rev_arb = np.cumsum(np.array([m.price_electricity[t]*(m.q_d[t].value - m.q_r[t].value) for t in m.time]))
-            rev_reg = np.cumsum(np.array([(1 + m.Make_whole)*m.perf_score[t]*m.price_regulation[t]*m.q_reg[t].value for t in m.time]))
-
-            revenue = rev_arb + rev_reg
-
-            run_results['rev_arb'] = rev_arb
-            run_results['rev_reg'] = rev_reg
-            run_results['revenue'] = revenue
-        #//////////////////////////////////////////////////#
-        elif self.market_type == 'isone_pfp':
-            rev_arb = np.cumsum(np.array([m.price_electricity[t]*(m.q_d[t].value - m.q_r[t].value) for t in m.time]))
-            rev_reg = np.cumsum(np.array([(m.mi_mult[t] * m.price_reg_service[t] + m.price_regulation[t]) * m.perf_score[t]*m.q_reg[t].value for t in m.time]))
-
-            revenue = rev_arb + rev_reg
-
-            run_results['rev_arb'] = rev_arb
-            run_results['rev_reg'] = rev_reg
-            run_results['revenue'] = revenue
-        #//////////////////////////////////////////////////#
-        #######################################################################################################################
+            rev_reg = np.cumsum((1 + m.Make_whole)*_series('perf_score')*_series('price_regulation')*q_reg)
         elif self.market_type == 'nyiso_pfp':
-            rev_arb = np.cumsum(np.array([m.price_electricity[t]*(m.q_d[t].value - m.q_r[t].value) for t in m.time]))
-            rev_reg = np.cumsum(np.array([m.q_reg[t].value* m.price_regulation[t] * (1 - 1.1*(1 - m.perf_score[t]))
-                                          + m.price_electricity[t]*(m.q_reg[t].value * m.fraction_reg_up[t]
-                                          - m.q_reg[t].value * m.fraction_reg_down[t])
-                                          for t in m.time]))
-
-            revenue = rev_arb + rev_reg
-
-            run_results['rev_arb'] = rev_arb
-            run_results['rev_reg'] = rev_reg
-            run_results['revenue'] = revenue
-        #######################################################################################################################
-        #######################################################################################################################
-        elif self.market_type == 'spp_pfp':
-            # TODO: copied from 'ercot_arbreg' -make sure is correct for this market
-            # rev_arb = np.cumsum(np.array([m.price_electricity[t]*(m.q_d[t].value - m.q_r[t].value
-            #                                                       + m.q_ru[t].value*m.fraction_reg_up[t]
-            #                                                       - m.q_rd[t].value*m.fraction_reg_down[t])
-            #                               for t in m.time]))
-            # rev_reg = np.cumsum(np.array([m.ru[t]*m.q_ru[t].value + m.rd[t]*m.q_rd[t].value for t in m.time]))
-            rev_arb = np.cumsum(np.array([m.price_electricity[t]*(m.q_d[t].value - m.q_r[t].value) for t in m.time]))
-            rev_reg = np.cumsum(np.array([m.price_reg_up[t] * m.q_ru[t].value + m.price_reg_down[t] * m.q_rd[t].value
-                                          + m.price_electricity[t]*(m.q_ru[t].value * m.fraction_reg_up[t]
-                                          - m.q_rd[t].value * m.fraction_reg_down[t])
-                                          for t in m.time]))
-
-            revenue = rev_arb + rev_reg
-
-            run_results['rev_arb'] = rev_arb
-            run_results['rev_reg'] = rev_reg
-            run_results['revenue'] = revenue
-        #######################################################################################################################
+            rev_reg = np.cumsum(q_reg*_series('price_regulation')*(1 - 1.1*(1 - _series('perf_score')))
+                                + price_electricity*(q_reg*_series('fraction_reg_up') - q_reg*_series('fraction_reg_down')))
+        elif self.market_type in {'spp_pfp', 'ercot_arbreg'}:
+            # TODO: copied from 'ercot_arbreg' -make sure is correct for SPP
+            rev_reg = np.cumsum(_series('price_reg_up')*q_ru + _series('price_reg_down')*q_rd
+                                + price_electricity*(q_ru*_series('fraction_reg_up') - q_rd*_series('fraction_reg_down')))
         elif self.market_type == 'caiso_pfp':
-            # rev_arb = np.cumsum(np.array([m.price_electricity[t]*(m.q_d[t].value - m.q_r[t].value
-            #                                                       + m.q_ru[t].value*m.fraction_reg_up[t]
-            #                                                       - m.q_rd[t].value*m.fraction_reg_down[t])
-            #                               for t in m.time]))
-            # rev_reg = np.cumsum(np.array([m.price_reg_up[t] * m.q_ru[t].value + m.price_reg_down[t] * m.q_rd[t].value
-            #                               + m.perf_score_ru[t] * m.mi_mult_ru[t] * m.price_reg_serv_up[t]
-            #                               + m.perf_score_rd[t] * m.mi_mult_rd[t] * m.price_reg_serv_down[t]
-            #                               for t in m.time]))
-            rev_arb = np.cumsum(np.array([m.price_electricity[t]*(m.q_d[t].value - m.q_r[t].value) for t in m.time]))
-            rev_reg = np.cumsum(np.array([m.price_reg_up[t] * m.q_ru[t].value + m.price_reg_down[t] * m.q_rd[t].value
-                                          + m.perf_score_ru[t] * m.mi_mult_ru[t] * m.price_reg_serv_up[t]
-                                          + m.perf_score_rd[t] * m.mi_mult_rd[t] * m.price_reg_serv_down[t]
-                                          + m.price_electricity[t]*(m.q_ru[t].value * m.fraction_reg_up[t]
-                                          - m.q_rd[t].value * m.fraction_reg_down[t])
-                                          for t in m.time]))
-
-            revenue = rev_arb + rev_reg
-
-            run_results['rev_arb'] = rev_arb
-            run_results['rev_reg'] = rev_reg
-            run_results['revenue'] = revenue
-        #######################################################################################################################
-        elif self.market_type == 'ercot_arbreg':
-            # rev_arb = np.cumsum(np.array([m.price_electricity[t]*(m.q_d[t].value - m.q_r[t].value
-            #                                                       + m.q_ru[t].value*m.fraction_reg_up[t]
-            #                                                       - m.q_rd[t].value*m.fraction_reg_down[t])
-            #                               for t in m.time]))
-            # # rev_reg = np.cumsum(np.array([m.ru[t] * m.q_ru[t].value + m.rd[t] * m.q_rd[t].value for t in m.time]))
-            # rev_reg = np.cumsum(np.array([m.price_reg_up[t] * m.q_ru[t].value + m.price_reg_down[t] * m.q_rd[t].value for t in m.time]))
-            rev_arb = np.cumsum(np.array([m.price_electricity[t]*(m.q_d[t].value - m.q_r[t].value) for t in m.time]))
-            rev_reg = np.cumsum(np.array([m.price_reg_up[t] * m.q_ru[t].value + m.price_reg_down[t] * m.q_rd[t].value
-                                          + m.price_electricity[t]*(m.q_ru[t].value * m.fraction_reg_up[t]
-                                          - m.q_rd[t].value * m.fraction_reg_down[t])
-                                          for t in m.time]))
-
-            revenue = rev_arb + rev_reg
-
-            run_results['rev_arb'] = rev_arb
-            run_results['rev_reg'] = rev_reg
-            run_results['revenue'] = revenue
+            rev_reg = np.cumsum(_series('price_reg_up')*q_ru + _series('price_reg_down')*q_rd
+                                + _series('perf_score_ru')*_series('mi_mult_ru')*_series('price_reg_serv_up')
+                                + _series('perf_score_rd')*_series('mi_mult_rd')*_series('price_reg_serv_down')
+                                + price_electricity*(q_ru*_series('fraction_reg_up') - q_rd*_series('fraction_reg_down')))
         else:
-            rev_arb = np.cumsum(np.array([m.price_electricity[t] * (m.q_d[t].value - m.q_r[t].value)
-                                          for t in m.time]))
-            rev_reg = np.cumsum(np.array([0 for t in m.time]))
+            rev_reg = np.zeros(T)
 
-            revenue = rev_arb + rev_reg
+        revenue = rev_arb + rev_reg
 
-            run_results['rev_arb'] = rev_arb
-            run_results['rev_reg'] = rev_reg
-            run_results['revenue'] = revenue
+        run_results['rev_arb'] = rev_arb
+        run_results['rev_reg'] = rev_reg
+        run_results['revenue'] = revenue
 
         try:
             self.gross_revenue = revenue[-1]
@@ -0,0 +1,13 @@
+"""The main module of the worker processes that solve models in parallel.
+
+Worker processes started with the spawn method re-import the main module of the parent process before running any jobs. The GUI's main module imports Kivy and builds the app on import, so it points worker processes at this module instead, which imports nothing from the GUI.
+"""
+from __future__ import absolute_import
+
+import importlib.util
+import sys
+
+
+def use_for_workers():
+    """Makes worker processes spawned from now on import this module as their main module instead of the main module of the current process."""
+    sys.modules['__main__'].__spec__ = importlib.util.find_spec(__name__)
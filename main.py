@@ -36,6 +36,7 @@ Config.set('input', 'mouse', 'mouse,multitouch_on_demand')  # disables red dot c
 
 from functools import partial
 import os
+import multiprocessing
 import webbrowser
 import threading
 
@@ -53,6 +54,7 @@ from kivy.properties import ObjectProperty
 from kivy.core.text import LabelBase
 
 from es_gui.apps.data_manager.data_manager import DataManager
+from es_gui.tools.optimizer import Optimizer
 from es_gui.resources.widgets.common import MyPopup, WarningPopup, APP_NAME, APP_TAGLINE
 
 dirname = os.path.dirname(__file__)
@@ -439,10 +441,11 @@ class QuEStApp(App):
 
     def build_config(self, config):
         """Set default settings here."""
-        config.setdefaults('optimization', {'solver': 'glpk'})
+        config.setdefaults('optimization', {'solver': 'glpk', 'n_workers': 0, 'stats_log': ''})
         config.setdefaults('connectivity', {'use_proxy': 0, 'http_proxy': '', 'https_proxy': '', 'use_ssl_verify': 1})
-        config.setdefaults('valuation', {'valuation_dms_save': 1, 'valuation_dms_size': 20000})
-        config.setdefaults('btm', {'btm_dms_save': 1, 'btm_dms_size': 20000})
+        config.setdefaults('valuation', {'valuation_dms_save': 1, 'valuation_dms_size': 20000, 'valuation_dms_mmap': 0, 'valuation_dms_stats': '',
+                                          'valuation_cache_enabled': 1, 'valuation_cache_size': 100000, 'valuation_cache_clear': ''})
+        config.setdefaults('btm', {'btm_dms_save': 1, 'btm_dms_size': 20000, 'btm_dms_mmap': 0, 'btm_dms_stats': ''})
         config.setdefaults('datamanager-pjm', {'pjm_subscription_key': ''})
         config.setdefaults('datamanager-isone', {'iso-ne_api_username': ''})
         config.setdefaults('datamanager-openei', {'openei_key': ''})
@@ -459,6 +462,9 @@ class QuEStApp(App):
         # Instantiate DataManager.
         self.data_manager = DataManager()
 
+        # Record optimization performance statistics if a log file is specified.
+        Optimizer.stats_log = self.config.get('optimization', 'stats_log') or None
+
         # Create BoxLayout container.
         bx = BoxLayout(orientation='vertical')
 
@@ -496,12 +502,23 @@ class QuEStApp(App):
 
     def on_start(self):
         pass
+
+    def on_config_change(self, config, section, key, value):
+        if section == 'optimization' and key == 'stats_log':
+            Optimizer.stats_log = value or None
     
     def on_stop(self):
         # Signal that the app is about to close
         self.root.stop.set()
 
 if __name__ == '__main__':
+    # Required for worker processes in frozen Windows executables.
+    multiprocessing.freeze_support()
+
+    # Spawned worker processes would otherwise import this module, and with it Kivy and the GUI.
+    from es_gui.tools.worker_main import use_for_workers
+    use_for_workers()
+
     from kivy.core.window import Window
 
     # Sets window background color
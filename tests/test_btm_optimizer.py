@@ -0,0 +1,24 @@
+import calendar
+
+import numpy as np
+import pytest
+
+from es_gui.tools.btm.btm_optimizer import BtmOptimizer
+
+
+@pytest.mark.parametrize('month', range(1, 13))
+def test_model_size(month):
+    """Each month has one row per timestep for each of the state of charge, peak demand, TOU demand, and net metering constraints plus the final state of charge constraint."""
+    _, ndays = calendar.monthrange(2019, month)
+    nhr = 24*ndays
+
+    op = BtmOptimizer(tou_energy_schedule=[0]*nhr, tou_energy_rate=[0.1],
+                      tou_demand_schedule=np.tile([0]*12 + [1]*6 + [2]*6, ndays), tou_demand_rate=[0, 5, 10],
+                      flat_demand_rate=3, nem_type=2,
+                      load_profile=100 + 30*np.sin(2*np.pi*np.arange(nhr)/24), pv_profile=np.zeros(nhr))
+    op.instantiate_model()
+    op.populate_model()
+
+    # One var per timestep for each of the state of charge, charge, discharge, and net power, plus the flat and TOU peak demands.
+    assert op.model.nvariables() == 4*nhr + 1 + 3
+    assert op.model.nconstraints() == 4*nhr + 1
@@ -0,0 +1,43 @@
+import threading
+import time
+
+import numpy as np
+
+from es_gui.tools.dms import DataManagementSystem
+
+
+def _dms(tmp_path, **kwargs):
+    return DataManagementSystem(save_name=str(tmp_path / 'test_dms.p'), **kwargs)
+
+
+def test_get_or_load_loads_once_for_concurrent_callers(tmp_path):
+    """Concurrent callers share one load, even of a value too large to be kept."""
+    dms = _dms(tmp_path, max_memory=100)
+    loads = []
+
+    def loader():
+        loads.append(1)
+        time.sleep(0.2)
+
+        return [np.arange(100.0)]
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(dms.get_or_load(['month'], loader)[0])) for _ in range(4)]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    assert len(loads) == 1
+    assert len(results) == 4
+
+    # Only the caller that loaded the value counts a miss.
+    assert dms.stats()['misses'] == 1
+    assert dms.stats()['hits'] == 3
+    assert all(np.array_equal(result, np.arange(100.0)) for result in results)
+
+    # The value exceeds max_memory and is not kept.
+    assert 'month' not in dms.data
+    assert dms.memory_used == 0
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+from pyomo.environ import SolverFactory
+
+from es_gui.tools.valuation.matrix import MatrixFormulation
+from es_gui.tools.valuation.valuation_optimizer import ValuationOptimizer
+
+
+# LP solvers to compare the Pyomo formulation against, in order of preference.
+SOLVERS = ('glpk', 'cbc', 'appsi_highs')
+
+
+def _available_solver():
+    for name in SOLVERS:
+        try:
+            if SolverFactory(name).available(exception_flag=False):
+                return name
+        except Exception:
+            continue
+
+    return None
+
+
+@pytest.fixture(scope='module')
+def solver():
+    name = _available_solver()
+
+    if name is None:
+        pytest.skip('No LP solver is available for the Pyomo formulation.')
+
+    return name
+
+
+@pytest.fixture(scope='module')
+def prices():
+    """Synthetic price data for a week."""
+    hours = np.arange(24*7)
+
+    return {
+        'price_electricity': 30 + 15*np.sin(2*np.pi*hours/24),
+        'price_regulation': 10 + 2*np.cos(2*np.pi*hours/24),
+        'price_reg_service': np.full(len(hours), 1.5),
+        'price_reg_up': 8 + np.cos(2*np.pi*hours/12),
+        'price_reg_down': 6 + np.sin(2*np.pi*hours/12),
+        'price_reg_serv_up': np.full(len(hours), 0.5),
+        'price_reg_serv_down': np.full(len(hours), 0.4),
+        'mileage_mult': np.full(len(hours), 2.0),
+        'mileage_mult_ru': np.full(len(hours), 1.2),
+        'mileage_mult_rd': np.full(len(hours), 1.1),
+    }
+
+
+@pytest.mark.parametrize('market_type', sorted(MatrixFormulation.MARKET_VARS))
+def test_matrix_matches_pyomo(market_type, solver, prices):
+    gross_revenue = {}
+
+    for backend in ('pyomo', 'matrix'):
+        op = ValuationOptimizer(market_type=market_type, backend=backend, solver=solver, **prices)
+        results, gross_revenue[backend] = op.run()
+
+        assert len(results) == len(prices['price_electricity'])
+
+    assert np.isclose(gross_revenue['pyomo'], gross_revenue['matrix'], rtol=1e-6)
+
+
+def test_invalid_backend():
+    with pytest.raises(ValueError):
+        ValuationOptimizer(backend='sparse')